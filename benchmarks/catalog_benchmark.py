@@ -0,0 +1,118 @@
+"""
+Compares the memory and the barcode lookup rate of the compact catalog with the product and barcode dicts.
+
+The benchmarks import the modules package, so they are run as modules from the repository root, e.g.:
+
+    python -m benchmarks.catalog_benchmark --products 100000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from decimal import Decimal
+import numpy as np
+from modules.catalog_module import CatalogModule
+
+
+def make_catalog_rows(rng, product_count, barcodes_per_product, name_count):
+    """
+    Generate the raw product (product_id, name_index, price_cents) and barcode (value, product_id) rows.
+    They hold only integers, so the strings are allocated by each layout built from them, as by a database fetch.
+    """
+    name_indexes = rng.integers(0, name_count, size=product_count).tolist()
+    prices = rng.integers(1, 100000, size=product_count).tolist()
+    product_rows = list(zip(range(product_count), name_indexes, prices))
+
+    barcode_values = rng.choice(10 ** 12, size=product_count * barcodes_per_product, replace=False).tolist()
+    barcode_rows = [(value, index // barcodes_per_product) for index, value in enumerate(barcode_values)]
+    return product_rows, barcode_rows
+
+
+def make_catalog_dicts(product_rows, barcode_rows):
+    """
+    Build the product and barcode dictionaries in the layout loaded by the previous DatabaseModule,
+    with a new string per row like the rows fetched from the database.
+    """
+    products = {product_id: {'name': f"Product {name_index} {'x' * (name_index % 24)}",
+                             'price': Decimal(price).scaleb(-2)}
+                for product_id, name_index, price in product_rows}
+    barcodes = {f"{value:013d}": product_id for value, product_id in barcode_rows}
+    return products, barcodes
+
+
+def measure_memory(build):
+    """
+    Return the result of the build function with the memory it still holds, as traced by tracemalloc.
+    The intermediate objects the build drops are not counted.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def build_catalog(product_rows, barcode_rows, timings):
+    """
+    Build the catalog the way the DatabaseModule does, from the fetched dictionaries it then drops,
+    so every string the catalog keeps was allocated inside the traced build.
+    """
+    products, barcodes = make_catalog_dicts(product_rows, barcode_rows)
+    start = time.perf_counter()
+    catalog = CatalogModule.from_dicts(products, barcodes)
+    timings['build'] = time.perf_counter() - start
+    return catalog
+
+
+def measure_lookups(lookup, queries):
+    """
+    Return the number of barcode lookups per second.
+    """
+    start = time.perf_counter()
+    for barcode_data in queries:
+        lookup(barcode_data)
+
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compact catalog with the product and barcode dicts.")
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--barcodes-per-product", type=int, default=2)
+    parser.add_argument("--names", type=int, default=200000, help="The number of distinct product names.")
+    parser.add_argument("--queries", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    product_rows, barcode_rows = make_catalog_rows(rng, args.products, args.barcodes_per_product, args.names)
+    # Both layouts are built from the same raw rows in separate traces, so neither is charged for the other's strings
+    (products, barcodes), dicts_size = measure_memory(lambda: make_catalog_dicts(product_rows, barcode_rows))
+    timings = {}
+    catalog, catalog_size = measure_memory(lambda: build_catalog(product_rows, barcode_rows, timings))
+
+    barcode_list = list(barcodes)
+    queries = [barcode_list[index] for index in rng.integers(0, len(barcode_list), size=args.queries)]
+    # A tenth of the scans are barcodes from outside of the shop
+    queries[::10] = [f"{value:013d}" for value in rng.integers(10 ** 12, 10 ** 13, size=len(queries[::10]))]
+
+    def lookup_dicts(barcode_data):
+        product_id = barcodes.get(barcode_data)
+        return None if product_id is None else products.get(product_id)
+
+    dicts_lps = measure_lookups(lookup_dicts, queries)
+    catalog_lps = measure_lookups(catalog.lookup_barcode, queries)
+    view_lps = measure_lookups(lambda barcode_data: catalog.products.get(catalog.barcodes.get(barcode_data)), queries)
+
+    print(f"{args.products} products, {len(barcodes)} barcodes, {args.names} names")
+    print(f"{'layout':>16} {'memory [MB]':>12} {'lookups/s':>10}")
+    print(f"{'dicts':>16} {dicts_size / 2 ** 20:>12.1f} {dicts_lps:>10.0f}")
+    print(f"{'catalog':>16} {catalog_size / 2 ** 20:>12.1f} {catalog_lps:>10.0f}   (build {timings['build']:.1f} s)")
+    print(f"{'catalog views':>16} {'':>12} {view_lps:>10.0f}")
+    print(f"The catalog takes {catalog_size / dicts_size:.2f}x the memory at {catalog_lps / dicts_lps:.2f}x "
+          f"the lookup rate of the dicts")
+
+
+if __name__ == '__main__':
+    main()
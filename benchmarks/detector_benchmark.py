@@ -0,0 +1,111 @@
+"""
+Compares the latency and the agreement of the face detection backends on the same images.
+
+The benchmarks import the modules package, so they are run as modules from the repository root, e.g.:
+
+    python -m benchmarks.detector_benchmark recordings/faces --backends hog yunet
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from modules.face_detector_module import create_face_detector
+from modules.frame_source_module import open_frame_source
+
+
+def load_images(source, max_images, scale):
+    """
+    Load the images of a directory or the frames of a video file, downscaled by the scale.
+    """
+    frame_source = open_frame_source(source)
+    images = []
+    while len(images) < max_images:
+        image = frame_source.read()
+        if image is None:
+            break
+        if scale != 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        images.append(image)
+
+    frame_source.release()
+    return images
+
+
+def iou(first, second):
+    """
+    Return the intersection over union of two (top, right, bottom, left) face locations.
+    """
+    top, right = max(first[0], second[0]), min(first[1], second[1])
+    bottom, left = min(first[2], second[2]), max(first[3], second[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = ((first[1] - first[3]) * (first[2] - first[0]) + (second[1] - second[3]) * (second[2] - second[0])
+             - intersection)
+    return intersection / union if union > 0 else 0.0
+
+
+def agreement(reference_locations, locations, threshold=0.5):
+    """
+    Return the fraction of the reference faces matched by a face overlapping it at least by the threshold.
+    """
+    reference_count = sum(len(image_locations) for image_locations in reference_locations)
+    matched = sum(any(iou(reference, location) >= threshold for location in image_locations)
+                  for reference_image_locations, image_locations in zip(reference_locations, locations)
+                  for reference in reference_image_locations)
+    return matched / reference_count if reference_count else float('nan')
+
+
+def measure(detector, images, upsample, repeats):
+    """
+    Return the per image latencies [s] and the face locations found by the detector.
+    """
+    detector.detect(images[:1], upsample)  # Warm up, so the first measurement does not include the initialization
+    latencies = []
+    locations = []
+    for image in images:
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            image_locations = detector.detect([image], upsample)[0]
+            latencies.append(time.perf_counter() - start)
+        locations.append(image_locations)
+
+    return np.asarray(latencies), locations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the face detection backends on the same images.")
+    parser.add_argument("source", help="A directory of images or a video file.")
+    parser.add_argument("--backends", nargs="+", default=["hog", "cnn", "yunet"])
+    parser.add_argument("--yunet-model", default="models/face_detection_yunet_2023mar.onnx")
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--scale", type=float, default=1.0, help="The scale the images are detected at.")
+    parser.add_argument("--upsample", type=int, default=1, help="The upsampling of the dlib backends.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args.source, args.images, args.scale)
+    if not images:
+        print(f"No images found in {args.source}")
+        return
+
+    print(f"{len(images)} images of {images[0].shape[1]}x{images[0].shape[0]}, "
+          "agreement with the first backend at IoU >= 0.5")
+    print(f"{'backend':>8} {'p50 [ms]':>9} {'p90 [ms]':>9} {'FPS':>7} {'faces':>6} {'agreement':>10}")
+    reference_locations = None
+    for backend in args.backends:
+        try:
+            detector = create_face_detector(backend, args.yunet_model)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"{backend:>8} skipped: {e}")
+            continue
+
+        latencies, locations = measure(detector, images, args.upsample, args.repeats)
+        if reference_locations is None:
+            reference_locations = locations
+
+        print(f"{backend:>8} {np.percentile(latencies, 50) * 1000:>9.2f} {np.percentile(latencies, 90) * 1000:>9.2f} "
+              f"{1 / latencies.mean():>7.1f} {sum(len(image_locations) for image_locations in locations):>6} "
+              f"{agreement(reference_locations, locations):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
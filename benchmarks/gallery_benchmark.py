@@ -0,0 +1,70 @@
+"""
+Compares the approximate face gallery search with the exact search.
+
+The benchmarks import the modules package, so they are run as modules from the repository root, e.g.:
+
+    python -m benchmarks.gallery_benchmark
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from modules.gallery_module import GalleryModule
+
+
+def make_encodings(rng, count, dimension=128):
+    """
+    Generate synthetic encodings resembling the face encodings, with a few identities per cluster of similar people.
+    """
+    centres = rng.normal(0.0, 0.1, size=(max(1, count // 8), dimension)).astype(np.float32)
+    encodings = centres[rng.integers(0, len(centres), size=count)]
+    return encodings + rng.normal(0.0, 0.05, size=(count, dimension)).astype(np.float32)
+
+
+def measure(gallery, queries, exact):
+    """
+    Run the queries one frame worth (4 faces) at a time and return the results with the queries per second.
+    """
+    results = []
+    start = time.perf_counter()
+    for first in range(0, len(queries), 4):
+        results.extend(gallery.search(queries[first:first + 4], exact=exact))
+
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the approximate gallery search with the exact search.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--exact-search-limit", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'mode':>10} {'recall@1':>9} {'queries/s':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            encodings = make_encodings(rng, size)
+            gallery = GalleryModule(directory, exact_search_limit=args.exact_search_limit)
+            build_start = time.perf_counter()
+            for first in range(0, size, 10000):
+                gallery.add_batch([f"person_{index}" for index in range(first, min(size, first + 10000))],
+                                  encodings[first:first + 10000])
+            gallery.rebuild_index()
+            build_time = time.perf_counter() - build_start
+
+            picked = rng.integers(0, size, size=args.queries)
+            queries = encodings[picked] + rng.normal(0.0, 0.02, size=(args.queries, 128)).astype(np.float32)
+
+            exact_results, exact_qps = measure(gallery, queries, exact=True)
+            print(f"{size:>10} {'exact':>10} {1.0:>9.3f} {exact_qps:>10.0f}   (build {build_time:.1f} s)")
+            for n_probe in args.n_probe:
+                gallery.n_probe = n_probe
+                results, qps = measure(gallery, queries, exact=False)
+                recall = np.mean([result[0] == exact[0] for result, exact in zip(results, exact_results)])
+                print(f"{size:>10} {f'nprobe={n_probe}':>10} {recall:>9.3f} {qps:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Compares the latency and the word error rate of the command mode transcription with the general one.
+
+The benchmarks import the modules package, so they are run as modules from the repository root, e.g.:
+
+    python -m benchmarks.stt_benchmark --fixtures recordings/commands
+"""
+import argparse
+import glob
+import os
+import re
+import time
+import numpy as np
+import whisper
+from modules.control_module import COMMAND_PHRASES
+from modules.transcription_module import TranscriptionModule
+
+
+def normalize_words(text):
+    """
+    Split the text into lowercase words, ignoring the punctuation.
+    """
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_errors(reference, hypothesis):
+    """
+    Return the word level edit distance between the reference and the hypothesis.
+    """
+    distances = list(range(len(hypothesis) + 1))
+    for reference_index, reference_word in enumerate(reference, start=1):
+        previous_diagonal, distances[0] = distances[0], reference_index
+        for hypothesis_index, hypothesis_word in enumerate(hypothesis, start=1):
+            previous_diagonal, distances[hypothesis_index] = distances[hypothesis_index], min(
+                distances[hypothesis_index] + 1,
+                distances[hypothesis_index - 1] + 1,
+                previous_diagonal + (reference_word != hypothesis_word))
+
+    return distances[-1]
+
+
+def load_fixtures(fixtures_dir):
+    """
+    Load the (name, audio, reference words) of every WAV file having a TXT transcript next to it.
+    """
+    fixtures = []
+    for wav_path in sorted(glob.glob(os.path.join(fixtures_dir, "*.wav"))):
+        txt_path = os.path.splitext(wav_path)[0] + ".txt"
+        if not os.path.exists(txt_path):
+            print(f"Skipping {wav_path}, no transcript")
+            continue
+
+        with open(txt_path, encoding="utf-8") as f:
+            fixtures.append((os.path.basename(wav_path), whisper.load_audio(wav_path), normalize_words(f.read())))
+
+    return fixtures
+
+
+def measure(transcribe, fixtures, repeats):
+    """
+    Return the median latency [s] and the word error rate of the transcription function over the fixtures.
+    """
+    latencies = []
+    errors = 0
+    reference_words = 0
+    for _, audio, reference in fixtures:
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            text = transcribe(audio)
+            latencies.append(time.perf_counter() - start)
+
+        errors += word_errors(reference, normalize_words(text))
+        reference_words += len(reference)
+
+    return float(np.median(latencies)), errors / max(1, reference_words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the command mode transcription with the general one.")
+    parser.add_argument("--fixtures", default=os.path.join("benchmarks", "stt_fixtures"),
+                        help="The directory of the recorded WAV commands, each with a TXT transcript.")
+    parser.add_argument("--model", default="base.en")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No fixtures found in {args.fixtures}, record some commands as name.wav with name.txt transcripts")
+        return
+
+    model = whisper.load_model(args.model)
+    transcription = TranscriptionModule(model, command_prompt=TranscriptionModule.build_command_prompt(COMMAND_PHRASES))
+    # Warm up, so the first measurement does not include the lazy initialization
+    transcription.transcribe_command(fixtures[0][1])
+
+    print(f"{len(fixtures)} fixtures, model {args.model}")
+    print(f"{'mode':>10} {'median [s]':>11} {'WER':>7}")
+    for mode, transcribe in [("general", transcription.transcribe_general),
+                             ("command", transcription.transcribe_command)]:
+        latency, word_error_rate = measure(transcribe, fixtures, args.repeats)
+        print(f"{mode:>10} {latency:>11.3f} {word_error_rate:>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
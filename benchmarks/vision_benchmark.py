@@ -0,0 +1,222 @@
+"""
+Replays recorded frames through the vision pipeline stages and compares them with a stored baseline.
+
+The benchmarks import the modules package, so they are run as modules from the repository root, e.g.:
+
+    python -m benchmarks.vision_benchmark recordings/shop.mp4 --save-baseline baseline.json
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+from modules.catalog_module import CatalogModule
+from modules.frame_source_module import open_frame_source
+from modules.gui_module import GUIModule
+from modules.recognition_module import RecognitionModule
+
+
+STAGES = ["detect_faces", "detect_products", "render_gui"]
+# Increased when the measurement changes, the baselines of the earlier formats were timed under tracemalloc
+RESULTS_FORMAT = 2
+
+
+def read_frames(source, max_frames):
+    """
+    Yield the frames of a video file, or the images of a directory in the name order.
+    """
+    frame_source = open_frame_source(source)
+    for _ in range(max_frames):
+        image = frame_source.read()
+        if image is None:
+            break
+        yield image
+    frame_source.release()
+
+
+def make_catalog(product_count, barcodes):
+    """
+    Build a stand-in catalog of synthetic products, also containing the given barcodes.
+    """
+    products = {product_id: {'name': f"Product {product_id}", 'price': f"{product_id % 100}.99"}
+                for product_id in range(product_count)}
+    catalog_barcodes = {f"{5900000000000 + product_id:013d}": product_id for product_id in range(product_count)}
+    for index, barcode_data in enumerate(barcodes):
+        catalog_barcodes[barcode_data] = index % max(1, product_count)
+
+    return CatalogModule.from_dicts(products, catalog_barcodes, version=1)
+
+
+def run_stages(args, catalog, latencies=None):
+    """
+    Run the frames through the stages with fresh modules, recording the latencies of the frames after the warmup
+    if given. Return the number of the measured frames.
+    """
+    recognition_module = RecognitionModule(model=args.model, tracking=args.tracking,
+                                           detection_interval=args.detection_interval,
+                                           detection_scale=args.detection_scale,
+                                           barcode_scan_interval=args.barcode_scan_interval,
+                                           barcode_scan_scale=args.barcode_scan_scale)
+    if args.known_faces:
+        recognition_module.load_known_faces(args.known_faces)
+    recognition_module.set_product_data_source(catalog)
+
+    gui = GUIModule(0, 0, capture_device=None)
+    gui.show_shopping_list = True
+    cart = [catalog.products[product_id] for product_id in range(min(args.cart_size, args.catalog_size))]
+    total_cost = sum(product['price'] for product in cart)
+
+    frame_count = 0
+    for frame_index, image in enumerate(read_frames(args.source, args.frames + args.warmup)):
+        stage_times = [time.perf_counter()]
+        detected_faces = recognition_module.detect_faces(image)
+        stage_times.append(time.perf_counter())
+        detected_products = recognition_module.detect_products(image)
+        stage_times.append(time.perf_counter())
+        gui.display_detected_objects(image, detected_faces, detected_products)
+        gui.render_gui(image, cart, total_cost, cart_version=0, display=False)
+        stage_times.append(time.perf_counter())
+
+        if frame_index >= args.warmup:
+            frame_count += 1
+            if latencies is not None:
+                for stage, start, end in zip(STAGES, stage_times, stage_times[1:]):
+                    latencies[stage].append(end - start)
+
+    return frame_count
+
+
+def max_rss_mb():
+    """
+    Return the peak resident memory [MB] of the process, including the native allocations of dlib, zbar and OpenCV
+    which tracemalloc does not see, or None where the resource module is not available (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+
+
+def summarize(latencies):
+    """
+    Return the latency percentiles [ms] and the frames per second of a stage.
+    """
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+        'fps': float(1000 / latencies.mean()) if latencies.mean() > 0 else float('inf'),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the changes against the baseline and return the metrics worse than the tolerance allows.
+    """
+    regressions = []
+    print(f"\n{'stage':>16} {'metric':>7} {'baseline':>9} {'current':>9} {'change':>8}")
+    for stage, stage_results in results['stages'].items():
+        for metric in ['p50_ms', 'p90_ms']:
+            if stage not in baseline['stages']:
+                continue
+
+            previous, current = baseline['stages'][stage][metric], stage_results[metric]
+            change = (current - previous) / previous if previous > 0 else 0.0
+            flag = "  REGRESSION" if change > tolerance else ""
+            print(f"{stage:>16} {metric:>7} {previous:>9.2f} {current:>9.2f} {change:>+7.1%}{flag}")
+            if flag:
+                regressions.append(f"{stage} {metric}")
+
+    for metric, label in [('peak_traced_memory_mb', 'peak memory'), ('max_rss_mb', 'max RSS')]:
+        previous, current = baseline.get(metric), results[metric]
+        if previous is None or current is None:
+            continue
+
+        change = (current - previous) / previous if previous > 0 else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{label:>16} {'MB':>7} {previous:>9.2f} {current:>9.2f} {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(label)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the vision pipeline stages.")
+    parser.add_argument("source", help="A video file or a directory of images.")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=5, help="The number of the first frames not measured.")
+    parser.add_argument("--known-faces", default=None, help="The directory of the known faces images.")
+    parser.add_argument("--model", default="hog", choices=["hog", "cnn"])
+    parser.add_argument("--tracking", action="store_true")
+    parser.add_argument("--detection-interval", type=int, default=10)
+    parser.add_argument("--detection-scale", type=float, default=0.5)
+    parser.add_argument("--barcode-scan-interval", type=int, default=1)
+    parser.add_argument("--barcode-scan-scale", type=float, default=1.0)
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--barcodes", nargs="*", default=[], help="The barcodes present in the recording.")
+    parser.add_argument("--cart-size", type=int, default=10)
+    parser.add_argument("--baseline", default=None, help="The JSON results to compare against.")
+    parser.add_argument("--save-baseline", default=None, help="Where to store the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="The allowed relative slowdown.")
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.catalog_size, args.barcodes)
+    # The stages are timed without tracing, as tracemalloc slows down every allocation of the traced pass
+    latencies = {stage: [] for stage in STAGES}
+    frame_count = run_stages(args, catalog, latencies)
+    if frame_count == 0:
+        print(f"No frames were measured from {args.source}")
+        sys.exit(1)
+
+    # The memory is measured in a separate pass over the same frames
+    tracemalloc.start()
+    run_stages(args, catalog)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'frames': frame_count,
+        'config': {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')},
+        'stages': {stage: summarize(stage_latencies) for stage, stage_latencies in latencies.items()},
+        'peak_traced_memory_mb': peak_memory / 2 ** 20,
+        'max_rss_mb': max_rss_mb(),
+    }
+    results['stages']['total'] = summarize(np.sum([latencies[stage] for stage in STAGES], axis=0))
+
+    print(f"{frame_count} frames from {args.source}, peak traced memory {results['peak_traced_memory_mb']:.1f} MB, "
+          f"max RSS {results['max_rss_mb'] or float('nan'):.1f} MB")
+    print(f"{'stage':>16} {'p50 [ms]':>9} {'p90 [ms]':>9} {'p99 [ms]':>9} {'FPS':>8}")
+    for stage, stage_results in results['stages'].items():
+        print(f"{stage:>16} {stage_results['p50_ms']:>9.2f} {stage_results['p90_ms']:>9.2f} "
+              f"{stage_results['p99_ms']:>9.2f} {stage_results['fps']:>8.1f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        if baseline.get('format') != RESULTS_FORMAT:
+            print("The baseline was recorded by an earlier version of the benchmark, record it again")
+        if baseline.get('config') != results['config']:
+            print("The baseline was recorded with a different configuration")
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
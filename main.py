@@ -1,58 +1,223 @@
-from modules.control_module import ControlModule
+from modules.command_worker_module import CommandWorkerModule
+from modules.control_module import COMMAND_PHRASES, ControlModule
+from modules.database_backend_module import OdbcBackend, SqliteBackend
 from modules.database_module import DatabaseModule
+from modules.gallery_module import GalleryModule
+from modules.governor_module import GovernorModule
 from modules.gui_module import GUIModule
-from modules.llm_module import LlmModule
+from modules.intent_module import IntentModule
+from modules.metrics_module import MetricsModule
+from modules.pipeline_module import PipelineModule
 from modules.shopping_module import ShoppingModule
 from modules.settings_module import SettingsModule
 from modules.recognition_module import RecognitionModule
-from modules.voice_interface_module import VoiceInterfaceModule
-
-# Prepare command mapping
-command_mapping = {
-    "quit_application": lambda: None,
-    "refresh_data": lambda: voice_interface.say_and_execute("Refreshing data...", database.refresh_data),
-    "add_product": lambda: voice_interface.say_and_execute("Adding products to the cart...", shopping_cart.add_products_to_cart, detected_products),
-    "clear_cart": lambda: voice_interface.say_and_execute("Clearing the cart...", shopping_cart.clear_cart),
-    "toggle_shopping_list": lambda: voice_interface.say_and_execute("Toggling the shopping list...", gui.toggle_shopping_list_visibility),
-    "finalize_transaction": lambda: voice_interface.say_and_execute(f"{shopping_cart.products_total_cost:.2f} [PLN]", shopping_cart.finalize_transaction),
-    "voice_interface": lambda: voice_interface.hear(),
-}
-
-# Initialize components
-SETTINGS = SettingsModule("config.ini")
-controller = ControlModule(command_mapping)
-database = DatabaseModule("localhost", "robotic_shop_assistant", SETTINGS.db_username, SETTINGS.db_password)
-gui = GUIModule(SETTINGS.camera_width, SETTINGS.camera_height)
-llm = LlmModule(llm_path=SETTINGS.llm_path, available_functions=command_mapping, layers_on_gpu=SETTINGS.layers_on_gpu)
-recognition_module = RecognitionModule(tolerance=0.575)
-shopping_cart = ShoppingModule()
-voice_interface = VoiceInterfaceModule(SETTINGS.tts_model_name, SETTINGS.stt_model_name)
-
-# Prepare data
-database.refresh_data()
-recognition_module.load_known_faces("known_faces")  # Add force_rebuild=True if the faces repository has changed
-recognition_module.set_product_data_source(database)
-
-# Start operating
-voice_interface.say("Turning on...")
-terminate_loop = False
-while not terminate_loop:
-    image, key_pressed = gui.get_image_frame()
-    detected_people = recognition_module.detect_faces(image)
-    detected_products = recognition_module.detect_products(image)
-    gui.display_detected_objects(image, detected_people, detected_products)
-    gui.render_gui(image, shopping_cart.cart, shopping_cart.products_total_cost)
-
-    # Handle keyboard interface
-    if key_pressed != 255:
-        terminate_loop = controller.handle_keyboard_input(key_pressed)
-
-    # Handle voice interface
-    if not voice_interface.stt_queue.empty():
-        stt_result = voice_interface.stt_queue.get_nowait()
-        print(stt_result)
-        llm_processed_result = llm.obtain_command_from_stt(stt_result)
-        print(llm_processed_result)
-        terminate_loop = controller.handle_stt_input(llm_processed_result)
-
-voice_interface.say("Turning off...")
+from modules.startup_module import StartupModule
+
+
+def main():
+    # Fixed announcements, synthesized in advance
+    announcements = {
+        "turning_on": "Turning on...",
+        "turning_off": "Turning off...",
+        "refresh_data": "Refreshing data...",
+        "add_product": "Adding products to the cart...",
+        "clear_cart": "Clearing the cart...",
+        "toggle_shopping_list": "Toggling the shopping list...",
+    }
+
+    # The voice interface is loaded in the background, until then the commands are executed silently
+    def say_and_execute(sentence, function, *args, **kwargs):
+        if startup.is_ready("voice_interface"):
+            startup.get("voice_interface").say_and_execute(sentence, function, *args, **kwargs)
+        else:
+            function(*args, **kwargs)
+
+    def hear():
+        if startup.is_ready("voice_interface"):
+            startup.get("voice_interface").hear()
+        else:
+            print("The voice interface is still loading...")
+
+    # Prepare command mapping
+    command_mapping = {
+        "quit_application": lambda: None,
+        "refresh_data": lambda: say_and_execute(announcements["refresh_data"], database.refresh_data),
+        "add_product": lambda: say_and_execute(announcements["add_product"], shopping_cart.add_products_to_cart, detected_products),
+        "clear_cart": lambda: say_and_execute(announcements["clear_cart"], shopping_cart.clear_cart),
+        "toggle_shopping_list": lambda: say_and_execute(announcements["toggle_shopping_list"], gui.toggle_shopping_list_visibility),
+        "finalize_transaction": lambda: say_and_execute(f"{shopping_cart.products_total_cost:.2f} [PLN]", shopping_cart.finalize_transaction),
+        "voice_interface": lambda: hear(),
+        "toggle_metrics": lambda: gui.toggle_metrics_visibility(),
+    }
+
+    # Initialize components, the camera view comes up first and the heavy models are loaded in the background
+    startup = StartupModule()
+    SETTINGS = SettingsModule("config.ini")
+    metrics = MetricsModule(port=SETTINGS.metrics_port, log_file=SETTINGS.metrics_log_file,
+                            log_interval=SETTINGS.metrics_log_interval)
+    controller = ControlModule(command_mapping)
+    if SETTINGS.db_backend == "sqlite":
+        database_backend = SqliteBackend(SETTINGS.db_sqlite_path)
+    else:
+        database_backend = OdbcBackend("localhost", "robotic_shop_assistant",
+                                       SETTINGS.db_username, SETTINGS.db_password)
+    database = DatabaseModule(database_backend, change_column=SETTINGS.db_change_column,
+                              snapshot_file=SETTINGS.db_snapshot_file)
+    gui = GUIModule(SETTINGS.camera_width, SETTINGS.camera_height, capture_device=SETTINGS.camera_sources,
+                    threaded_capture=SETTINGS.threaded_capture)
+    gui.show_metrics = SETTINGS.show_metrics
+    # Until the local LLM is loaded, the commands are mapped with the embeddings only
+    intent = IntentModule(COMMAND_PHRASES, threshold=SETTINGS.intent_threshold,
+                          fallback_threshold=SETTINGS.intent_fallback_threshold)
+    command_worker = CommandWorkerModule(metrics.timed("obtain_command_from_stt", intent.obtain_command_from_stt),
+                                         timeout=SETTINGS.command_timeout)
+    gallery = None
+    if SETTINGS.face_gallery_dir:
+        gallery = GalleryModule(SETTINGS.face_gallery_dir, n_probe=SETTINGS.face_gallery_n_probe)
+    recognition_module = RecognitionModule(model=SETTINGS.face_detector, tolerance=0.575,
+                                           yunet_model_path=SETTINGS.face_detector_model_path,
+                                           tracking=SETTINGS.face_tracking,
+                                           detection_interval=SETTINGS.face_detection_interval,
+                                           detection_scale=SETTINGS.face_detection_scale,
+                                           gallery=gallery,
+                                           barcode_scan_interval=SETTINGS.barcode_scan_interval,
+                                           barcode_scan_scale=SETTINGS.barcode_scan_scale)
+    shopping_cart = ShoppingModule()
+    # Adjusts the face detection to the measured latency, starting from the configured operating point
+    governor = None
+    face_detector = recognition_module.detect_faces_batch
+    if SETTINGS.quality_governor:
+        ladder, start_level = GovernorModule.ladder_for({'model': recognition_module.model,
+                                                         'detection_scale': recognition_module.detection_scale,
+                                                         'upsample': recognition_module.upsample,
+                                                         'detection_interval': recognition_module.detection_interval})
+        governor = GovernorModule(recognition_module.set_operating_point, frame_budget=1 / SETTINGS.target_fps,
+                                  ladder=ladder, start_level=start_level, start_reason="configured operating point")
+        face_detector = governor.governed(face_detector)
+
+    def get_overlay_lines():
+        lines = metrics.get_overlay_lines()
+        if governor is not None:
+            lines.append(f"quality: level {governor.level} of {len(governor.ladder) - 1}")
+        return lines
+
+    def load_llm():
+        from modules.llm_module import LlmModule
+        llm = LlmModule(llm_path=SETTINGS.llm_path, available_functions=command_mapping,
+                        layers_on_gpu=SETTINGS.layers_on_gpu, constrained=SETTINGS.llm_constrained)
+        # The local LLM is asked only about the utterances the embeddings are not confident about
+        llm.should_cancel = command_worker.should_cancel
+        intent.fallback = llm.obtain_command_from_stt
+        return llm
+
+    def load_voice_interface():
+        from modules.transcription_module import TranscriptionModule
+        from modules.voice_interface_module import VoiceInterfaceModule
+        voice_interface = VoiceInterfaceModule(SETTINGS.tts_model_name, SETTINGS.stt_model_name,
+                                               phrase_cache_size=SETTINGS.tts_cache_size,
+                                               phrase_cache_dir=SETTINGS.tts_cache_dir,
+                                               continuous_listening=SETTINGS.continuous_listening,
+                                               silence_duration=SETTINGS.vad_silence_duration,
+                                               stt_command_mode=SETTINGS.stt_command_mode,
+                                               stt_command_prompt=TranscriptionModule.build_command_prompt(
+                                                   COMMAND_PHRASES),
+                                               metrics=metrics)
+        voice_interface.presynthesize(announcements.values())
+        voice_interface.say(announcements["turning_on"])
+        return voice_interface
+
+    # Prepare data, the catalog and the known faces are published as soon as they are loaded
+    # With a catalog snapshot from the previous run, the database is reconciled in the background
+    database.refresh_data()
+    recognition_module.set_product_data_source(database)
+    startup.submit("known_faces", recognition_module.load_known_faces, "known_faces")  # Only new or changed images
+    startup.submit("voice_interface", load_voice_interface)
+    if SETTINGS.use_local_llm:
+        startup.submit("llm", load_llm)
+    # Finishes once the whole voice stack has been loaded (or failed to)
+    startup.submit("voice", lambda: None,
+                   depends_on=["voice_interface", "llm"] if SETTINGS.use_local_llm else ["voice_interface"])
+
+    # The frames of all the cameras are read together and their faces are detected in a single batch
+    pipeline = PipelineModule(metrics.timed("read_frame", gui.read_frames),
+                              metrics.timed("detect_faces", face_detector),
+                              metrics.timed("detect_products", recognition_module.detect_products_batch),
+                              queue_depth=SETTINGS.pipeline_queue_depth,
+                              face_workers=SETTINGS.pipeline_face_workers,
+                              barcode_workers=SETTINGS.pipeline_barcode_workers)
+    detected_products = []
+    # The latest results of every camera, as a batch only includes the cameras which delivered a new frame
+    faces_by_stream = {}
+    products_by_stream = {}
+
+    # Start operating
+    metrics.start()
+    pipeline.start()
+    command_worker.start()
+    voice_ready_reported = False
+    terminate_loop = False
+    while not terminate_loop:
+        frame = pipeline.get_latest_frame()
+        if frame is not None:
+            images, detected_people, detected_products_batch = frame
+            faces_by_stream.update(detected_people or {})
+            products_by_stream.update(detected_products_batch or {})
+            detected_products = [product for products in products_by_stream.values() for product in products]
+            with metrics.timer("render_gui"):
+                for stream_id, image in images:
+                    gui.display_detected_objects(image, faces_by_stream.get(stream_id),
+                                                 products_by_stream.get(stream_id))
+                    # The cart is shown on the main camera, the other cameras only show their detections
+                    if stream_id == 0:
+                        gui.render_gui(image, shopping_cart.cart, shopping_cart.products_total_cost,
+                                       shopping_cart.version,
+                                       metrics_lines=get_overlay_lines() if gui.show_metrics else None)
+                    else:
+                        gui.show_frame(image, stream_id)
+            startup.mark("first_frame")
+
+        key_pressed = gui.poll_key()
+
+        # Handle keyboard interface
+        if key_pressed != 255:
+            with metrics.timer("execute_command"):
+                terminate_loop = controller.handle_keyboard_input(key_pressed)
+
+        # Handle voice interface, the commands are mapped on the worker thread
+        if not voice_ready_reported and startup.is_ready("voice"):
+            print(f"Startup [s]: {startup.get_metrics()}")
+            voice_ready_reported = True
+
+        voice_interface = startup.get("voice_interface") if startup.is_ready("voice_interface") else None
+        if voice_interface is not None and not voice_interface.stt_queue.empty():
+            stt_result = voice_interface.stt_queue.get_nowait()
+            print(stt_result)
+            command_worker.submit(stt_result)
+
+        if not terminate_loop and not command_worker.result_queue.empty():
+            stt_result, mapped_command = command_worker.result_queue.get_nowait()
+            print(mapped_command)
+            metrics.increment("voice_commands")
+            with metrics.timer("execute_command"):
+                terminate_loop = controller.handle_stt_input(mapped_command)
+
+    command_worker.stop()
+    pipeline.stop()
+    print(f"Pipeline throughput [FPS]: {pipeline.get_stage_throughput()}")
+    print(f"Pipeline detection errors: {pipeline.get_error_counters()}")
+    if governor is not None:
+        print(f"Face detection quality: {governor.get_state()}")
+    for stream_id, frame_grabber in enumerate(gui.frame_grabbers):
+        print(f"Camera {stream_id} frames captured: {frame_grabber.frames_captured}, "
+              f"dropped as stale: {frame_grabber.frames_dropped}")
+    voice_interface = startup.get("voice_interface") if startup.is_ready("voice_interface") else None
+    if voice_interface is not None:
+        voice_interface.say(announcements["turning_off"])
+        voice_interface.close()
+    metrics.stop()
+    database.close()
+
+
+# The guard keeps the face encoding worker processes from re-running the application
+if __name__ == "__main__":
+    main()
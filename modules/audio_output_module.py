@@ -0,0 +1,146 @@
+import queue
+import threading
+import pyaudio
+
+
+class AudioOutputModule:
+    """
+    A class to play the synthesized speech on a single worker thread, owning one output stream.
+
+    The audio buffers are queued in memory and played one after another, so the announcements never overlap
+    and the stream is opened only once (or again when the sample rate changes). Flushing drops the queued
+    buffers and cuts off the one being played.
+
+    Attributes:
+    -----------
+    audio : pyaudio.PyAudio
+        The PyAudio instance the output stream is opened with.
+    chunk_size : int
+        The number of frames written to the stream at once, also bounding the delay of a flush.
+    generation : int
+        The number of flushes so far, the buffers queued before the latest flush are not played.
+
+    Methods:
+    --------
+    start(self)
+        Starts the playback thread.
+
+    stop(self)
+        Stops the playback thread and closes the output stream.
+
+    play(self, pcm, sample_rate, generation=None)
+        Queues 16-bit mono PCM audio for playback.
+
+    flush(self)
+        Drops the queued audio and interrupts the playback.
+
+    wait_until_idle(self)
+        Blocks until all the queued audio has been played.
+
+    is_busy(self)
+        Returns if any audio is queued or being played.
+    """
+    def __init__(self, audio, chunk_size=1024):
+        self.audio = audio
+        self.chunk_size = chunk_size
+        self.generation = 0
+
+        self.__queue = queue.Queue()
+        self.__stream = None
+        self.__stream_rate = None
+        self.__thread = None
+
+    def start(self):
+        """
+        Starts the playback thread.
+        """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the playback thread, once the already queued audio is played, and closes the output stream.
+        """
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def play(self, pcm, sample_rate, generation=None):
+        """
+        Queues 16-bit mono PCM audio for playback. With a generation, the audio is not played
+        if the output was flushed after it was taken.
+        """
+        self.__queue.put((self.generation if generation is None else generation, pcm, sample_rate))
+
+    def flush(self):
+        """
+        Drops the queued audio and interrupts the playback. Returns the new generation.
+        """
+        self.generation += 1
+        return self.generation
+
+    def wait_until_idle(self):
+        """
+        Blocks until all the queued audio has been played or dropped.
+        """
+        self.__queue.join()
+
+    def is_busy(self):
+        """
+        Returns if any audio is queued or being played.
+        """
+        return self.__queue.unfinished_tasks > 0
+
+    def __run(self):
+        """
+        Internal method playing the queued audio until the worker is stopped.
+        """
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is None:
+                    break
+
+                generation, pcm, sample_rate = item
+                if generation == self.generation:
+                    self.__write(pcm, sample_rate, generation)
+            except OSError as e:
+                print(f"Audio output error: {e}")
+                self.__close_stream()
+            finally:
+                self.__queue.task_done()
+
+        self.__close_stream()
+
+    def __write(self, pcm, sample_rate, generation):
+        """
+        Internal method writing the audio to the stream in chunks, stopping when the output is flushed.
+        """
+        if self.__stream is None or self.__stream_rate != sample_rate:
+            self.__close_stream()
+            self.__stream = self.audio.open(format=pyaudio.paInt16,
+                                            channels=1,
+                                            rate=sample_rate,
+                                            output=True)
+            self.__stream_rate = sample_rate
+
+        chunk_bytes = self.chunk_size * 2
+        for start in range(0, len(pcm), chunk_bytes):
+            if generation != self.generation:
+                break
+            self.__stream.write(pcm[start:start + chunk_bytes])
+
+    def __close_stream(self):
+        """
+        Internal method closing the output stream.
+        """
+        if self.__stream is not None:
+            try:
+                self.__stream.stop_stream()
+                self.__stream.close()
+            except OSError:
+                pass
+            self.__stream = None
+            self.__stream_rate = None
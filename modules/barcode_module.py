@@ -0,0 +1,125 @@
+import threading
+import cv2
+from pyzbar.pyzbar import decode, Point, Rect
+
+
+class BarcodeModule:
+    """
+    A class to decode the barcodes seen by the camera, reusing the previous results between the frames.
+
+    The whole (optionally downscaled) grayscale frame is scanned only periodically, or when nothing is being
+    followed. On the remaining frames only the regions around the previously found barcodes are decoded.
+    The returned barcodes always use the coordinates of the full resolution frame.
+
+    The frames are decoded outside of the lock, so several barcode workers can decode the frames of the same
+    stream at once; the regions found on the newest of the decoded frames are kept.
+
+    Attributes:
+    -----------
+    full_scan_interval : int
+        The number of frames between the full frame scans, 1 scans the whole frame every time.
+    scan_scale : float
+        The scale of the frame used for the full frame scans.
+    region_margin : float
+        The margin added around the previously found barcodes, relative to their size.
+
+    Methods:
+    --------
+    decode(self, image)
+        Decodes the barcodes found on the image frame.
+
+    reset(self)
+        Forgets the previously found barcodes, so the next frame is fully scanned.
+    """
+    def __init__(self, full_scan_interval=1, scan_scale=1.0, region_margin=0.5):
+        self.full_scan_interval = max(1, full_scan_interval)
+        self.scan_scale = scan_scale
+        self.region_margin = region_margin
+
+        self.__regions = []
+        self.__frames_since_full_scan = self.full_scan_interval
+        self.__scan_count = 0
+        self.__published_scan = 0
+        self.__lock = threading.Lock()
+
+    def decode(self, image):
+        """
+        Decodes the barcodes found on the image frame, scanning either the whole frame or the previous regions.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+        with self.__lock:
+            regions = self.__regions
+            full_scan = not regions or self.__frames_since_full_scan >= self.full_scan_interval
+            self.__frames_since_full_scan = 1 if full_scan else self.__frames_since_full_scan + 1
+            self.__scan_count += 1
+            scan = self.__scan_count
+
+        results = self.__scan_full_frame(gray) if full_scan else self.__scan_regions(gray, regions)
+
+        with self.__lock:
+            # A slower worker finishing an older frame does not replace the regions of a newer one
+            if scan > self.__published_scan:
+                self.__published_scan = scan
+                self.__regions = [decoded_barcode.rect for decoded_barcode in results]
+
+        return results
+
+    def reset(self):
+        """
+        Forgets the previously found barcodes, so the next frame is fully scanned.
+        """
+        with self.__lock:
+            self.__regions = []
+            # The frames still being decoded do not bring the forgotten regions back
+            self.__published_scan = self.__scan_count
+
+    def __scan_full_frame(self, gray):
+        """
+        Internal method decoding the whole frame, downscaled by the scan scale.
+        """
+        if self.scan_scale == 1:
+            return decode(gray)
+
+        small_gray = cv2.resize(gray, None, fx=self.scan_scale, fy=self.scan_scale, interpolation=cv2.INTER_AREA)
+        return [self.__transform(decoded_barcode, 1 / self.scan_scale, 0, 0) for decoded_barcode in decode(small_gray)]
+
+    def __scan_regions(self, gray, regions):
+        """
+        Internal method decoding only the regions around the previously found barcodes.
+        """
+        frame_height, frame_width = gray.shape[:2]
+        results = []
+        seen = set()
+
+        for region in regions:
+            margin_x = int(region.width * self.region_margin) + 8
+            margin_y = int(region.height * self.region_margin) + 8
+            left = max(0, region.left - margin_x)
+            top = max(0, region.top - margin_y)
+            right = min(frame_width, region.left + region.width + margin_x)
+            bottom = min(frame_height, region.top + region.height + margin_y)
+            if right <= left or bottom <= top:
+                continue
+
+            for decoded_barcode in decode(gray[top:bottom, left:right]):
+                decoded_barcode = self.__transform(decoded_barcode, 1, left, top)
+                # Regions of barcodes lying close to each other overlap, so the same barcode can be decoded twice
+                key = (decoded_barcode.data, decoded_barcode.type, decoded_barcode.rect)
+                if key not in seen:
+                    seen.add(key)
+                    results.append(decoded_barcode)
+
+        return results
+
+    @staticmethod
+    def __transform(decoded_barcode, scale, offset_x, offset_y):
+        """
+        Internal method mapping the decoded barcode location back to the full resolution frame coordinates.
+        """
+        rect = decoded_barcode.rect
+        return decoded_barcode._replace(
+            rect=Rect(int(rect.left * scale) + offset_x, int(rect.top * scale) + offset_y,
+                      int(rect.width * scale), int(rect.height * scale)),
+            polygon=[Point(int(point.x * scale) + offset_x, int(point.y * scale) + offset_y)
+                     for point in decoded_barcode.polygon])
@@ -0,0 +1,148 @@
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class CommandWorkerModule:
+    """
+    A class to map the speech-to-text output to commands on a dedicated thread, so the video loop never waits
+    for the language model.
+
+    The transcriptions are submitted to a request queue and the mapped commands are posted to a result queue.
+    A newly submitted transcription supersedes the ones which are still waiting or being mapped, and mappings
+    taking longer than the timeout are dropped. Recently mapped transcriptions are cached after normalization,
+    so repeated phrases skip the inference entirely. 'NO_MATCH' is not cached, as the same phrase can be matched
+    once a better mapper is attached, e.g. the local LLM after it is loaded.
+
+    Attributes:
+    -----------
+    mapper : callable
+        The function mapping a transcription to a command key, e.g. IntentModule.obtain_command_from_stt.
+    timeout : float
+        The time [s] after which a submitted transcription is no longer mapped or executed.
+    cache_size : int
+        The maximum number of the cached transcriptions.
+    result_queue : queue.Queue
+        The queue of the (transcription, command) pairs ready to be executed.
+
+    Methods:
+    --------
+    start(self)
+        Starts the worker thread.
+
+    stop(self)
+        Stops the worker thread.
+
+    submit(self, stt_output)
+        Requests mapping of a transcription, superseding the previous requests.
+
+    should_cancel(self)
+        Returns if the mapping being run by the worker is no longer needed.
+
+    normalize(text)
+        Normalizes the transcription before it is used as the cache key.
+    """
+    def __init__(self, mapper, timeout=10.0, cache_size=128):
+        self.mapper = mapper
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.result_queue = queue.Queue()
+
+        self.__request_queue = queue.Queue()
+        self.__cache = OrderedDict()
+        self.__generation = 0
+        self.__generation_lock = threading.Lock()
+        self.__current_request = None
+        self.__thread = None
+
+    def start(self):
+        """
+        Starts the worker thread.
+        """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the worker thread, cancelling the pending and running mappings.
+        """
+        if self.__thread is not None:
+            with self.__generation_lock:
+                self.__generation += 1
+
+            self.__request_queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def submit(self, stt_output):
+        """
+        Requests mapping of a transcription. The previously submitted ones are cancelled, as the user has
+        already said something new.
+        """
+        with self.__generation_lock:
+            self.__generation += 1
+            generation = self.__generation
+
+        self.__request_queue.put((generation, stt_output, time.monotonic() + self.timeout))
+
+    def should_cancel(self):
+        """
+        Returns if the mapping being run by the worker was superseded or timed out. Meant to be polled by
+        the long-running mappers, so they can stop early.
+        """
+        request = self.__current_request
+        if request is None:
+            return False
+
+        generation, _, deadline = request
+        return generation != self.__generation or time.monotonic() > deadline
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalizes the transcription, ignoring the case, punctuation and whitespace differences.
+        """
+        return ' '.join(re.findall(r"[a-z0-9']+", text.lower()))
+
+    def __run(self):
+        """
+        Internal method mapping the submitted transcriptions until the worker is stopped.
+        """
+        while True:
+            request = self.__request_queue.get()
+            if request is None:
+                break
+
+            generation, stt_output, deadline = request
+            if generation != self.__generation:
+                continue
+
+            cache_key = self.normalize(stt_output)
+            command = self.__cache.get(cache_key)
+            if command is not None:
+                self.__cache.move_to_end(cache_key)
+            else:
+                self.__current_request = request
+                try:
+                    command = self.mapper(stt_output)
+                except Exception as e:
+                    print(f"Error mapping the command: {e}")
+                    continue
+                finally:
+                    self.__current_request = None
+
+                if generation != self.__generation:
+                    continue
+                if time.monotonic() > deadline:
+                    print(f"Mapping of '{stt_output}' timed out")
+                    continue
+
+                if command != "NO_MATCH":
+                    self.__cache[cache_key] = command
+                    if len(self.__cache) > self.cache_size:
+                        self.__cache.popitem(last=False)
+
+            self.result_queue.put((stt_output, command))
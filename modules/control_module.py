@@ -1,3 +1,15 @@
+# Example phrases of the commands which can be given by voice
+COMMAND_PHRASES = {
+    "quit_application": ["Turn off", "System turn off", "Shut down the system", "Quit the application"],
+    "refresh_data": ["Refresh the data", "Reload the product database", "Update the prices"],
+    "add_product": ["Add this product to the cart", "Put it in my cart", "I want to buy this", "Add the products"],
+    "clear_cart": ["Clear the cart", "Empty my cart", "Remove everything from the cart"],
+    "toggle_shopping_list": ["Show the shopping list", "Hide the shopping list", "Turn on the shopping list",
+                             "Toggle the list"],
+    "finalize_transaction": ["Finalize the transaction", "I want to pay", "Check out", "How much do I owe?"],
+}
+
+
 class ControlModule:
     """
     A class to manage the execution of commands based on different inputs.
@@ -30,6 +42,7 @@ class ControlModule:
             ord("s"): "toggle_shopping_list",
             ord("b"): "finalize_transaction",
             ord("v"): "voice_interface",
+            ord("m"): "toggle_metrics",
         }
 
     def execute_command(self, command):
@@ -0,0 +1,75 @@
+import sqlite3
+
+
+class DbApiBackend:
+    """
+    A class describing how to connect to a DB-API 2.0 compatible database and how to phrase the queries for it.
+
+    Attributes:
+    -----------
+    connect_function : callable
+        The function opening a new connection.
+    placeholder : str
+        The query parameter placeholder of the driver's paramstyle.
+
+    Methods:
+    --------
+    connect(self)
+        Opens a new connection to the database.
+
+    quote(self, identifier)
+        Quotes a table or column name.
+    """
+    def __init__(self, connect_function, placeholder="?"):
+        self.connect_function = connect_function
+        self.placeholder = placeholder
+
+    def connect(self):
+        """
+        Opens a new connection to the database.
+        """
+        return self.connect_function()
+
+    def quote(self, identifier):
+        """
+        Quotes a table or column name.
+        """
+        return f'"{identifier}"'
+
+
+class OdbcBackend(DbApiBackend):
+    """
+    A class connecting to the shop's SQL Server database through pyodbc, imported only when it is used.
+    """
+    def __init__(self, server, database, username, password, driver='{ODBC Driver 17 for SQL Server}'):
+        super().__init__(self.__connect)
+        self.__conn_str = (
+            f'DRIVER={driver};'
+            f'SERVER={server};'
+            f'DATABASE={database};'
+            f'UID={username};'
+            f'PWD={password}'
+        )
+
+    def __connect(self):
+        import pyodbc
+        return pyodbc.connect(self.__conn_str)
+
+    def quote(self, identifier):
+        return f'[{identifier}]'
+
+
+class SqliteBackend(DbApiBackend):
+    """
+    A class connecting to a local SQLite stand-in of the shop's database, usable without any outside services.
+    """
+    def __init__(self, database_path):
+        super().__init__(self.__connect)
+        self.database_path = database_path
+
+    def __connect(self):
+        # The connection is opened and used by the refresh threads, one at a time
+        return sqlite3.connect(self.database_path, check_same_thread=False)
+
+    def quote(self, identifier):
+        return f'[{identifier}]'
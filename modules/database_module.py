@@ -1,92 +1,286 @@
-import pyodbc
+import base64
+import datetime
+import json
+import os
+import threading
+import numpy as np
+from modules.catalog_module import CatalogModule
 
 
 class DatabaseModule:
     """
     A class to handle database operations for managing product and barcode data.
 
+    The data is refreshed on a background thread over a reused connection. After the first load, only the rows
+    changed since the previous refresh are fetched (if the tables have a change tracking column), and the new data
+    is published by swapping a single catalog reference, so the readers never see a partially loaded catalog.
+    The last loaded catalog is kept in a local snapshot file, which is loaded at startup and then reconciled
+    with the database in the background.
+
     Attributes:
     -----------
-    __conn_str : str
-    The connection string for the database.
+    backend : DbApiBackend
+    The backend opening the connections to the database.
     __products_table : str
     The name of the table containing product data.
     __barcodes_table : str
     The name of the table containing barcode data.
-    products : dict
-    A dictionary to store product information.
-    barcodes : dict
-    A dictionary to store barcode information.
+    change_column : str
+    The name of the rowversion / updated-at column present in both tables, None to always reload everything.
+    snapshot_file : str
+    The path of the local catalog snapshot, None to not keep one.
+    price_decimals : int
+    The number of decimal places the prices are stored with.
+    catalog : CatalogModule
+    The current, immutable snapshot of the product and barcode data.
+    products : Mapping
+    A read-only mapping of the product IDs to the product information.
+    barcodes : Mapping
+    A read-only mapping of the barcodes to the product IDs.
+    version : int
+    The number of completed data refreshes, allowing the consumers to invalidate their cached lookups.
 
     Methods:
     --------
-    refresh_data(self)
-    Loads product and barcode data from the database into memory.
+    refresh_data(self, wait=False)
+    Loads product and barcode data from the database into memory on a background thread.
+
+    close(self)
+    Closes the reused database connection.
+
+    __refresh(self)
+    Internal method loading the changed data and publishing the new catalog.
+
+    __load_snapshot(self)
+    Internal method loading the catalog stored by the previous run.
+
+    __save_snapshot(self, catalog, watermarks)
+    Internal method storing the catalog in the local snapshot file.
 
-    __load_known_barcodes(self)
+    __load_known_barcodes(self, cursor, catalog, watermarks)
     Internal method to load barcode data from the database.
 
-    __load_known_products(self)
+    __load_known_products(self, cursor, catalog, watermarks)
     Internal method to load product data from the database.
     """
-    def __init__(self, server, database, username, password, driver='{ODBC Driver 17 for SQL Server}'):
-        self.__conn_str = (
-            f'DRIVER={driver};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password}'
-        )
+    def __init__(self, backend, change_column=None, snapshot_file=None, price_decimals=2):
+        self.backend = backend
+        self.__connection = None
 
         self.__products_table = "products"
         self.__barcodes_table = "barcodes"
-        self.products = {}
-        self.barcodes = {}
+        self.change_column = change_column
+        self.snapshot_file = snapshot_file
+        self.price_decimals = price_decimals
+        self.catalog = CatalogModule.from_dicts({}, {}, price_decimals=price_decimals)
+
+        self.__watermarks = {self.__products_table: None, self.__barcodes_table: None}
+        self.__refresh_lock = threading.Lock()
+        self.__refresh_thread = None
+
+        if snapshot_file is not None:
+            self.__load_snapshot()
+
+    @property
+    def products(self):
+        return self.catalog.products
+
+    @property
+    def barcodes(self):
+        return self.catalog.barcodes
 
-    def refresh_data(self):
+    @property
+    def version(self):
+        return self.catalog.version
+
+    def refresh_data(self, wait=False):
         """
-        Loads the latest product and barcode data from the database.
+        Loads the latest product and barcode data from the database on a background thread.
+        If a refresh is already running, no other one is started. With wait, blocks until the refresh is finished.
         """
-        self.__load_known_products()
-        self.__load_known_barcodes()
+        with self.__refresh_lock:
+            if self.__refresh_thread is None or not self.__refresh_thread.is_alive():
+                self.__refresh_thread = threading.Thread(target=self.__refresh, daemon=True)
+                self.__refresh_thread.start()
+
+            refresh_thread = self.__refresh_thread
 
-    def __load_known_barcodes(self):
+        if wait:
+            refresh_thread.join()
+
+    def close(self):
         """
-        Internal method to load barcode data from the database.
+        Closes the reused database connection.
+        """
+        if self.__refresh_thread is not None:
+            self.__refresh_thread.join()
+
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __refresh(self):
+        """
+        Internal method loading the changed data and publishing it at once, as a new catalog derived from the current one.
         """
-        self.barcodes = {}
+        catalog = self.catalog
+        watermarks = dict(self.__watermarks)
+
         try:
-            with pyodbc.connect(self.__conn_str) as conn:
-                cursor = conn.cursor()
-                cursor.execute(f'SELECT [Barcode], [ProductID] FROM {self.__barcodes_table}')
+            if self.__connection is None:
+                self.__connection = self.backend.connect()
 
-                for row in cursor:
-                    barcode_data, associated_info = row
-                    self.barcodes[barcode_data] = associated_info
+            cursor = self.__connection.cursor()
+            products, removed_product_ids = self.__load_known_products(cursor, catalog, watermarks)
+            barcodes, removed_barcodes = self.__load_known_barcodes(cursor, catalog, watermarks)
+            # Converting the rows can fail too, e.g. on a NULL price, and then the current catalog is kept
+            updated_catalog = catalog.updated(products, removed_product_ids, barcodes, removed_barcodes,
+                                              catalog.version + 1)
 
-        except pyodbc.Error as e:
-            print(f"Database error: {e}")
         except Exception as e:
-            print(f"Error loading known barcodes: {e}")
+            print(f"Database error: {e}")
+            self.__drop_connection()
+            return
+
+        self.__watermarks = watermarks
+        self.catalog = updated_catalog
 
-    def __load_known_products(self):
+        if self.snapshot_file is not None:
+            self.__save_snapshot(self.catalog, watermarks)
+
+    def __drop_connection(self):
         """
-        Internal method to load product data from the database.
+        Internal method closing a connection which failed, so the next refresh reconnects.
         """
-        self.products = {}
         try:
-            with pyodbc.connect(self.__conn_str) as conn:
-                cursor = conn.cursor()
-                cursor.execute(f'SELECT [ID], [Name], [Price] FROM {self.__products_table}')
-
-                for row in cursor:
-                    product_id, product_name, product_price = row
-                    self.products[product_id] = {
-                        'name': product_name,
-                        'price': product_price
-                    }
-
-        except pyodbc.Error as e:
-            print(f"Database error: {e}")
-        except Exception as e:
-            print(f"Error loading known products: {e}")
+            if self.__connection is not None:
+                self.__connection.close()
+        except Exception:
+            pass
+
+        self.__connection = None
+
+    def __load_snapshot(self):
+        """
+        Internal method loading the catalog and the change watermarks stored by the previous run.
+        """
+        if not os.path.exists(self.snapshot_file):
+            return
+
+        try:
+            catalog, archive = CatalogModule.load(self.snapshot_file)
+            with archive:
+                snapshot_info = json.loads(str(archive['snapshot_info']))
+
+            if snapshot_info['change_column'] == self.change_column:
+                self.__watermarks = {table: self.__decode_watermark(watermark)
+                                     for table, watermark in snapshot_info['watermarks'].items()}
+
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error loading the catalog snapshot: {e}")
+            return
+
+        self.catalog = catalog
+
+    def __save_snapshot(self, catalog, watermarks):
+        """
+        Internal method storing the catalog and the change watermarks, replacing the previous snapshot atomically.
+        """
+        snapshot_info = {
+            'change_column': self.change_column,
+            'watermarks': {table: self.__encode_watermark(watermark) for table, watermark in watermarks.items()},
+        }
+
+        try:
+            with open(self.snapshot_file + '.tmp', 'wb') as f:
+                catalog.save(f, snapshot_info=np.array(json.dumps(snapshot_info)))
+
+            os.replace(self.snapshot_file + '.tmp', self.snapshot_file)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error saving the catalog snapshot: {e}")
+
+    def __load_known_barcodes(self, cursor, catalog, watermarks):
+        """
+        Internal method to load barcode data from the database.
+        Returns the changed barcodes and the removed ones.
+        """
+        rows, removed_barcodes = self.__fetch_changes(cursor, self.__barcodes_table, ['Barcode', 'ProductID'],
+                                                      catalog.barcodes, watermarks)
+        barcodes = {}
+        for row in rows:
+            barcode_data, associated_info = row[0], row[1]
+            barcodes[barcode_data] = associated_info
+
+        return barcodes, removed_barcodes
+
+    def __load_known_products(self, cursor, catalog, watermarks):
+        """
+        Internal method to load product data from the database.
+        Returns the changed products and the IDs of the removed ones.
+        """
+        rows, removed_product_ids = self.__fetch_changes(cursor, self.__products_table, ['ID', 'Name', 'Price'],
+                                                         catalog.products, watermarks)
+        products = {}
+        for row in rows:
+            product_id, product_name, product_price = row[0], row[1], row[2]
+            products[product_id] = {
+                'name': product_name,
+                'price': product_price
+            }
+
+        return products, removed_product_ids
+
+    def __fetch_changes(self, cursor, table, columns, loaded_keys, watermarks):
+        """
+        Internal method returning the rows of a table changed since the previous refresh, or all of them on the first
+        refresh or without a change column, along with the loaded keys which have to be removed.
+        The first column is the key, compared against the loaded keys with a key-only query to find the deleted rows.
+        """
+        quote = self.backend.quote
+        column_list = ', '.join(quote(column) for column in columns)
+        watermark = watermarks[table]
+
+        if self.change_column is None or watermark is None:
+            if self.change_column is None:
+                cursor.execute(f'SELECT {column_list} FROM {table}')
+                return cursor.fetchall(), list(loaded_keys)
+
+            cursor.execute(f'SELECT {column_list}, {quote(self.change_column)} FROM {table}')
+            removed_keys = list(loaded_keys)
+        else:
+            cursor.execute(f'SELECT {quote(columns[0])} FROM {table}')
+            current_keys = {row[0] for row in cursor.fetchall()}
+            removed_keys = [key for key in loaded_keys if key not in current_keys]
+
+            cursor.execute(f'SELECT {column_list}, {quote(self.change_column)} FROM {table} '
+                           f'WHERE {quote(self.change_column)} > {self.backend.placeholder}', (watermark,))
+
+        rows = cursor.fetchall()
+        if rows:
+            watermarks[table] = max(row[-1] for row in rows)
+
+        return rows, removed_keys
+
+    @staticmethod
+    def __encode_watermark(watermark):
+        """
+        Converts a watermark (number, text, rowversion bytes or timestamp) to a JSON compatible value.
+        """
+        if isinstance(watermark, (bytes, bytearray)):
+            return {'bytes': base64.b64encode(watermark).decode('ascii')}
+        if isinstance(watermark, datetime.datetime):
+            return {'datetime': watermark.isoformat()}
+
+        return watermark
+
+    @staticmethod
+    def __decode_watermark(watermark):
+        """
+        Restores a watermark converted by __encode_watermark.
+        """
+        if isinstance(watermark, dict) and 'bytes' in watermark:
+            return base64.b64decode(watermark['bytes'])
+        if isinstance(watermark, dict) and 'datetime' in watermark:
+            return datetime.datetime.fromisoformat(watermark['datetime'])
+
+        return watermark
@@ -0,0 +1,125 @@
+import os
+import threading
+import cv2
+import face_recognition
+import numpy as np
+
+
+YUNET_MODEL_URL = "https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet"
+
+
+class FaceDetector:
+    """
+    A class describing a face detection backend. Every backend returns the face locations
+    as (top, right, bottom, left) tuples, the format face_recognition.face_encodings and the GUI use.
+
+    Attributes:
+    -----------
+    name : str
+        The name of the backend.
+
+    Methods:
+    --------
+    detect(self, images, upsample=1)
+        Returns the face locations of every image.
+    """
+    name = None
+
+    def detect(self, images, upsample=1):
+        """
+        Returns the list of the face locations of every image.
+        """
+        raise NotImplementedError
+
+
+class DlibFaceDetector(FaceDetector):
+    """
+    A class detecting the faces with dlib through face_recognition, with either the HOG or the CNN model.
+    The CNN model is fast only with a CUDA build of dlib, on which the images of the same size are located
+    in a single batch.
+    """
+    def __init__(self, model="hog"):
+        self.name = model
+        self.model = model
+
+    def detect(self, images, upsample=1):
+        if self.model != "cnn" or len(images) < 2:
+            return [face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=self.model)
+                    for image in images]
+
+        image_indices_by_shape = {}
+        for index, image in enumerate(images):
+            image_indices_by_shape.setdefault(image.shape, []).append(index)
+
+        locations = [None] * len(images)
+        for image_indices in image_indices_by_shape.values():
+            batch_locations = face_recognition.batch_face_locations([images[index] for index in image_indices],
+                                                                    number_of_times_to_upsample=upsample,
+                                                                    batch_size=len(image_indices))
+            for index, image_locations in zip(image_indices, batch_locations):
+                locations[index] = image_locations
+
+        return locations
+
+
+class YuNetFaceDetector(FaceDetector):
+    """
+    A class detecting the faces with OpenCV's YuNet model (cv2.FaceDetectorYN), a small CNN running fast on the CPU.
+    The ONNX model file is not part of the repository, it has to be downloaded from the OpenCV model zoo.
+    The model finds the small faces without upsampling, so the upsample argument is ignored.
+    """
+    name = "yunet"
+
+    def __init__(self, model_path, score_threshold=0.6, nms_threshold=0.3, top_k=5000):
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"The YuNet face detection model was not found at {model_path}, "
+                                    f"download it from {YUNET_MODEL_URL}")
+
+        self.model_path = model_path
+        self.__detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, nms_threshold, top_k)
+        self.__input_size = (320, 320)
+        # The input size is a state of the detector, so the face workers use it one at a time
+        self.__lock = threading.Lock()
+
+    def detect(self, images, upsample=1):
+        locations = []
+        with self.__lock:
+            for image in images:
+                height, width = image.shape[:2]
+                if (width, height) != self.__input_size:
+                    self.__detector.setInputSize((width, height))
+                    self.__input_size = (width, height)
+
+                _, faces = self.__detector.detect(image)
+                locations.append(self.to_locations(faces, image.shape))
+
+        return locations
+
+    @staticmethod
+    def to_locations(faces, image_shape):
+        """
+        Converts the YuNet detections (x, y, width, height, landmarks..., score rows) into the (top, right, bottom,
+        left) face locations, clipped to the image.
+        """
+        if faces is None or len(faces) == 0:
+            return []
+
+        height, width = image_shape[:2]
+        boxes = np.round(np.asarray(faces)[:, :4]).astype(int)
+        left = np.clip(boxes[:, 0], 0, width - 1)
+        top = np.clip(boxes[:, 1], 0, height - 1)
+        right = np.clip(boxes[:, 0] + boxes[:, 2], 0, width - 1)
+        bottom = np.clip(boxes[:, 1] + boxes[:, 3], 0, height - 1)
+        return [(int(t), int(r), int(b), int(l)) for t, r, b, l in zip(top, right, bottom, left) if r > l and b > t]
+
+
+def create_face_detector(backend, yunet_model_path=None):
+    """
+    Creates the face detection backend by its name: "hog" or "cnn" for dlib, "yunet" for OpenCV's YuNet.
+    """
+    if backend in ("hog", "cnn"):
+        return DlibFaceDetector(backend)
+    if backend == "yunet":
+        return YuNetFaceDetector(yunet_model_path)
+
+    raise ValueError(f"Unknown face detector backend: {backend}")
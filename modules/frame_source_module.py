@@ -0,0 +1,298 @@
+import glob
+import os
+import sys
+import threading
+import time
+import cv2
+
+
+class FrameSource:
+    """
+    A class describing where the frames come from. The frames are read into the given buffer when possible,
+    so the readers can reuse their arrays instead of allocating a new one per frame.
+
+    Attributes:
+    -----------
+    is_live : bool
+        A flag to determine if the frames are produced in real time, so the old ones can be dropped.
+        Otherwise, e.g. for the recordings, every frame is kept until it is read.
+
+    Methods:
+    --------
+    read(self, out=None)
+        Returns the next frame, read into the out array if it fits, or None if no frame could be read.
+
+    release(self)
+        Releases the source.
+    """
+    is_live = True
+
+    def read(self, out=None):
+        """
+        Returns the next frame, read into the out array if it fits, or None if no frame could be read.
+        """
+        raise NotImplementedError
+
+    def release(self):
+        """
+        Releases the source.
+        """
+
+
+class CaptureSource(FrameSource):
+    """
+    A class reading the frames of a camera, a video file or a network stream through cv2.VideoCapture.
+    The cameras are opened with the native backend of the platform (V4L2 on Linux, DirectShow on Windows),
+    and the streams are reopened when they stop delivering frames.
+    """
+    def __init__(self, target, api_preference=cv2.CAP_ANY, width=None, height=None, is_live=True, loop=False,
+                 reconnect=False):
+        self.target = target
+        self.api_preference = api_preference
+        self.width = width
+        self.height = height
+        self.is_live = is_live
+        self.loop = loop
+        self.reconnect = reconnect
+        self.video = None
+        self.__open()
+
+    def read(self, out=None):
+        ret, image = self.video.read(out)
+        if not ret and self.loop:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self.video.read(out)
+
+        if not ret:
+            if self.reconnect:
+                print(f"Reconnecting to {self.target}")
+                self.video.release()
+                self.__open()
+            return None
+
+        return image
+
+    def release(self):
+        self.video.release()
+
+    def __open(self):
+        self.video = cv2.VideoCapture(self.target, self.api_preference)
+        if self.width:
+            self.video.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            self.video.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.is_live:
+            # Keep the driver from queueing up old frames, where the backend supports it
+            self.video.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    A class reading the images of a directory in the name order, e.g. to replay a recording frame by frame.
+    """
+    is_live = False
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, directory, loop=False):
+        self.directory = directory
+        self.loop = loop
+        self.paths = sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                            if path.lower().endswith(self.IMAGE_EXTENSIONS))
+        self.__index = 0
+
+    def read(self, out=None):
+        while self.paths:
+            if self.__index >= len(self.paths):
+                if not self.loop:
+                    return None
+                self.__index = 0
+
+            image = cv2.imread(self.paths[self.__index])
+            self.__index += 1
+            if image is None:
+                continue
+
+            if out is not None and out.shape == image.shape and out.dtype == image.dtype:
+                out[:] = image
+                return out
+
+            return image
+
+        return None
+
+
+def camera_api_preference():
+    """
+    Returns the native camera backend of the platform.
+    """
+    if sys.platform.startswith("win"):
+        return cv2.CAP_DSHOW
+    if sys.platform.startswith("linux"):
+        return cv2.CAP_V4L2
+    if sys.platform == "darwin":
+        return cv2.CAP_AVFOUNDATION
+
+    return cv2.CAP_ANY
+
+
+def open_frame_source(source, width=None, height=None, loop=False):
+    """
+    Opens a frame source from its description: a camera index (or a /dev/video* device), an image directory,
+    an RTSP/HTTP stream URL or a video file path.
+    """
+    if isinstance(source, FrameSource):
+        return source
+
+    source = str(source).strip()
+    if source.isdigit():
+        return CaptureSource(int(source), camera_api_preference(), width, height)
+    if source.startswith("/dev/video"):
+        return CaptureSource(source, camera_api_preference(), width, height)
+    if source.lower().startswith(("rtsp://", "rtsps://", "http://", "https://")):
+        return CaptureSource(source, cv2.CAP_FFMPEG, reconnect=True)
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, loop=loop)
+
+    return CaptureSource(source, cv2.CAP_ANY, is_live=False, loop=loop)
+
+
+class FrameGrabber:
+    """
+    A class reading a frame source on a background thread, so the readers always get the newest frame
+    instead of the ones queued up in the driver, and do not wait for the capture.
+
+    The frames are captured into three preallocated buffers: the newest frame, the one being copied out
+    by a reader, and the one being captured. The readers get a copy of the newest frame, so the buffers
+    are never shared. Frames of the live sources not read in time are dropped, while the recordings wait
+    for each frame to be read.
+
+    Attributes:
+    -----------
+    source : FrameSource
+        The source the frames are read from.
+    frames_captured : int
+        The number of the captured frames.
+    frames_dropped : int
+        The number of the captured frames overwritten before being read.
+    finished : bool
+        A flag set when the source has no more frames.
+
+    Methods:
+    --------
+    start(self)
+        Starts the capture thread.
+
+    stop(self)
+        Stops the capture thread.
+
+    read(self, out=None, timeout=0.1)
+        Returns a copy of the newest frame not read yet, or None if none arrived within the timeout.
+
+    get_frame_age(self)
+        Returns the time [s] since the newest frame was captured.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.finished = False
+
+        self.__buffers = [None, None, None]
+        self.__timestamps = [0.0, 0.0, 0.0]
+        self.__latest_index = None
+        self.__reading_index = None
+        self.__latest_unread = False
+        self.__condition = threading.Condition()
+        self.__stop_event = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """
+        Starts the capture thread.
+        """
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__capture_loop, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the capture thread and waits for it.
+        """
+        self.__stop_event.set()
+        with self.__condition:
+            self.__condition.notify_all()
+
+        if self.__thread is not None:
+            self.__thread.join(timeout=1.0)
+            self.__thread = None
+
+    def read(self, out=None, timeout=0.1):
+        """
+        Returns a copy of the newest frame not read yet, written into the out array if it fits,
+        or None if no new frame arrived within the timeout.
+        """
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.__latest_unread or self.finished, timeout):
+                return None
+            if not self.__latest_unread:
+                return None
+
+            self.__reading_index = self.__latest_index
+            self.__latest_unread = False
+
+        frame = self.__buffers[self.__reading_index]
+        if out is not None and out.shape == frame.shape and out.dtype == frame.dtype:
+            out[:] = frame
+        else:
+            out = frame.copy()
+
+        with self.__condition:
+            self.__reading_index = None
+            self.__condition.notify_all()
+
+        return out
+
+    def get_frame_age(self):
+        """
+        Returns the time [s] since the newest frame was captured, None if there was none yet.
+        """
+        with self.__condition:
+            if self.__latest_index is None:
+                return None
+
+            return time.perf_counter() - self.__timestamps[self.__latest_index]
+
+    def __capture_loop(self):
+        """
+        Internal method capturing the frames into the buffer which is neither the newest nor being read.
+        """
+        while not self.__stop_event.is_set():
+            with self.__condition:
+                if not self.source.is_live:
+                    # The recordings wait until their previous frame is read
+                    self.__condition.wait_for(lambda: not self.__latest_unread or self.__stop_event.is_set())
+                    if self.__stop_event.is_set():
+                        break
+                write_index = next(index for index in range(3)
+                                   if index != self.__latest_index and index != self.__reading_index)
+
+            image = self.source.read(self.__buffers[write_index])
+            if image is None:
+                if not self.source.is_live:
+                    break
+                time.sleep(0.01)
+                continue
+
+            with self.__condition:
+                self.__buffers[write_index] = image
+                self.__timestamps[write_index] = time.perf_counter()
+                if self.__latest_unread:
+                    self.frames_dropped += 1
+                self.__latest_index = write_index
+                self.__latest_unread = True
+                self.frames_captured += 1
+                self.__condition.notify_all()
+
+        with self.__condition:
+            self.finished = True
+            self.__condition.notify_all()
@@ -0,0 +1,386 @@
+import json
+import os
+import threading
+import numpy as np
+
+
+class GalleryModule:
+    """
+    A class to store a large number of face encodings in memory-mapped shards and search them
+    with an approximate nearest-neighbour (IVF) index, while identities are added and removed at runtime.
+
+    Small galleries are searched exhaustively. Once the gallery outgrows the exact search limit, the encodings
+    are clustered with k-means into inverted lists and a query only scans the lists of its closest centroids.
+
+    Attributes:
+    -----------
+    directory : str
+        The directory holding the shard files with their names files, the manifest and the index centroids.
+    dimension : int
+        The length of a single encoding.
+    shard_size : int
+        The number of encodings stored in a single shard file.
+    n_probe : int
+        The number of inverted lists scanned per query, trading the search speed for accuracy.
+    exact_search_limit : int
+        The number of encodings up to which the gallery is searched exhaustively.
+    names : list
+        The identity name stored in each slot, None for free slots.
+
+    Methods:
+    --------
+    add(self, name, encodings)
+        Adds the encodings of a given identity to the gallery.
+
+    add_batch(self, names, encodings)
+        Adds the encodings of many identities to the gallery at once.
+
+    remove(self, name)
+        Removes all the encodings of a given identity from the gallery.
+
+    search(self, encodings, exact=False)
+        Finds the closest identity and distance for each of the given encodings.
+
+    rebuild_index(self, n_lists=None)
+        Trains the inverted lists index on the currently stored encodings.
+
+    identities(self)
+        Returns the names of all the stored identities.
+    """
+    def __init__(self, directory, dimension=128, shard_size=4096, n_probe=8, exact_search_limit=2048):
+        self.directory = directory
+        self.dimension = dimension
+        self.shard_size = shard_size
+        self.n_probe = n_probe
+        self.exact_search_limit = exact_search_limit
+
+        self.names = []
+        self.__alive = np.zeros(0, dtype=bool)
+        self.__free_slots = []
+        self.__slots_by_name = {}
+        self.__shards = []
+        self.__lock = threading.RLock()
+
+        self.__centroids = None
+        self.__inverted_lists = []
+        self.__inverted_arrays = []
+        # The inverted list of each slot, -1 if it is not indexed
+        self.__slot_lists = np.zeros(0, dtype=np.int32)
+        self.__indexed_count = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.__load()
+
+    def __len__(self):
+        return int(self.__alive.sum())
+
+    def identities(self):
+        """
+        Returns the names of all the stored identities.
+        """
+        with self.__lock:
+            return sorted(self.__slots_by_name)
+
+    def add(self, name, encodings):
+        """
+        Adds the encodings of a given identity to the gallery and returns the slots they were stored in.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dimension)
+        return self.add_batch([name] * len(encodings), encodings)
+
+    def add_batch(self, names, encodings):
+        """
+        Adds the encodings with their identity names to the gallery and returns the slots they were stored in.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dimension)
+        with self.__lock:
+            slots = []
+            for name, encoding in zip(names, encodings):
+                slot = self.__allocate_slot()
+                self.__shards[slot // self.shard_size][slot % self.shard_size] = encoding
+                self.names[slot] = name
+                self.__alive[slot] = True
+                self.__slots_by_name.setdefault(name, []).append(slot)
+                slots.append(slot)
+
+            changed_shards = {slot // self.shard_size for slot in slots}
+            for shard in changed_shards:
+                self.__shards[shard].flush()
+
+            if self.__centroids is not None:
+                self.__assign_to_lists(np.array(slots, dtype=np.int64), encodings)
+            self.__save_names(changed_shards)
+
+            # Retrain the index when the gallery outgrows it, so the inverted lists stay balanced
+            if len(self) > self.exact_search_limit and len(self) > 2 * self.__indexed_count:
+                self.rebuild_index()
+
+            return slots
+
+    def remove(self, name):
+        """
+        Removes all the encodings of a given identity from the gallery and returns their number.
+        """
+        with self.__lock:
+            slots = self.__slots_by_name.pop(name, [])
+            for slot in slots:
+                self.names[slot] = None
+                self.__alive[slot] = False
+                self.__free_slots.append(slot)
+                # The slot is reused by another identity, possibly in another inverted list
+                list_index = self.__slot_lists[slot]
+                if list_index >= 0:
+                    self.__inverted_lists[list_index].remove(slot)
+                    self.__inverted_arrays[list_index] = None
+                    self.__slot_lists[slot] = -1
+
+            if slots:
+                self.__save_names({slot // self.shard_size for slot in slots})
+
+            return len(slots)
+
+    def search(self, encodings, exact=False):
+        """
+        Finds the closest stored identity for each of the given encodings.
+        Returns a list of (name, distance) tuples, (None, None) if the gallery is empty.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dimension)
+        with self.__lock:
+            if not self.__alive.any():
+                return [(None, None)] * len(encodings)
+
+            if exact or self.__centroids is None:
+                best_slots, best_distances = self.__exact_search(encodings)
+            else:
+                best_slots, best_distances = self.__index_search(encodings)
+
+            return [(self.names[slot], float(distance)) if slot >= 0 else (None, None)
+                    for slot, distance in zip(best_slots, best_distances)]
+
+    def rebuild_index(self, n_lists=None, iterations=10, seed=0):
+        """
+        Trains the inverted lists index on the currently stored encodings with k-means,
+        by default with the square root of the gallery size lists.
+        """
+        with self.__lock:
+            slots = np.flatnonzero(self.__alive)
+            self.__slot_lists[:] = -1
+            if len(slots) <= self.exact_search_limit:
+                self.__centroids = None
+                self.__inverted_lists = []
+                self.__inverted_arrays = []
+                return
+
+            if n_lists is None:
+                n_lists = int(np.sqrt(len(slots)))
+
+            encodings = self.__gather(slots)
+            rng = np.random.default_rng(seed)
+            sample = encodings[rng.choice(len(encodings), size=min(len(encodings), n_lists * 64), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+            for _ in range(iterations):
+                assignments = self.__closest(sample, centroids)[0]
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, sample)
+                counts = np.bincount(assignments, minlength=n_lists)
+                non_empty = counts > 0
+                centroids[non_empty] = sums[non_empty] / counts[non_empty, np.newaxis]
+
+            self.__centroids = centroids
+            self.__inverted_lists = [[] for _ in range(n_lists)]
+            self.__inverted_arrays = [None] * n_lists
+            self.__assign_to_lists(slots, encodings)
+            self.__indexed_count = len(slots)
+            np.save(os.path.join(self.directory, 'centroids.npy'), centroids)
+
+    def __exact_search(self, encodings):
+        """
+        Internal method comparing the encodings with every stored encoding, shard by shard.
+        """
+        best_slots = np.full(len(encodings), -1, dtype=np.int64)
+        best_distances = np.full(len(encodings), np.inf, dtype=np.float32)
+
+        for shard_index, shard in enumerate(self.__shards):
+            first_slot = shard_index * self.shard_size
+            alive = self.__alive[first_slot:first_slot + self.shard_size]
+            if not alive.any():
+                continue
+
+            offsets = np.flatnonzero(alive)
+            shard_slots, shard_distances = self.__closest(encodings, shard[offsets])
+            improved = shard_distances < best_distances
+            best_slots[improved] = first_slot + offsets[shard_slots[improved]]
+            best_distances[improved] = shard_distances[improved]
+
+        return best_slots, np.sqrt(np.maximum(best_distances, 0.0))
+
+    def __index_search(self, encodings):
+        """
+        Internal method comparing each encoding only with the inverted lists of its closest centroids.
+        """
+        n_probe = min(self.n_probe, len(self.__centroids))
+        centroid_distances = self.__squared_distances(encodings, self.__centroids)
+        probed_lists = np.argpartition(centroid_distances, n_probe - 1, axis=1)[:, :n_probe]
+
+        best_slots = np.full(len(encodings), -1, dtype=np.int64)
+        best_distances = np.full(len(encodings), np.inf, dtype=np.float32)
+        for query_index, lists in enumerate(probed_lists):
+            candidates = np.concatenate([self.__inverted_array(list_index) for list_index in lists])
+            candidates = candidates[self.__alive[candidates]]
+            if len(candidates) == 0:
+                continue
+
+            candidate_index, distance = self.__closest(encodings[query_index:query_index + 1],
+                                                       self.__gather(candidates))
+            best_slots[query_index] = candidates[candidate_index[0]]
+            best_distances[query_index] = distance[0]
+
+        return best_slots, np.sqrt(np.maximum(best_distances, 0.0))
+
+    def __inverted_array(self, list_index):
+        """
+        Internal method returning the slots of an inverted list as an array, cached until the list changes.
+        """
+        if self.__inverted_arrays[list_index] is None:
+            self.__inverted_arrays[list_index] = np.array(self.__inverted_lists[list_index], dtype=np.int64)
+
+        return self.__inverted_arrays[list_index]
+
+    def __assign_to_lists(self, slots, encodings):
+        """
+        Internal method adding the slots to the inverted lists of their closest centroids.
+        """
+        assignments = self.__closest(encodings, self.__centroids)[0]
+        for slot, list_index in zip(slots, assignments):
+            self.__inverted_lists[list_index].append(int(slot))
+            self.__inverted_arrays[list_index] = None
+            self.__slot_lists[slot] = list_index
+
+    def __gather(self, slots):
+        """
+        Internal method reading the encodings of the given slots from the shards.
+        """
+        encodings = np.empty((len(slots), self.dimension), dtype=np.float32)
+        shard_indexes = slots // self.shard_size
+        for shard_index in np.unique(shard_indexes):
+            positions = np.flatnonzero(shard_indexes == shard_index)
+            encodings[positions] = self.__shards[shard_index][slots[positions] % self.shard_size]
+
+        return encodings
+
+    def __allocate_slot(self):
+        """
+        Internal method returning a free slot, creating a new shard file if all of them are taken.
+        """
+        if self.__free_slots:
+            return self.__free_slots.pop()
+
+        shard_index = len(self.__shards)
+        self.__shards.append(np.lib.format.open_memmap(self.__shard_path(shard_index), mode='w+', dtype=np.float32,
+                                                       shape=(self.shard_size, self.dimension)))
+        first_slot = shard_index * self.shard_size
+        self.names.extend([None] * self.shard_size)
+        self.__alive = np.concatenate([self.__alive, np.zeros(self.shard_size, dtype=bool)])
+        self.__slot_lists = np.concatenate([self.__slot_lists, np.full(self.shard_size, -1, dtype=np.int32)])
+        self.__free_slots.extend(range(first_slot + self.shard_size - 1, first_slot - 1, -1))
+        self.__save_manifest()
+        return self.__free_slots.pop()
+
+    def __shard_path(self, shard_index):
+        return os.path.join(self.directory, f'shard_{shard_index:05d}.npy')
+
+    def __names_path(self, shard_index):
+        return os.path.join(self.directory, f'names_{shard_index:05d}.json')
+
+    def __save_manifest(self):
+        """
+        Internal method storing the layout of the gallery, replacing the previous manifest atomically.
+        It only changes when a shard is added, the names are stored per shard.
+        """
+        self.__write_json(os.path.join(self.directory, 'manifest.json'),
+                          {'dimension': self.dimension, 'shard_size': self.shard_size, 'shards': len(self.__shards)})
+
+    def __save_names(self, shard_indexes):
+        """
+        Internal method storing the names of the slots of the changed shards only, so an enrollment rewrites
+        a single shard's names instead of the names of the whole gallery.
+        """
+        for shard_index in shard_indexes:
+            first_slot = shard_index * self.shard_size
+            self.__write_json(self.__names_path(shard_index), self.names[first_slot:first_slot + self.shard_size])
+
+    @staticmethod
+    def __write_json(path, data):
+        """
+        Internal method writing a JSON file, replacing the previous one atomically.
+        """
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+
+        os.replace(path + '.tmp', path)
+
+    def __load(self):
+        """
+        Internal method opening the existing shards, manifest and index centroids of the gallery directory.
+        """
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        if manifest['dimension'] != self.dimension or manifest['shard_size'] != self.shard_size:
+            raise ValueError(f"Gallery in {self.directory} was created with a different dimension or shard size")
+
+        self.__shards = [np.load(self.__shard_path(shard_index), mmap_mode='r+')
+                         for shard_index in range(manifest['shards'])]
+        if 'names' in manifest:
+            # The earlier galleries kept all the names in the manifest
+            self.names = manifest['names']
+            self.__save_names(range(len(self.__shards)))
+            self.__save_manifest()
+        else:
+            self.names = []
+            for shard_index in range(len(self.__shards)):
+                names_path = self.__names_path(shard_index)
+                if os.path.exists(names_path):
+                    with open(names_path) as f:
+                        self.names.extend(json.load(f))
+                else:
+                    self.names.extend([None] * self.shard_size)
+
+        self.__alive = np.array([name is not None for name in self.names], dtype=bool)
+        self.__slot_lists = np.full(len(self.names), -1, dtype=np.int32)
+        self.__free_slots = [slot for slot in range(len(self.names) - 1, -1, -1) if self.names[slot] is None]
+        for slot, name in enumerate(self.names):
+            if name is not None:
+                self.__slots_by_name.setdefault(name, []).append(slot)
+
+        centroids_path = os.path.join(self.directory, 'centroids.npy')
+        if os.path.exists(centroids_path) and len(self) > self.exact_search_limit:
+            self.__centroids = np.load(centroids_path)
+            self.__inverted_lists = [[] for _ in range(len(self.__centroids))]
+            self.__inverted_arrays = [None] * len(self.__centroids)
+            slots = np.flatnonzero(self.__alive)
+            self.__assign_to_lists(slots, self.__gather(slots))
+            self.__indexed_count = len(slots)
+
+    @classmethod
+    def __closest(cls, encodings, references):
+        """
+        Internal method returning the index of the closest reference and its squared distance for each encoding.
+        """
+        squared_distances = cls.__squared_distances(encodings, references)
+        closest = np.argmin(squared_distances, axis=1)
+        return closest, squared_distances[np.arange(len(encodings)), closest]
+
+    @staticmethod
+    def __squared_distances(encodings, references):
+        """
+        Internal method computing the squared euclidean distances of all the pairs with one matrix product.
+        """
+        return (np.einsum('ij,ij->i', encodings, encodings)[:, np.newaxis]
+                + np.einsum('ij,ij->i', references, references)[np.newaxis, :]
+                - 2.0 * encodings @ references.T)
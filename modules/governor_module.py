@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+
+
+class GovernorModule:
+    """
+    A class to keep the face detection within a frame time budget, by moving along a ladder of operating points
+    from the most accurate to the cheapest one, so the same build uses the headroom of a GPU unit and stays
+    responsive on a CPU-only one.
+
+    The latency of every detection call is observed, and the mean latency of the recent calls (the full detections
+    and the cheap tracking in between) is compared with the budget. The quality is lowered as soon as a few calls
+    are over the budget on average, and raised only after a full window of calls well under the budget and
+    a cooldown since the previous change, so the operating point does not oscillate between two levels.
+
+    Attributes:
+    -----------
+    apply_function : callable
+        The function applying an operating point, called with its settings as keyword arguments.
+    frame_budget : float
+        The target latency [s] of the face detection per frame.
+    ladder : list
+        The operating points, dictionaries of the settings passed to the apply function, from the most accurate.
+        DEFAULT_LADDER moves from dlib's CNN to its HOG model, YUNET_LADDER keeps OpenCV's YuNet model,
+        and ladder_for fits them to the configured backend.
+    window : int
+        The number of the recent calls the mean latency is computed from before raising the quality.
+    min_samples : int
+        The number of the calls after a change needed before lowering the quality.
+    upgrade_ratio : float
+        The fraction of the budget the mean latency has to stay under to raise the quality.
+    cooldown : float
+        The minimal time [s] between a change and raising the quality.
+    level : int
+        The index of the current operating point on the ladder.
+    reason : str
+        The reason of the last change of the operating point.
+    changes : list
+        The history of the changes as (time, level, reason) tuples.
+
+    Methods:
+    --------
+    observe(self, duration, now=None)
+        Records the latency of a detection call and changes the operating point if needed.
+
+    governed(self, function)
+        Returns the detection function wrapped with the latency observation.
+
+    set_level(self, level, reason)
+        Moves to the given operating point.
+
+    get_state(self)
+        Returns the current operating point, the measured latency and the reason of the last change.
+
+    ladder_for(operating_point)
+        Returns the ladder of the backend family of the configured operating point, starting at it.
+    """
+    DEFAULT_LADDER = [
+        {'model': 'cnn', 'detection_scale': 1.0, 'upsample': 1, 'detection_interval': 5},
+        {'model': 'cnn', 'detection_scale': 0.5, 'upsample': 1, 'detection_interval': 10},
+        {'model': 'hog', 'detection_scale': 0.5, 'upsample': 1, 'detection_interval': 10},
+        {'model': 'hog', 'detection_scale': 0.5, 'upsample': 0, 'detection_interval': 15},
+        {'model': 'hog', 'detection_scale': 0.25, 'upsample': 0, 'detection_interval': 30},
+    ]
+    # For the CPU-only units with the YuNet model, which does not upsample
+    YUNET_LADDER = [
+        {'model': 'yunet', 'detection_scale': 1.0, 'upsample': 0, 'detection_interval': 5},
+        {'model': 'yunet', 'detection_scale': 0.75, 'upsample': 0, 'detection_interval': 10},
+        {'model': 'yunet', 'detection_scale': 0.5, 'upsample': 0, 'detection_interval': 10},
+        {'model': 'yunet', 'detection_scale': 0.5, 'upsample': 0, 'detection_interval': 20},
+        {'model': 'yunet', 'detection_scale': 0.25, 'upsample': 0, 'detection_interval': 30},
+    ]
+    # The rough relative cost of a detection with each model, to order the operating points
+    MODEL_COSTS = {'cnn': 8.0, 'hog': 1.0, 'yunet': 0.5}
+    # The models each backend may move to, the CNN model falls back to the cheaper HOG one but not the other way
+    MODEL_FAMILIES = {'cnn': ('cnn', 'hog'), 'hog': ('hog',), 'yunet': ('yunet',)}
+
+    def __init__(self, apply_function, frame_budget=1 / 15, ladder=None, start_level=0, window=30, min_samples=5,
+                 upgrade_ratio=0.5, cooldown=10.0, start_reason="initial operating point"):
+        self.apply_function = apply_function
+        self.frame_budget = frame_budget
+        self.ladder = ladder if ladder is not None else self.DEFAULT_LADDER
+        self.window = max(1, window)
+        self.min_samples = max(1, min(min_samples, self.window))
+        self.upgrade_ratio = upgrade_ratio
+        self.cooldown = cooldown
+
+        self.level = None
+        self.reason = None
+        self.changes = []
+        self.__durations = deque(maxlen=self.window)
+        self.__last_change_time = time.monotonic()
+        self.__lock = threading.Lock()
+        self.set_level(start_level, start_reason)
+
+    def observe(self, duration, now=None):
+        """
+        Records the latency [s] of a detection call, and lowers or raises the quality when the mean latency
+        of the recent calls is over the budget, or well under it for long enough.
+        """
+        now = time.monotonic() if now is None else now
+        with self.__lock:
+            self.__durations.append(duration)
+            if len(self.__durations) < self.min_samples:
+                return
+
+            mean_duration = sum(self.__durations) / len(self.__durations)
+            if mean_duration > self.frame_budget and self.level < len(self.ladder) - 1:
+                self.__change_level(self.level + 1, now, f"mean detection latency {mean_duration * 1000:.1f} ms "
+                                                         f"over the {self.frame_budget * 1000:.1f} ms budget")
+            elif (mean_duration < self.frame_budget * self.upgrade_ratio and self.level > 0
+                  and len(self.__durations) == self.window and now - self.__last_change_time >= self.cooldown):
+                self.__change_level(self.level - 1, now, f"mean detection latency {mean_duration * 1000:.1f} ms "
+                                                         f"under {self.upgrade_ratio:.0%} of the "
+                                                         f"{self.frame_budget * 1000:.1f} ms budget")
+
+    def governed(self, function):
+        """
+        Returns the detection function wrapped with the latency observation.
+        """
+        def governed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+
+        return governed_function
+
+    def set_level(self, level, reason):
+        """
+        Moves to the given operating point, e.g. to pin it manually.
+        """
+        with self.__lock:
+            self.__change_level(max(0, min(level, len(self.ladder) - 1)), time.monotonic(), reason)
+
+    def get_state(self):
+        """
+        Returns the current level and operating point, the mean latency [s] of the recent calls,
+        the budget [s] and the reason of the last change.
+        """
+        with self.__lock:
+            mean_duration = sum(self.__durations) / len(self.__durations) if self.__durations else None
+            return {
+                'level': self.level,
+                'operating_point': dict(self.ladder[self.level]),
+                'mean_latency': mean_duration,
+                'frame_budget': self.frame_budget,
+                'reason': self.reason,
+            }
+
+    @classmethod
+    def ladder_for(cls, operating_point):
+        """
+        Returns the ladder of the models the configured backend may move to, with the configured operating point
+        in its place by the estimated cost, and the level of the configured operating point to start from.
+        """
+        operating_point = dict(operating_point)
+        if operating_point['model'] == 'yunet':
+            operating_point['upsample'] = 0  # YuNet does not upsample
+
+        def cost(point):
+            return (cls.MODEL_COSTS.get(point['model'], 1.0) * (point['detection_scale'] * 2 ** point['upsample']) ** 2
+                    / max(1, point['detection_interval']))
+
+        family = cls.MODEL_FAMILIES.get(operating_point['model'], (operating_point['model'],))
+        ladder = [point for point in (cls.YUNET_LADDER if operating_point['model'] == 'yunet' else cls.DEFAULT_LADDER)
+                  if point['model'] in family and point != operating_point]
+        start_level = next((level for level, point in enumerate(ladder) if cost(point) < cost(operating_point)),
+                           len(ladder))
+        ladder.insert(start_level, operating_point)
+        return ladder, start_level
+
+    def __change_level(self, level, now, reason):
+        """
+        Internal method applying the operating point, and measuring the latency anew as it has changed.
+        """
+        self.apply_function(**self.ladder[level])
+        self.level = level
+        self.reason = reason
+        self.changes.append((now, level, reason))
+        self.__durations.clear()
+        self.__last_change_time = now
+        print(f"Face detection quality level {level} {self.ladder[level]}: {reason}")
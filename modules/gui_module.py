@@ -1,5 +1,7 @@
+import time
 import cv2
 import numpy as np
+from modules.frame_source_module import FrameGrabber, open_frame_source
 
 
 class GUIModule:
@@ -8,8 +10,11 @@ class GUIModule:
 
     Attributes:
     -----------
-    video : cv2.VideoCapture
-        The video capture object for camera access.
+    frame_sources : list
+        The sources of the frames (cameras, video files, image directories or streams), one per camera stream,
+        empty if the GUI does not capture the frames itself.
+    frame_grabbers : list
+        The background readers keeping only the newest frame of each source, empty if the sources are read directly.
     frame_thickness : int
         The thickness of the frames for drawn objects.
     font_thickness : int
@@ -22,21 +27,44 @@ class GUIModule:
         The colour of the text in the GUI.
     show_shopping_list : bool
         Flag to control the visibility of the shopping list in the GUI.
+    show_metrics : bool
+        Flag to control the visibility of the measured stage rates and latencies in the GUI.
 
     Methods:
     --------
     get_image_frame(self)
         Captures an image frame from the camera and returns it along with any key pressed.
 
+    read_frame(self)
+        Returns the newest image frame of the first frame source.
+
+    read_frames(self, timeout=0.1)
+        Returns the newest image frames of all the camera streams.
+
+    show_frame(self, image, stream_id=0)
+        Displays the image frame in the window of its camera stream.
+
+    poll_key(self)
+        Returns the key pressed in the GUI window.
+
     display_detected_objects(self, image, detected_faces=None, detected_barcodes=None)
         Draws detected faces and barcodes on the image frame.
 
     toggle_shopping_list_visibility(self)
         Toggles the visibility of the shopping list on the GUI.
 
-    render_gui(self, image, cart: list, total_cost)
+    toggle_metrics_visibility(self)
+        Toggles the visibility of the metrics on the GUI.
+
+    render_gui(self, image, cart: list, total_cost, cart_version=None, display=True, metrics_lines=None)
         Renders the GUI overlay on the image frame.
 
+    __get_overlay(self, frame_shape, cart: list, total_cost, cart_version)
+        Internal method returning the pre-rendered overlay, rendering it again only when it changes.
+
+    __draw_metrics(self, image, metrics_lines)
+        Internal method to draw the metrics text lines in the top right corner of the image frame.
+
     __mark_face(self, image, face_location, label)
         Internal method to mark a detected face on the image frame.
 
@@ -49,10 +77,21 @@ class GUIModule:
     __darken_color(old_color: list[int], factor: float = 0.5)
         Static method to darken a given color.
     """
-    def __init__(self, camera_width, camera_height, frame_thickness=2, font_thickness=2, font_size=0.6, gui_colour=(255, 255, 255)):
-        self.video = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-        self.video.set(cv2.CAP_PROP_FRAME_WIDTH, camera_width)
-        self.video.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_height)
+    def __init__(self, camera_width, camera_height, frame_thickness=2, font_thickness=2, font_size=0.6, gui_colour=(255, 255, 255),
+                 capture_device=0, threaded_capture=True):
+        if capture_device is None:
+            capture_devices = []
+        elif isinstance(capture_device, (list, tuple)):
+            capture_devices = capture_device
+        else:
+            capture_devices = [capture_device]
+
+        self.frame_sources = [open_frame_source(device, camera_width, camera_height) for device in capture_devices]
+        self.frame_grabbers = []
+        if threaded_capture:
+            self.frame_grabbers = [FrameGrabber(frame_source) for frame_source in self.frame_sources]
+            for frame_grabber in self.frame_grabbers:
+                frame_grabber.start()
 
         self.frame_thickness = frame_thickness
         self.font_thickness = font_thickness
@@ -60,19 +99,74 @@ class GUIModule:
         self.gui_colour = gui_colour
         self.text_colour = (0, 0, 0)
         self.show_shopping_list = False
+        self.show_metrics = False
+        self.__overlay_key = None
+        self.__overlay = None
 
     def __del__(self):
-        self.video.release()
-        cv2.destroyAllWindows()
+        for frame_grabber in self.frame_grabbers:
+            frame_grabber.stop()
+        for frame_source in self.frame_sources:
+            frame_source.release()
+        if self.frame_sources:
+            cv2.destroyAllWindows()
 
     def get_image_frame(self):
         """
         Captures an image frame from the camera.
         """
-        ret, image = self.video.read()
-        key_pressed = cv2.waitKey(1) & 0xFF
+        image = self.read_frame()
+        key_pressed = self.poll_key()
         return image, key_pressed
 
+    def read_frame(self):
+        """
+        Returns the newest image frame of the first frame source, or None if no new frame could be read.
+        With the frame grabber, it waits shortly for a frame newer than the previously returned one.
+        """
+        if self.frame_grabbers:
+            return self.frame_grabbers[0].read(timeout=0.1)
+
+        if not self.frame_sources:
+            return None
+
+        return self.frame_sources[0].read()
+
+    def read_frames(self, timeout=0.1):
+        """
+        Returns the newest image frames of the camera streams as (stream_id, image) tuples, only the streams
+        with a new frame are included. With the frame grabbers, it waits up to the timeout for at least one
+        new frame. Returns None if there is no new frame.
+        """
+        if not self.frame_grabbers:
+            frames = [(stream_id, frame_source.read()) for stream_id, frame_source in enumerate(self.frame_sources)]
+            return [(stream_id, image) for stream_id, image in frames if image is not None] or None
+
+        deadline = time.perf_counter() + timeout
+        while True:
+            frames = [(stream_id, frame_grabber.read(timeout=0))
+                      for stream_id, frame_grabber in enumerate(self.frame_grabbers)]
+            frames = [(stream_id, image) for stream_id, image in frames if image is not None]
+            if frames:
+                return frames
+            if time.perf_counter() >= deadline:
+                return None
+
+            time.sleep(0.002)
+
+    def show_frame(self, image, stream_id=0):
+        """
+        Displays the image frame in the window of its camera stream.
+        """
+        cv2.imshow("Robot's Sight" if stream_id == 0 else f"Robot's Sight ({stream_id})", image)
+
+    @staticmethod
+    def poll_key():
+        """
+        Returns the key pressed in the GUI window (255 if none), must be called from the GUI thread.
+        """
+        return cv2.waitKey(1) & 0xFF
+
     def display_detected_objects(self, image, detected_faces=None, detected_barcodes=None):
         """
         Draws rectangles and labels for detected faces and barcodes on the image frame.
@@ -100,46 +194,113 @@ class GUIModule:
         """
         self.show_shopping_list = not self.show_shopping_list
 
-    def render_gui(self, image, cart: list, total_cost):
+    def toggle_metrics_visibility(self):
+        """
+        Toggles the visibility of the measured stage rates and latencies on the GUI.
+        """
+        self.show_metrics = not self.show_metrics
+
+    def render_gui(self, image, cart: list, total_cost, cart_version=None, display=True, metrics_lines=None):
         """
         Renders the GUI overlay on the image frame, including the shopping list and total cost.
+        The overlay is rendered once per cart change, and only its boxes and text pixels are drawn in place.
+        Without display, the frame is only rendered, e.g. for the headless benchmarks.
+        The metrics lines are drawn only when the metrics are shown, as they change every frame.
+        """
+        blended_regions, text_region = self.__get_overlay(image.shape, cart, total_cost, cart_version)
+
+        for (top, bottom, left, right), colour_plane in blended_regions:
+            roi = image[top:bottom, left:right]
+            cv2.addWeighted(roi, 0.5, colour_plane, 0.5, 0, dst=roi)
+
+        if text_region is not None:
+            (top, bottom, left, right), text_mask, text_plane = text_region
+            cv2.copyTo(text_plane, text_mask, dst=image[top:bottom, left:right])
+
+        if self.show_metrics and metrics_lines:
+            self.__draw_metrics(image, metrics_lines)
+
+        if display:
+            self.show_frame(image)
+
+    def __get_overlay(self, frame_shape, cart: list, total_cost, cart_version):
+        """
+        Returns the regions blended with the GUI colour, and the region, mask and colour plane of the text.
+        Without the cart version, the cart is compared by the product names.
         """
-        gui = np.zeros_like(image, np.uint8)
+        cart_key = cart_version if cart_version is not None else tuple(product['name'] for product in cart)
+        overlay_key = (cart_key, total_cost, self.show_shopping_list, frame_shape)
+        if overlay_key == self.__overlay_key:
+            return self.__overlay
+
+        frame_height, frame_width = frame_shape[:2]
         box_width = 200
         box_height = 50
-        tc_box_x = image.shape[1] - box_width
-        tc_box_y = image.shape[0] - box_height
-        cv2.rectangle(gui, (tc_box_x, tc_box_y), (tc_box_x + box_width, tc_box_y + box_height), self.gui_colour, -1)
+        tc_box_x = frame_width - box_width
+        tc_box_y = frame_height - box_height
+        # The filled rectangles include their end points
+        regions = [(max(0, tc_box_y), frame_height, max(0, tc_box_x), frame_width)]
 
         rect_x = 0
         rect_y = 0
 
         # Shopping list
         if self.show_shopping_list:
-            rect_height = image.shape[0]
-            rect_width = image.shape[1] // 2
-            cv2.rectangle(gui, (rect_x, rect_y), (rect_x + rect_width, rect_y + rect_height), self.gui_colour, -1)
-
-        alpha = 0.5
-        mask = gui.astype(bool)
-        image[mask] = cv2.addWeighted(image, alpha, gui, 1 - alpha, 0)[mask]
-
+            rect_width = frame_width // 2
+            list_region = (rect_y, frame_height, rect_x, min(frame_width, rect_x + rect_width + 1))
+            # The total cost box is blended only where it does not overlap the list
+            top, bottom, left, right = regions[0]
+            regions = [list_region, (top, bottom, max(left, list_region[3]), right)]
+
+        blended_regions = []
+        for top, bottom, left, right in regions:
+            if bottom > top and right > left:
+                colour_plane = np.empty((bottom - top, right - left, len(self.gui_colour)), np.uint8)
+                colour_plane[:] = self.gui_colour
+                blended_regions.append(((top, bottom, left, right), colour_plane))
+
+        text_mask = np.zeros((frame_height, frame_width), np.uint8)
         if self.show_shopping_list:
             element_x = 10
             element_y = 30
             for product in cart:
-                cv2.putText(image, product['name'], (rect_x + element_x, rect_y + element_y),
-                            cv2.FONT_HERSHEY_SIMPLEX, self.font_size, self.text_colour, self.font_thickness)
+                cv2.putText(text_mask, product['name'], (rect_x + element_x, rect_y + element_y),
+                            cv2.FONT_HERSHEY_SIMPLEX, self.font_size, 255, self.font_thickness, cv2.LINE_8)
                 element_y += 30
 
         # Total cart cost
         text = f'Total: {total_cost:.2f} [PLN]'
         text_x = tc_box_x + 10
         text_y = tc_box_y + 30
-        cv2.putText(image, text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX,
-                    self.font_size, self.text_colour, self.font_thickness)
-
-        cv2.imshow("Robot's Sight", image)
+        cv2.putText(text_mask, text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX,
+                    self.font_size, 255, self.font_thickness, cv2.LINE_8)
+
+        text_region = None
+        left, top, width, height = cv2.boundingRect(text_mask)
+        if width > 0 and height > 0:
+            text_plane = np.empty((height, width, len(self.text_colour)), np.uint8)
+            text_plane[:] = self.text_colour
+            text_region = ((top, top + height, left, left + width),
+                           np.ascontiguousarray(text_mask[top:top + height, left:left + width]), text_plane)
+
+        self.__overlay_key = overlay_key
+        self.__overlay = (blended_regions, text_region)
+        return self.__overlay
+
+    def __draw_metrics(self, image, metrics_lines):
+        """
+        Draws the metrics text lines in the top right corner of the image frame, outlined like the labels.
+        """
+        font_size = self.font_size * 0.75
+        line_widths = [cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, font_size, 1)[0][0] for line in metrics_lines]
+        text_x = max(0, image.shape[1] - max(line_widths) - 10)
+        text_y = 20
+        for line in metrics_lines:
+            cv2.putText(image, line, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_size, self.text_colour, 3)
+            cv2.putText(image, line, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_size, (200, 200, 200), 1)
+            text_y += 20
 
     def __mark_face(self, image, face_location, label):
         """
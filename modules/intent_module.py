@@ -0,0 +1,103 @@
+import re
+import zlib
+import numpy as np
+
+
+class IntentModule:
+    """
+    A class to map the speech-to-text output to a command key by its similarity to example phrases of each command.
+
+    The example phrases are embedded once, and each utterance is embedded and compared with all of them using
+    a single matrix product, which takes well under a millisecond on a CPU. By default, the embeddings are hashed
+    word and character n-gram counts, so no model has to be loaded; any function turning a list of texts into
+    a matrix of vectors can be used instead. Utterances which are not similar enough to any phrase are mapped
+    to 'NO_MATCH', and the uncertain ones can be passed to a fallback mapper (e.g. the local LLM).
+
+    Attributes:
+    -----------
+    embed_function : callable
+        The function turning a list of texts into a matrix of embeddings, one row per text.
+    threshold : float
+        The minimum cosine similarity of the nearest example phrase, below which 'NO_MATCH' is returned.
+    fallback_threshold : float
+        The similarity below which the fallback mapper is asked instead, if there is one.
+    fallback : callable
+        The function mapping an uncertain utterance to a command key, None to trust the nearest phrase.
+
+    Methods:
+    --------
+    classify(self, text)
+        Returns the command key of the nearest example phrase and its similarity.
+
+    obtain_command_from_stt(self, stt_output)
+        Maps the speech-to-text output to a command key, or 'NO_MATCH'.
+
+    embed_texts(texts, dimension=4096)
+        Embeds the texts as hashed word and character n-gram counts.
+    """
+    def __init__(self, command_phrases, embed_function=None, threshold=0.4, fallback_threshold=0.6, fallback=None):
+        self.embed_function = embed_function if embed_function is not None else self.embed_texts
+        self.threshold = threshold
+        self.fallback_threshold = fallback_threshold
+        self.fallback = fallback
+
+        self.__commands = []
+        phrases = []
+        for command, command_examples in command_phrases.items():
+            for phrase in command_examples:
+                self.__commands.append(command)
+                phrases.append(phrase)
+
+        self.__phrase_embeddings = self.__normalize(np.asarray(self.embed_function(phrases), dtype=np.float32))
+
+    def classify(self, text):
+        """
+        Returns the command key of the example phrase nearest to the text and their cosine similarity.
+        """
+        if not self.__commands:
+            return "NO_MATCH", 0.0
+
+        embedding = self.__normalize(np.asarray(self.embed_function([text]), dtype=np.float32))[0]
+        similarities = self.__phrase_embeddings @ embedding
+        nearest = int(np.argmax(similarities))
+        return self.__commands[nearest], float(similarities[nearest])
+
+    def obtain_command_from_stt(self, stt_output):
+        """
+        Maps the speech-to-text output to a command key, asking the fallback mapper only when unsure.
+        """
+        command, similarity = self.classify(stt_output)
+        if similarity < self.threshold:
+            return "NO_MATCH"
+
+        if similarity < self.fallback_threshold and self.fallback is not None:
+            return self.fallback(stt_output)
+
+        return command
+
+    @staticmethod
+    def embed_texts(texts, dimension=4096):
+        """
+        Embeds the texts as counts of their words, word pairs and character trigrams, hashed into a fixed dimension.
+        """
+        embeddings = np.zeros((len(texts), dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"[a-z0-9']+", text.lower())
+            features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+            for word in words:
+                padded_word = f" {word} "
+                features.extend(padded_word[start:start + 3] for start in range(len(padded_word) - 2))
+
+            for feature in features:
+                # A stable hash, so the embeddings do not depend on the interpreter's hash seed
+                embeddings[row, zlib.crc32(feature.encode('utf-8')) % dimension] += 1.0
+
+        return embeddings
+
+    @staticmethod
+    def __normalize(embeddings):
+        """
+        Internal method scaling the embeddings to unit length, so their dot products are cosine similarities.
+        """
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
@@ -0,0 +1,180 @@
+import collections
+import queue
+import threading
+import time
+import numpy as np
+import pyaudio
+
+
+class ListeningModule:
+    """
+    A class to capture the microphone continuously and cut the utterances out of it with an energy based
+    voice activity detector.
+
+    One input stream is kept open, and its chunks are passed to the detector on a worker thread. The chunks
+    preceding the speech onset are kept in a ring buffer and prepended to the utterance (pre-roll), so its
+    beginning is not cut off. An utterance ends after a period of silence, or when it gets too long.
+    The noise floor is followed on the silent chunks, so the detector adapts to the shop's background noise.
+
+    Attributes:
+    -----------
+    audio : pyaudio.PyAudio
+        The PyAudio instance the input stream is opened with.
+    rate : int
+        The sampling rate [Hz] of the captured audio.
+    chunk_size : int
+        The number of samples per captured chunk.
+    energy_ratio : float
+        How many times the chunk energy has to exceed the noise floor to be considered speech.
+    min_energy : float
+        The minimum RMS energy of speech, relative to the full scale.
+    continuous : bool
+        A flag to determine if all the utterances are kept, otherwise only the next one after arm() is.
+    is_muted : callable
+        The function telling if the captured audio should be ignored, e.g. while the robot itself is speaking.
+    utterance_queue : queue.Queue
+        The queue of the (audio, speech end time) pairs, the audio being float32 samples in [-1, 1].
+
+    Methods:
+    --------
+    start(self)
+        Opens the input stream and starts the detector thread.
+
+    stop(self)
+        Closes the input stream and stops the detector thread.
+
+    arm(self)
+        Keeps the next utterance, when not listening continuously.
+
+    process_chunk(self, samples, timestamp)
+        Passes a chunk of samples through the detector, returning a finished utterance or None.
+    """
+    def __init__(self, audio, rate=16000, chunk_size=512, pre_roll=0.3, speech_onset=0.1, silence_duration=0.5,
+                 max_utterance=10.0, energy_ratio=3.0, min_energy=0.01, continuous=False,
+                 is_muted=None):
+        self.audio = audio
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.continuous = continuous
+        self.is_muted = is_muted
+        self.utterance_queue = queue.Queue()
+
+        chunk_duration = chunk_size / rate
+        self.__pre_roll = collections.deque(maxlen=max(1, round(pre_roll / chunk_duration)))
+        self.__onset_chunks = max(1, round(speech_onset / chunk_duration))
+        self.__silence_chunks = max(1, round(silence_duration / chunk_duration))
+        self.__max_chunks = max(1, round(max_utterance / chunk_duration))
+
+        self.__noise_energy = min_energy / energy_ratio
+        self.__loud_chunks = 0
+        self.__silent_chunks = 0
+        self.__segment = None
+        self.__speech_end_time = None
+        self.__armed = False
+
+        self.__chunk_queue = queue.Queue()
+        self.__stream = None
+        self.__thread = None
+
+    def start(self):
+        """
+        Opens the input stream and starts the detector thread.
+        """
+        if self.__stream is not None:
+            return
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        self.__stream = self.audio.open(format=pyaudio.paInt16,
+                                        channels=1,
+                                        rate=self.rate,
+                                        input=True,
+                                        frames_per_buffer=self.chunk_size,
+                                        stream_callback=self.__on_chunk)
+
+    def stop(self):
+        """
+        Closes the input stream and stops the detector thread.
+        """
+        if self.__stream is not None:
+            self.__stream.stop_stream()
+            self.__stream.close()
+            self.__stream = None
+            self.__chunk_queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def arm(self):
+        """
+        Keeps the next utterance, when not listening continuously. The pre-roll still covers the speech
+        started just before.
+        """
+        self.__armed = True
+
+    def process_chunk(self, samples, timestamp):
+        """
+        Passes a chunk of float32 samples, captured at the given time, through the detector.
+        Returns the (audio, speech end time) pair of a finished utterance, or None.
+        """
+        energy = float(np.sqrt(np.mean(np.square(samples)))) if len(samples) else 0.0
+        is_loud = energy > max(self.min_energy, self.__noise_energy * self.energy_ratio)
+
+        if self.__segment is None:
+            self.__pre_roll.append(samples)
+            if is_loud:
+                self.__loud_chunks += 1
+            else:
+                self.__loud_chunks = 0
+                self.__noise_energy = 0.95 * self.__noise_energy + 0.05 * energy
+
+            if self.__loud_chunks >= self.__onset_chunks:
+                self.__segment = list(self.__pre_roll)
+                self.__pre_roll.clear()
+                self.__silent_chunks = 0
+                self.__speech_end_time = timestamp
+            return None
+
+        self.__segment.append(samples)
+        if is_loud:
+            self.__silent_chunks = 0
+            self.__speech_end_time = timestamp
+        else:
+            self.__silent_chunks += 1
+
+        if self.__silent_chunks < self.__silence_chunks and len(self.__segment) < self.__max_chunks:
+            return None
+
+        utterance = np.concatenate(self.__segment)
+        self.__segment = None
+        self.__loud_chunks = 0
+        return utterance, self.__speech_end_time
+
+    def __on_chunk(self, in_data, frame_count, time_info, status):
+        """
+        Internal method receiving the captured chunks from the stream, handing them over to the detector thread.
+        """
+        self.__chunk_queue.put((in_data, time.monotonic()))
+        return None, pyaudio.paContinue
+
+    def __run(self):
+        """
+        Internal method running the detector on the captured chunks until the listening is stopped.
+        """
+        while True:
+            item = self.__chunk_queue.get()
+            if item is None:
+                break
+
+            in_data, timestamp = item
+            if self.is_muted is not None and self.is_muted():
+                self.__segment = None
+                self.__loud_chunks = 0
+                continue
+
+            samples = np.frombuffer(in_data, dtype=np.int16).astype(np.float32) / 32768.0
+            result = self.process_chunk(samples, timestamp)
+            if result is not None and (self.continuous or self.__armed):
+                self.__armed = False
+                self.utterance_queue.put(result)
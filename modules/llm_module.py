@@ -1,3 +1,5 @@
+import time
+import numpy as np
 from llama_cpp import Llama
 
 
@@ -9,8 +11,16 @@ class LlmModule:
     -----------
     llm : Llama
         An instance of the Llama model for language processing.
+    available_functions : dict
+        The dictionary of the available functions, whose keys are the commands the input is mapped to.
     mapping_keys : str
         Comma-separated string of keys for available functions.
+    constrained : bool
+        A flag to determine if the commands should be scored instead of generated, so the result is always valid.
+    last_timings : dict
+        The prompt tokens count, prompt evaluation and generation times [s] of the last command mapping.
+    should_cancel : callable
+        The function polled during the command mapping, which stops it early by returning True.
     max_tokens : int
         The maximum number of tokens to generate in each completion.
     stop : list
@@ -27,16 +37,31 @@ class LlmModule:
     obtain_command_from_stt(self, stt_output)
         Processes speech-to-text output to obtain a relevant command from the LLM.
 
+    score_commands(self, stt_output)
+        Scores every command key as the answer and returns the most likely one with its confidence.
+
+    set_available_functions(self, available_functions)
+        Replaces the available functions and evaluates the new prompt prefix.
+
     test_simple_completion(self)
         Tests the LLM with a simple completion task.
     """
-    def __init__(self, llm_path, available_functions=None, layers_on_gpu=0):
+    def __init__(self, llm_path, available_functions=None, layers_on_gpu=0, constrained=False):
+        # Scoring needs the logits of every evaluated token, not only of the last one
         self.llm = Llama(model_path=llm_path,
                          n_gpu_layers=layers_on_gpu,
-                         use_mlock=True)
+                         use_mlock=True,
+                         logits_all=constrained)
+        self.constrained = constrained
 
-        if available_functions is not None:
-            self.mapping_keys = ', '.join(available_functions.keys())
+        self.available_functions = None
+        self.mapping_keys = ""
+        self.last_timings = None
+        self.should_cancel = None
+        self.__prompt_prefix = None
+        self.__prefix_state = None
+        self.__prefix_keys = None
+        self.__candidate_tokens = None
 
         self.max_tokens = 7
         self.stop = [".", ",", ";", "\n"]
@@ -44,31 +69,160 @@ class LlmModule:
         self.frequency_penalty = 0.5
         self.presence_penalty = 0.5
 
+        if available_functions is not None:
+            self.set_available_functions(available_functions)
+
+    def set_available_functions(self, available_functions):
+        """
+        Replaces the available functions and evaluates the instruction and examples part of the prompt,
+        which is identical for all the inputs, saving the model state after it.
+        """
+        self.available_functions = available_functions
+        self.__prefix_keys = tuple(available_functions.keys())
+        self.mapping_keys = ', '.join(self.__prefix_keys)
+        self.__prompt_prefix = ("I am a command mapping machine. "
+                                "I need to identify the most relevant command key for a given input. "
+                                "I can only respond with a single command key from the following list or 'NO_MATCH' "
+                                f"if no relevant command is found: {self.mapping_keys}.\n"
+                                "Input: Turn on the shopping list\n"
+                                "Output: toggle_shopping_list\n"
+                                "Input: System turn off\n"
+                                "Output: quit_application\n"
+                                "Input: What do you think?\n"
+                                "Output: NO_MATCH\n")
+        # Each answer is followed by the line break, so a key cannot win by being the beginning of a longer one
+        self.__candidate_tokens = {candidate: self.llm.tokenize(f"{candidate}\n".encode('utf-8'), add_bos=False)
+                                   for candidate in self.__prefix_keys + ("NO_MATCH",)}
+
+        self.llm.reset()
+        self.llm.eval(self.llm.tokenize(self.__prompt_prefix.encode('utf-8')))
+        self.__prefix_state = self.llm.save_state()
+
     def obtain_command_from_stt(self, stt_output):
         """
         Processes speech-to-text output to identify a relevant command.
+        Only the input part of the prompt is evaluated, the model state after the prefix is restored from the cache.
+        """
+        if self.constrained:
+            return self.score_commands(stt_output)[0]
+
+        self.__update_prefix()
+        if self.__prefix_state is not None:
+            # The completion finds the restored prefix tokens and evaluates only the remaining ones
+            self.llm.load_state(self.__prefix_state)
+
+        prompt = (self.__prompt_prefix or "") + f"Input: {stt_output}\nOutput: "
+
+        start_time = time.perf_counter()
+        first_token_time = None
+        response = ""
+        for chunk in self.llm.create_completion(
+                prompt=prompt,
+                stop=self.stop,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                frequency_penalty=self.frequency_penalty,
+                presence_penalty=self.presence_penalty,
+                stream=True):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            response += chunk['choices'][0]['text']
+            if self.should_cancel is not None and self.should_cancel():
+                return "NO_MATCH"
+
+        end_time = time.perf_counter()
+        if first_token_time is None:
+            first_token_time = end_time
+
+        self.last_timings = {
+            'prompt_tokens': len(self.llm.tokenize(prompt.encode('utf-8'))),
+            'cached_tokens': self.__prefix_state.n_tokens if self.__prefix_state is not None else 0,
+            'prompt_eval': first_token_time - start_time,
+            'generation': end_time - first_token_time,
+        }
+        self.__print_timings()
+        return response.strip()
+
+    def __update_prefix(self):
+        """
+        Internal method evaluating the prompt prefix again if the commands were added or removed since.
         """
-        llm_response = self.llm.create_completion(
-            prompt="I am a command mapping machine. "
-                   "I need to identify the most relevant command key for a given input. "
-                   "I can only respond with a single command key from the following list or 'NO_MATCH' "
-                   f"if no relevant command is found: {self.mapping_keys}.\n"
-                   "Input: Turn on the shopping list\n"
-                   "Output: toggle_list\n"
-                   "Input: System turn off\n"
-                   "Output: quit_appication\n"
-                   "Input: What do you think?\n"
-                   "Output: NO_MATCH\n"
-                   f"Input: {stt_output}\n"
-                   "Output: ",
-            stop=self.stop,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            frequency_penalty=self.frequency_penalty,
-            presence_penalty=self.presence_penalty)
-
-        response = llm_response['choices'][0]['text'].strip()
-        return response
+        if self.available_functions is not None and tuple(self.available_functions.keys()) != self.__prefix_keys:
+            self.set_available_functions(self.available_functions)
+
+    def __print_timings(self):
+        """
+        Internal method printing the timings of the last command mapping.
+        """
+        print(f"LLM prompt evaluation: {self.last_timings['prompt_eval']:.3f} s "
+              f"({self.last_timings['cached_tokens']} of {self.last_timings['prompt_tokens']} tokens cached), "
+              f"generation: {self.last_timings['generation']:.3f} s")
+
+    @staticmethod
+    def __log_softmax(logits):
+        """
+        Internal method converting the logits to log-probabilities.
+        """
+        logits = np.asarray(logits, dtype=np.float64)
+        shifted = logits - logits.max(axis=-1, keepdims=True)
+        return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+    def score_commands(self, stt_output):
+        """
+        Scores the log-likelihood of every command key and 'NO_MATCH' following the input, instead of sampling
+        the answer token by token. Returns the most likely key with its probability among all the keys.
+        """
+        self.__update_prefix()
+        if self.__candidate_tokens is None:
+            return "NO_MATCH", 0.0
+
+        start_time = time.perf_counter()
+        prompt_tokens = self.llm.tokenize(
+            ((self.__prompt_prefix or "") + f"Input: {stt_output}\nOutput:").encode('utf-8'))
+        cached_tokens = 0
+        if self.__prefix_state is not None:
+            self.llm.load_state(self.__prefix_state)
+            # The input ids are the whole context sized buffer, only its first n_tokens are evaluated
+            prefix_tokens = self.__prefix_state.n_tokens
+            if self.llm.input_ids[:prefix_tokens].tolist() == prompt_tokens[:prefix_tokens]:
+                cached_tokens = prefix_tokens
+
+        self.llm.n_tokens = cached_tokens
+        self.llm.eval(prompt_tokens[cached_tokens:])
+        input_end = self.llm.n_tokens
+        first_token_log_probs = self.__log_softmax(self.llm.scores[input_end - 1])
+        scoring_start_time = time.perf_counter()
+
+        candidates = list(self.__candidate_tokens)
+        log_likelihoods = np.empty(len(candidates))
+        for index, candidate in enumerate(candidates):
+            if self.should_cancel is not None and self.should_cancel():
+                return "NO_MATCH", 0.0
+
+            tokens = self.__candidate_tokens[candidate]
+            log_likelihood = first_token_log_probs[tokens[0]]
+            if len(tokens) > 1:
+                # Rewinding to the end of the input lets all the candidates share its evaluated state
+                self.llm.n_tokens = input_end
+                self.llm.eval(tokens[:-1])
+                log_probs = self.__log_softmax(self.llm.scores[input_end:input_end + len(tokens) - 1])
+                log_likelihood += log_probs[np.arange(len(tokens) - 1), tokens[1:]].sum()
+
+            log_likelihoods[index] = log_likelihood
+
+        end_time = time.perf_counter()
+        confidences = np.exp(log_likelihoods - log_likelihoods.max())
+        confidences /= confidences.sum()
+        best = int(np.argmax(confidences))
+
+        self.last_timings = {
+            'prompt_tokens': len(prompt_tokens),
+            'cached_tokens': cached_tokens,
+            'prompt_eval': scoring_start_time - start_time,
+            'generation': end_time - scoring_start_time,
+        }
+        self.__print_timings()
+        return candidates[best], float(confidences[best])
 
     def test_simple_completion(self):
         """
@@ -0,0 +1,294 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+
+class MetricsModule:
+    """
+    A class to measure the latency of the application stages and to count the events, with a low overhead.
+
+    Every stage keeps the latencies of its last observations in a preallocated ring buffer, from which the rolling
+    percentiles and rates are computed on demand, and the cumulative histogram buckets exported to Prometheus.
+    The metrics can be served in the Prometheus text format on a local HTTP endpoint, and appended periodically
+    to a JSON-lines log.
+
+    Attributes:
+    -----------
+    window : int
+        The number of the latest observations of each stage the rolling statistics are computed from.
+    buckets : tuple
+        The upper bounds [s] of the exported latency histogram buckets.
+    port : int
+        The port of the local metrics endpoint, None to not serve the metrics.
+    host : str
+        The address the metrics endpoint is bound to.
+    log_file : str
+        The path of the JSON-lines log, None to not log the metrics.
+    log_interval : float
+        The time [s] between the log entries.
+
+    Methods:
+    --------
+    start(self)
+        Starts the metrics endpoint and the logging thread.
+
+    stop(self)
+        Stops the metrics endpoint and the logging thread.
+
+    observe(self, stage, duration)
+        Records a latency of a stage.
+
+    increment(self, counter, amount=1)
+        Increments an event counter.
+
+    timer(self, stage)
+        Context manager measuring the latency of the wrapped block.
+
+    timed(self, stage, function)
+        Returns the function wrapped with the latency measurement.
+
+    get_summary(self)
+        Returns the rolling latency percentiles and rates of the stages, and the counters.
+
+    get_overlay_lines(self)
+        Returns the short text lines of the rolling statistics, for the GUI overlay.
+
+    to_prometheus(self)
+        Returns the metrics in the Prometheus text exposition format.
+    """
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, window=1000, buckets=DEFAULT_BUCKETS, port=None, host="127.0.0.1", log_file=None,
+                 log_interval=10.0):
+        self.window = max(1, window)
+        self.buckets = tuple(sorted(buckets))
+        self.port = port
+        self.host = host
+        self.log_file = log_file
+        self.log_interval = log_interval
+
+        self.__lock = threading.Lock()
+        self.__stages = {}
+        self.__counters = {}
+        self.__server = None
+        self.__stop_event = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        """
+        Starts serving the metrics on the local endpoint and logging them, if configured.
+        """
+        self.__stop_event.clear()
+        if self.port is not None:
+            try:
+                self.__server = ThreadingHTTPServer((self.host, self.port), self.__make_handler())
+            except OSError as e:
+                # E.g. the port is taken, the overlay and the log still work without the endpoint
+                print(f"Error serving the metrics on {self.host}:{self.port}, the endpoint is disabled: {e}")
+                self.__server = None
+
+        if self.__server is not None:
+            self.__server.daemon_threads = True
+            # With the port 0, any free port is bound
+            self.port = self.__server.server_address[1]
+            self.__threads.append(threading.Thread(target=self.__server.serve_forever, daemon=True))
+            print(f"Serving the metrics on http://{self.host}:{self.port}/metrics")
+
+        if self.log_file is not None:
+            self.__threads.append(threading.Thread(target=self.__log_loop, daemon=True))
+
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stops the metrics endpoint, and writes the last log entry.
+        """
+        self.__stop_event.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+        for thread in self.__threads:
+            thread.join(timeout=1.0)
+
+        self.__threads = []
+
+    def observe(self, stage, duration):
+        """
+        Records a latency [s] of a stage.
+        """
+        now = time.perf_counter()
+        with self.__lock:
+            stage_metrics = self.__stages.get(stage)
+            if stage_metrics is None:
+                stage_metrics = self.__stages[stage] = {
+                    'durations': np.zeros(self.window),
+                    'timestamps': np.zeros(self.window),
+                    'bucket_counts': [0] * (len(self.buckets) + 1),
+                    'count': 0,
+                    'sum': 0.0,
+                }
+
+            index = stage_metrics['count'] % self.window
+            stage_metrics['durations'][index] = duration
+            stage_metrics['timestamps'][index] = now
+            stage_metrics['bucket_counts'][bisect.bisect_left(self.buckets, duration)] += 1
+            stage_metrics['count'] += 1
+            stage_metrics['sum'] += duration
+
+    def increment(self, counter, amount=1):
+        """
+        Increments an event counter.
+        """
+        with self.__lock:
+            self.__counters[counter] = self.__counters.get(counter, 0) + amount
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Measures the latency of the wrapped block as an observation of the stage, also if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage, function):
+        """
+        Returns the function wrapped with the latency measurement of the stage.
+        """
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(stage, time.perf_counter() - start)
+
+        return timed_function
+
+    def get_summary(self):
+        """
+        Returns the {stage: statistics} of the rolling window, and the {counter: value} counters.
+        The rate is the number of the observations per second within the window.
+        """
+        with self.__lock:
+            snapshot = {stage: (stage_metrics['durations'][:min(stage_metrics['count'], self.window)].copy(),
+                                stage_metrics['timestamps'][:min(stage_metrics['count'], self.window)].copy(),
+                                stage_metrics['count'])
+                        for stage, stage_metrics in self.__stages.items()}
+            counters = dict(self.__counters)
+
+        stages = {}
+        for stage, (durations, timestamps, count) in snapshot.items():
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            elapsed = timestamps.max() - timestamps.min()
+            stages[stage] = {
+                'count': count,
+                'p50_ms': float(p50 * 1000),
+                'p90_ms': float(p90 * 1000),
+                'p99_ms': float(p99 * 1000),
+                'rate': float((len(timestamps) - 1) / elapsed) if elapsed > 0 else 0.0,
+            }
+
+        return stages, counters
+
+    def get_overlay_lines(self):
+        """
+        Returns a "stage: rate/s, p50 ms" text line for every stage.
+        """
+        stages, _ = self.get_summary()
+        return [f"{stage}: {statistics['rate']:.1f}/s, {statistics['p50_ms']:.1f} ms"
+                for stage, statistics in sorted(stages.items())]
+
+    def to_prometheus(self):
+        """
+        Returns the cumulative latency histograms, the rolling percentiles and the counters
+        in the Prometheus text exposition format.
+        """
+        stages, counters = self.get_summary()
+        with self.__lock:
+            histograms = {stage: (list(stage_metrics['bucket_counts']), stage_metrics['sum'], stage_metrics['count'])
+                          for stage, stage_metrics in self.__stages.items()}
+
+        lines = ["# HELP shop_assistant_stage_latency_seconds The latency of the application stages.",
+                 "# TYPE shop_assistant_stage_latency_seconds histogram"]
+        for stage, (bucket_counts, total, count) in sorted(histograms.items()):
+            cumulative_count = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative_count += bucket_count
+                bound_label = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'shop_assistant_stage_latency_seconds_bucket{{stage="{stage}",le="{bound_label}"}} '
+                             f'{cumulative_count}')
+            lines.append(f'shop_assistant_stage_latency_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'shop_assistant_stage_latency_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += ["# HELP shop_assistant_stage_rolling_latency_seconds The latency percentiles of the latest "
+                  "observations.",
+                  "# TYPE shop_assistant_stage_rolling_latency_seconds gauge"]
+        for stage, statistics in sorted(stages.items()):
+            for quantile in ["50", "90", "99"]:
+                lines.append(f'shop_assistant_stage_rolling_latency_seconds{{stage="{stage}",quantile="0.{quantile}"}} '
+                             f'{statistics[f"p{quantile}_ms"] / 1000}')
+
+        lines += ["# HELP shop_assistant_stage_rate The observations per second of the latest observations.",
+                  "# TYPE shop_assistant_stage_rate gauge"]
+        for stage, statistics in sorted(stages.items()):
+            lines.append(f'shop_assistant_stage_rate{{stage="{stage}"}} {statistics["rate"]}')
+
+        lines += ["# HELP shop_assistant_events_total The counted application events.",
+                  "# TYPE shop_assistant_events_total counter"]
+        for counter, value in sorted(counters.items()):
+            lines.append(f'shop_assistant_events_total{{event="{counter}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def __log_loop(self):
+        """
+        Internal method appending the summary to the JSON-lines log every interval, and once more when stopped.
+        """
+        while not self.__stop_event.wait(self.log_interval):
+            self.__write_log_entry()
+
+        self.__write_log_entry()
+
+    def __write_log_entry(self):
+        """
+        Internal method appending a single summary entry to the JSON-lines log.
+        """
+        stages, counters = self.get_summary()
+        try:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({'time': time.time(), 'stages': stages, 'counters': counters}) + "\n")
+        except OSError as e:
+            print(f"Error writing the metrics log: {e}")
+
+    def __make_handler(self):
+        """
+        Internal method creating the HTTP request handler serving the metrics on /metrics.
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+import wave
+from collections import OrderedDict
+
+
+class PhraseCacheModule:
+    """
+    A class to keep the synthesized speech of the recently said phrases, so they can be played without
+    running the Text-to-Speech model again.
+
+    The audio is held in memory as 16-bit mono PCM, evicting the least recently used phrases, and the fixed
+    phrases can also be stored in a directory as WAV files, so they survive restarts. The phrases which change,
+    like the totals, are kept only in memory, so the directory does not grow without a limit.
+
+    Attributes:
+    -----------
+    capacity : int
+        The maximum number of the phrases held in memory.
+    cache_dir : str
+        The directory of the persisted phrases, None to keep them only in memory.
+
+    Methods:
+    --------
+    get(self, model_name, text)
+        Returns the cached (PCM bytes, sample rate) of a phrase, or None.
+
+    put(self, model_name, text, pcm, sample_rate, persist=True)
+        Caches the audio of a phrase.
+    """
+    def __init__(self, capacity=64, cache_dir=None):
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, model_name, text):
+        """
+        Returns the cached (PCM bytes, sample rate) of a phrase said with a given model, or None if it is unknown.
+        """
+        key = (model_name, text)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                return entry
+
+        entry = self.__load(key)
+        if entry is not None:
+            self.__remember(key, entry)
+
+        return entry
+
+    def put(self, model_name, text, pcm, sample_rate, persist=True):
+        """
+        Caches the 16-bit mono PCM audio of a phrase said with a given model, also on the disk if persisted.
+        """
+        key = (model_name, text)
+        self.__remember(key, (pcm, sample_rate))
+        if persist and self.cache_dir is not None:
+            self.__store(key, pcm, sample_rate)
+
+    def __remember(self, key, entry):
+        """
+        Internal method adding the entry to the in-memory cache, evicting the least recently used one.
+        """
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+
+    def __file_path(self, key):
+        """
+        Internal method returning the path of the persisted phrase.
+        """
+        digest = hashlib.sha1('\0'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.wav")
+
+    def __load(self, key):
+        """
+        Internal method loading a persisted phrase, None if it is not stored.
+        """
+        if self.cache_dir is None or not os.path.exists(self.__file_path(key)):
+            return None
+
+        try:
+            with wave.open(self.__file_path(key), 'rb') as wave_file:
+                return wave_file.readframes(wave_file.getnframes()), wave_file.getframerate()
+        except (OSError, EOFError, wave.Error) as e:
+            print(f"Error loading the cached phrase: {e}")
+            return None
+
+    def __store(self, key, pcm, sample_rate):
+        """
+        Internal method persisting a phrase, replacing the file atomically.
+        """
+        file_path = self.__file_path(key)
+        try:
+            with wave.open(file_path + '.tmp', 'wb') as wave_file:
+                wave_file.setnchannels(1)
+                wave_file.setsampwidth(2)
+                wave_file.setframerate(sample_rate)
+                wave_file.writeframes(pcm)
+
+            os.replace(file_path + '.tmp', file_path)
+        except OSError as e:
+            print(f"Error storing the cached phrase: {e}")
@@ -0,0 +1,255 @@
+import queue
+import threading
+import time
+
+
+class PipelineModule:
+    """
+    A class to run the robot's vision stages concurrently, so the displayed frame rate
+    is not capped by the slowest detector.
+
+    The capture thread reads frames and hands them to the face and barcode workers through
+    bounded queues, which drop the oldest frame whenever a consumer falls behind. The render
+    stage (run on the main thread, as OpenCV windows require) always gets the newest frame
+    together with the latest available detection results.
+
+    With several cameras, a frame is a list of the (stream_id, image) tuples of the cameras which delivered
+    a new image, so the detectors can process all the streams in a single batch.
+
+    Attributes:
+    -----------
+    frame_reader : callable
+        Function returning the next camera frame, or None if no frame could be read.
+    face_detector : callable
+        Function returning the detected faces for a given frame.
+    product_detector : callable
+        Function returning the detected products for a given frame.
+    queue_depth : int
+        The maximum number of frames waiting in front of each stage.
+    face_workers : int
+        The number of threads running the face detection.
+    barcode_workers : int
+        The number of threads running the barcode detection.
+    detected_faces : list
+        The latest face detection results.
+    detected_products : list
+        The latest barcode detection results.
+    detection_errors : dict
+        The number of the frames each detection stage failed on.
+
+    Methods:
+    --------
+    start(self)
+        Starts the capture and detection threads.
+
+    stop(self)
+        Stops all the pipeline threads.
+
+    get_latest_frame(self, timeout=0.1)
+        Returns the newest frame along with the latest detection results.
+
+    get_stage_counters(self)
+        Returns the total number of frames processed by each stage.
+
+    get_stage_throughput(self)
+        Returns the frames per second processed by each stage since the previous call.
+
+    get_error_counters(self)
+        Returns the number of the frames each detection stage failed on.
+    """
+    def __init__(self, frame_reader, face_detector, product_detector, queue_depth=1, face_workers=1, barcode_workers=1):
+        self.frame_reader = frame_reader
+        self.face_detector = face_detector
+        self.product_detector = product_detector
+        self.queue_depth = max(1, queue_depth)
+        self.face_workers = max(1, face_workers)
+        self.barcode_workers = max(1, barcode_workers)
+
+        self.detected_faces = []
+        self.detected_products = []
+        self.detection_errors = {"faces": 0, "barcodes": 0}
+        self.__last_errors = {"faces": None, "barcodes": None}
+
+        self.__render_queue = queue.Queue(maxsize=self.queue_depth)
+        self.__face_queue = queue.Queue(maxsize=self.queue_depth)
+        self.__barcode_queue = queue.Queue(maxsize=self.queue_depth)
+
+        self.__results_lock = threading.Lock()
+        self.__latest_face_frame = -1
+        self.__latest_barcode_frame = -1
+
+        self.__counters_lock = threading.Lock()
+        self.__stage_counters = {"capture": 0, "faces": 0, "barcodes": 0, "render": 0}
+        self.__throughput_snapshot = (time.perf_counter(), dict(self.__stage_counters))
+
+        self.__stop_event = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        """
+        Starts the capture thread and the face and barcode workers.
+        """
+        self.__stop_event.clear()
+        self.__threads = [threading.Thread(target=self.__capture_loop, daemon=True)]
+
+        for _ in range(self.face_workers):
+            self.__threads.append(threading.Thread(target=self.__detection_loop, daemon=True,
+                                                   args=(self.__face_queue, self.face_detector, "faces")))
+
+        for _ in range(self.barcode_workers):
+            self.__threads.append(threading.Thread(target=self.__detection_loop, daemon=True,
+                                                   args=(self.__barcode_queue, self.product_detector, "barcodes")))
+
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Signals all the pipeline threads to finish and waits for them.
+        """
+        self.__stop_event.set()
+        for thread in self.__threads:
+            thread.join(timeout=1.0)
+
+        self.__threads = []
+
+    def get_latest_frame(self, timeout=0.1):
+        """
+        Returns the newest captured frame with the latest detected faces and products,
+        or None if no new frame arrived within the timeout.
+        """
+        try:
+            image = self.__render_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        with self.__results_lock:
+            detected_faces = self.detected_faces
+            detected_products = self.detected_products
+
+        self.__count("render")
+        return image, detected_faces, detected_products
+
+    def get_stage_counters(self):
+        """
+        Returns the total number of frames processed by each stage.
+        """
+        with self.__counters_lock:
+            return dict(self.__stage_counters)
+
+    def get_stage_throughput(self):
+        """
+        Returns the frames per second processed by each stage since the previous call.
+        """
+        now = time.perf_counter()
+        with self.__counters_lock:
+            previous_time, previous_counters = self.__throughput_snapshot
+            counters = dict(self.__stage_counters)
+            self.__throughput_snapshot = (now, counters)
+
+        elapsed = max(now - previous_time, 1e-9)
+        return {stage: (count - previous_counters[stage]) / elapsed for stage, count in counters.items()}
+
+    def get_error_counters(self):
+        """
+        Returns the number of the frames each detection stage failed on.
+        """
+        with self.__counters_lock:
+            return dict(self.detection_errors)
+
+    def __capture_loop(self):
+        """
+        Internal method reading the frames and distributing them to the other stages.
+        """
+        frame_id = 0
+        while not self.__stop_event.is_set():
+            image = self.frame_reader()
+            if image is None:
+                time.sleep(0.01)
+                continue
+
+            self.__count("capture")
+            # The render stage draws on its frame, so the detectors get their own copy
+            self.__put_latest(self.__render_queue, image)
+            detection_frame = (frame_id, self.__copy_frame(image))
+            self.__put_latest(self.__face_queue, detection_frame)
+            self.__put_latest(self.__barcode_queue, detection_frame)
+            frame_id += 1
+
+    def __detection_loop(self, input_queue, detector, stage):
+        """
+        Internal method running a detector over the queued frames and publishing its results.
+        """
+        while not self.__stop_event.is_set():
+            try:
+                frame_id, image = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                results = detector(image)
+            except Exception as e:
+                # A failed frame keeps the previous results, the next frame is tried again
+                self.__count_error(stage, e)
+                continue
+
+            self.__count(stage)
+            self.__publish(stage, frame_id, results)
+
+    def __publish(self, stage, frame_id, results):
+        """
+        Internal method storing the detection results, unless a newer frame was already published.
+        """
+        with self.__results_lock:
+            if stage == "faces":
+                if frame_id > self.__latest_face_frame:
+                    self.__latest_face_frame = frame_id
+                    self.detected_faces = results
+            elif frame_id > self.__latest_barcode_frame:
+                self.__latest_barcode_frame = frame_id
+                self.detected_products = results
+
+    def __count(self, stage):
+        """
+        Internal method incrementing the processed frames counter of a given stage.
+        """
+        with self.__counters_lock:
+            self.__stage_counters[stage] += 1
+
+    def __count_error(self, stage, error):
+        """
+        Internal method counting a failed detection, printing the error unless it repeats the previous one.
+        """
+        with self.__counters_lock:
+            self.detection_errors[stage] += 1
+            message = f"{type(error).__name__}: {error}"
+            if message == self.__last_errors[stage]:
+                return
+            self.__last_errors[stage] = message
+
+        print(f"Error detecting the {stage}: {message}")
+
+    @staticmethod
+    def __copy_frame(image):
+        """
+        Copies a single image, or every image of a multi-camera frame.
+        """
+        if isinstance(image, list):
+            return [(stream_id, stream_image.copy()) for stream_id, stream_image in image]
+
+        return image.copy()
+
+    @staticmethod
+    def __put_latest(target_queue, item):
+        """
+        Puts the item into the queue, dropping the oldest queued items if the queue is full.
+        """
+        while True:
+            try:
+                target_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    target_queue.get_nowait()
+                except queue.Empty:
+                    pass
@@ -1,8 +1,25 @@
-import torch
+import cv2
 import face_recognition
+import numpy as np
 import os
-import pickle
-from pyzbar.pyzbar import decode
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from modules.barcode_module import BarcodeModule
+from modules.face_detector_module import FaceDetector, create_face_detector
+from modules.tracking_module import TrackingModule
+
+
+def _encode_face_image(image_path):
+    """
+    Encode the first face found in the image file, returns None if there is no face.
+    Defined at the module level, so it can be sent to the worker processes.
+    """
+    image = face_recognition.load_image_file(image_path)
+    encodings = face_recognition.face_encodings(image)
+    if not encodings:
+        return None
+
+    return np.asarray(encodings[0], dtype=np.float32)
 
 
 # Notatka do mnie z przyszłości.
@@ -14,127 +31,515 @@ class RecognitionModule:
 
     Args:
     --------
-    model (str): The model to use for face recognition. Default is "cnn".
+    model (str): The face detection backend: "hog" or "cnn" for dlib, "yunet" for OpenCV's YuNet,
+                 or a FaceDetector instance. Default is "cnn". A backend which cannot be created, e.g. without
+                 its model file, is replaced with dlib's HOG detector at the start.
     tolerance (float): The tolerance value for face recognition. Default is 0.5.
+    tracking (bool): Whether the faces should be tracked between the full detections. Default is False.
+    detection_interval (int): The number of frames between the full detections in tracking mode. Default is 10.
+    detection_scale (float): The scale of the frame used for the full detection in tracking mode. Default is 0.5.
+    frame_scale (float): The scale of the frame used for the detection without tracking. Default is 1.0.
+    upsample (int): The number of times the frame is upsampled by the detector to find smaller faces. Default is 1.
+    yunet_model_path (str): The path of the YuNet ONNX model file, used by the "yunet" backend. Default is None.
+    gallery (GalleryModule): The large, runtime-editable gallery searched along the known faces. Default is None.
+    barcode_scan_interval (int): The number of frames between the full frame barcode scans. Default is 1.
+    barcode_scan_scale (float): The scale of the frame used for the full frame barcode scans. Default is 1.0.
 
     Attributes:
     --------
-    model (str): The model used for face recognition.
+    model (str): The face detection backend used for face recognition.
+    yunet_model_path (str): The path of the YuNet ONNX model file.
     tolerance (float): The tolerance value for face recognition.
-    known_faces_encodings (list): List of known faces encodings.
-    known_names (list): List of known face names.
+    detection_scale (float): The scale of the frame used for the full detection in tracking mode.
+    frame_scale (float): The scale of the frame used for the detection without tracking.
+    upsample (int): The number of times the frame is upsampled by the detector.
+    detection_interval (int): The number of frames between the full detections in tracking mode.
+    face_tracker (TrackingModule): The tracker following the faces between detections, None if tracking is disabled.
+    face_trackers (dict): The trackers of every camera stream by their ids, face_tracker being the one of stream 0.
+    known_faces_encodings (np.ndarray): Contiguous float32 matrix of known faces encodings, one row per face.
+    known_names (list): List of known face names, matching the rows of the encodings matrix.
+    gallery (GalleryModule): The memory-mapped gallery of enrolled faces, None if not used.
+    barcode_scanner (BarcodeModule): The barcode decoder reusing the barcodes found on the previous frames.
+    barcode_scanners (dict): The barcode decoders of every camera stream by their ids, barcode_scanner being
+                             the one of stream 0.
 
     Methods:
     --------
-    load_known_faces(known_faces_dir, force_rebuild=False):
+    load_known_faces(known_faces_dir, force_rebuild=False, workers=None):
         Load known faces encodings from a faces directory's cache file,
-        or create a new cache based on its contents.
+        encoding only the images added or changed since the cache was built.
     load_known_barcodes(csv_file_path):
         Load known barcodes from a CSV file into a dictionary.
-    create_face_encodings(known_faces_dir, cache_file):
-        Build a new face encodings, based on the faces found in the given directory,
-        and store them in the cache file.
+    create_face_encodings(known_faces_dir, cache_file, cached_entries=None, workers=None):
+        Build the face encodings, based on the faces found in the given directory,
+        reusing the unchanged cached entries, and store them in the cache file.
+    set_known_faces(encodings, names):
+        Replace the known faces with the given encodings and names.
+    identify_encodings(encodings):
+        Find the closest known face for each of the given encodings in a single batched computation.
+    enroll_face(name, image, face_location=None):
+        Add the face found on the image to the gallery, or to the known faces, while the robot is running.
+    remove_identity(name):
+        Remove all the faces of a given person from the gallery and the known faces.
+    set_operating_point(model=None, detection_scale=None, upsample=None, detection_interval=None):
+        Change the face detection settings at runtime, e.g. by the quality governor.
+    detect_faces(image, return_distances=False, stream_id=0):
+        Detect and identify the faces on a single frame.
+    detect_faces_batch(frames, return_distances=False):
+        Detect and identify the faces on the frames of several cameras, batching the detection and encoding.
+    detect_products(image, stream_id=0):
+        Detect the barcodes on a single frame and resolve their products.
+    detect_products_batch(frames):
+        Detect the barcodes on the frames of several cameras.
     detect_on_camera(video): Try to detect the known faces (and all the rest) using the
                              given VideoCapture instance.
     test_on_unknown_faces(test_dir):
         Test the currently stored known faces encodings with the images in a given test directory.
     test_on_barcode_images(test_dir): Test the barcode detection against the images in a given test directory.
     """
-    def __init__(self, model="cnn", tolerance=0.5):
+    def __init__(self, model="cnn", tolerance=0.5, tracking=False, detection_interval=10, detection_scale=0.5,
+                 gallery=None, barcode_scan_interval=1, barcode_scan_scale=1.0, frame_scale=1.0, upsample=1,
+                 yunet_model_path=None):
         self.model = model
+        self.yunet_model_path = yunet_model_path
+        self.__face_detectors = {}
+        self.__face_detectors_lock = threading.Lock()
+        if not isinstance(model, FaceDetector):
+            try:
+                self.__get_face_detector(model)
+            except (FileNotFoundError, ValueError, cv2.error) as e:
+                # Checked at the start, so the quality governor is set up for the backend actually used
+                print(f"Error loading the {model} face detector, using hog instead: {e}")
+                self.model = "hog"
         self.tolerance = tolerance
+        self.detection_scale = detection_scale
+        self.frame_scale = frame_scale
+        self.upsample = upsample
+
+        self.detection_interval = detection_interval
+        self.face_tracker = TrackingModule(detection_interval=detection_interval) if tracking else None
+        self.face_trackers = {0: self.face_tracker} if tracking else {}
+        self.__tracking_lock = threading.Lock()
 
         self.product_data_source = None
+        self.barcode_scan_interval = barcode_scan_interval
+        self.barcode_scan_scale = barcode_scan_scale
+        self.barcode_scanner = BarcodeModule(full_scan_interval=barcode_scan_interval, scan_scale=barcode_scan_scale)
+        self.barcode_scanners = {0: self.barcode_scanner}
+        self.__products_cache = {}
+        self.__products_cache_version = None
 
-        self.known_faces_encodings = []
+        self.gallery = gallery
+        self.known_faces_encodings = np.empty((0, 128), dtype=np.float32)
         self.known_names = []
+        self.__known_faces = (self.known_faces_encodings, self.known_names, np.empty(0, dtype=np.float32))
 
-    def load_known_faces(self, known_faces_dir, force_rebuild: bool = False):
+    def load_known_faces(self, known_faces_dir, force_rebuild: bool = False, workers=None):
         """
-        Load known faces encodings from a faces directory's cache file, or create a new cache based on its contents.
+        Load known faces encodings from a faces directory's cache file, re-encoding only the images which were added
+        or changed since the cache was built. With force_rebuild, every image is encoded again.
         """
         print("Loading known faces...")
-        cache_file = os.path.join(known_faces_dir, 'face_encodings_cache.pkl')
-
-        if os.path.exists(cache_file) and not force_rebuild:
-            print("Loading from cache...")
-            with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-                self.known_faces_encodings = cache_data['encodings']
-                self.known_names = cache_data['names']
-                return
-
-        print("Building the cache...")
-        self.create_face_encodings(known_faces_dir, cache_file)
+        cache_file = os.path.join(known_faces_dir, 'face_encodings_cache.npz')
+        cached_entries = {} if force_rebuild else self.__load_face_cache(cache_file)
+        self.create_face_encodings(known_faces_dir, cache_file, cached_entries, workers)
 
     def set_product_data_source(self, database_context):
         """
         Set the product data source, usually database module.
         """
         self.product_data_source = database_context
+        self.__products_cache = {}
 
-    def create_face_encodings(self, known_faces_dir, cache_file: str):
+    def create_face_encodings(self, known_faces_dir, cache_file: str, cached_entries=None, workers=None):
         """
-        Build a new face encodings, based on the faces found in the given directory, and store them in the cache file.
+        Build the face encodings, based on the faces found in the given directory, and store them in the cache file.
+        Images with an unchanged modification time and size are taken from the cached entries, the rest is encoded
+        in parallel by a pool of processes.
         """
+        if cached_entries is None:
+            cached_entries = {}
+
+        entries = {}
+        images_to_encode = []
         for name in os.listdir(known_faces_dir):
             directory_path = os.path.join(known_faces_dir, name)
             if not os.path.isdir(directory_path):
                 continue
 
             for filename in os.listdir(directory_path):
-                image = face_recognition.load_image_file(os.path.join(directory_path, filename))
-                encodings = face_recognition.face_encodings(image)
-                if encodings:
-                    encoding = encodings[0]
-                    self.known_faces_encodings.append(encoding)
-                    self.known_names.append(name)
+                image_path = os.path.join(directory_path, filename)
+                image_stat = os.stat(image_path)
+                relative_path = os.path.join(name, filename)
+                cached_entry = cached_entries.get(relative_path)
+                if (cached_entry is not None and cached_entry['mtime'] == image_stat.st_mtime_ns
+                        and cached_entry['size'] == image_stat.st_size and cached_entry['name'] == name):
+                    entries[relative_path] = cached_entry
                 else:
-                    print(f"No faces found in the image: {filename}")
+                    images_to_encode.append((relative_path, name, image_path, image_stat))
+
+        removed_images = set(cached_entries) - set(entries)
+        if images_to_encode:
+            print(f"Encoding {len(images_to_encode)} new or changed images...")
+            image_paths = [image_path for _, _, image_path, _ in images_to_encode]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for (relative_path, name, image_path, image_stat), encoding in zip(
+                        images_to_encode, executor.map(_encode_face_image, image_paths)):
+                    if encoding is None:
+                        print(f"No faces found in the image: {os.path.basename(image_path)}")
+
+                    entries[relative_path] = {'name': name, 'mtime': image_stat.st_mtime_ns,
+                                              'size': image_stat.st_size, 'encoding': encoding}
+
+        if images_to_encode or removed_images or not os.path.exists(cache_file):
+            self.__save_face_cache(cache_file, entries)
 
-        with open(cache_file, 'wb') as f:
-            pickle.dump({'encodings': self.known_faces_encodings, 'names': self.known_names}, f)
+        known_entries = [entries[path] for path in sorted(entries) if entries[path]['encoding'] is not None]
+        self.set_known_faces([entry['encoding'] for entry in known_entries], [entry['name'] for entry in known_entries])
 
-    def detect_faces(self, image):
+    @staticmethod
+    def __load_face_cache(cache_file):
         """
-        Compare the encodings of the faces found on the image with the known faces encodings and save their positions.
+        Load the per image entries of the face encodings cache, keyed by the image path relative to the faces directory.
+        """
+        if not os.path.exists(cache_file):
+            return {}
+
+        print("Loading from cache...")
+        try:
+            with np.load(cache_file, allow_pickle=False) as cache_data:
+                return {
+                    str(path): {'name': str(name), 'mtime': int(mtime), 'size': int(size),
+                                'encoding': encoding if found else None}
+                    for path, name, mtime, size, found, encoding in zip(
+                        cache_data['paths'], cache_data['names'], cache_data['mtimes'], cache_data['sizes'],
+                        cache_data['found'], cache_data['encodings'])
+                }
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error loading the face encodings cache, rebuilding: {e}")
+            return {}
+
+    @staticmethod
+    def __save_face_cache(cache_file, entries):
+        """
+        Store the per image entries in an uncompressed NumPy archive, replacing the previous cache atomically.
+        """
+        paths = sorted(entries)
+        encodings = np.zeros((len(paths), 128), dtype=np.float32)
+        for index, path in enumerate(paths):
+            if entries[path]['encoding'] is not None:
+                encodings[index] = entries[path]['encoding']
+
+        temporary_file = cache_file + '.tmp'
+        with open(temporary_file, 'wb') as f:
+            np.savez(f,
+                     paths=np.array(paths, dtype=str),
+                     names=np.array([entries[path]['name'] for path in paths], dtype=str),
+                     mtimes=np.array([entries[path]['mtime'] for path in paths], dtype=np.int64),
+                     sizes=np.array([entries[path]['size'] for path in paths], dtype=np.int64),
+                     found=np.array([entries[path]['encoding'] is not None for path in paths], dtype=bool),
+                     encodings=encodings)
+
+        os.replace(temporary_file, cache_file)
+
+    def set_known_faces(self, encodings, names):
         """
-        locations = face_recognition.face_locations(image, model=self.model)
-        encodings = face_recognition.face_encodings(image, locations)
-        detected_faces = []
+        Replace the known faces with the given encodings and names, stored as a contiguous float32 matrix.
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, 128)
+        names = list(names)
+        self.known_faces_encodings = encodings
+        self.known_names = names
+        # Published as a single reference, so the detection workers never see the matrix and names out of sync
+        self.__known_faces = (encodings, names, np.einsum('ij,ij->i', encodings, encodings))
 
-        for face_encoding, face_location in zip(encodings, locations):
-            results = face_recognition.compare_faces(self.known_faces_encodings, face_encoding, self.tolerance)
-            if True in results:
-                label = self.known_names[results.index(True)]
+    def identify_encodings(self, encodings):
+        """
+        Find the closest known face for each of the given encodings in a single batched distance computation,
+        searching the attached gallery as well. Returns a list of (label, distance) tuples, labeled "Customer"
+        when the closest face is above the tolerance.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        if len(encodings) == 0:
+            return []
+
+        best_names = [None] * len(encodings)
+        best_distances = np.full(len(encodings), np.inf, dtype=np.float32)
+
+        known_faces_encodings, known_names, known_faces_squared_norms = self.__known_faces
+        if known_names:
+            # |a - b|^2 = |a|^2 + |b|^2 - 2ab, computed for all the pairs with one matrix product
+            squared_distances = (np.einsum('ij,ij->i', encodings, encodings)[:, np.newaxis]
+                                 + known_faces_squared_norms[np.newaxis, :]
+                                 - 2.0 * encodings @ known_faces_encodings.T)
+            best_matches = np.argmin(squared_distances, axis=1)
+            best_names = [known_names[best_match] for best_match in best_matches]
+            best_distances = np.sqrt(np.maximum(squared_distances[np.arange(len(encodings)), best_matches], 0.0))
+
+        if self.gallery is not None:
+            for index, (name, distance) in enumerate(self.gallery.search(encodings)):
+                if name is not None and distance < best_distances[index]:
+                    best_names[index] = name
+                    best_distances[index] = distance
+
+        results = []
+        for name, distance in zip(best_names, best_distances):
+            if name is None:
+                results.append(("Customer", None))
             else:
-                label = "Customer"
+                results.append((name if distance <= self.tolerance else "Customer", float(distance)))
+
+        return results
+
+    def enroll_face(self, name, image, face_location=None):
+        """
+        Add the face found on the image (or at the given location) to the gallery, or to the known faces
+        if there is no gallery, while the robot is running. Returns False if no face was found.
+        """
+        encodings = face_recognition.face_encodings(image, [face_location] if face_location is not None else None)
+        if not encodings:
+            return False
+
+        if self.gallery is not None:
+            self.gallery.add(name, encodings[0])
+        else:
+            self.set_known_faces(np.vstack([self.known_faces_encodings, encodings[0]]), self.known_names + [name])
 
-            detected_faces.append((face_location, label))
+        self.__reset_tracks()
+        return True
+
+    def remove_identity(self, name):
+        """
+        Remove all the faces of a given person from the gallery and the known faces.
+        """
+        if self.gallery is not None:
+            self.gallery.remove(name)
+
+        kept = [index for index, known_name in enumerate(self.known_names) if known_name != name]
+        self.set_known_faces(self.known_faces_encodings[kept], [self.known_names[index] for index in kept])
+        self.__reset_tracks()
+
+    def __reset_tracks(self):
+        """
+        Drop the tracked faces, so their identities are established again with the updated known faces.
+        """
+        if self.face_tracker is not None:
+            with self.__tracking_lock:
+                for face_tracker in self.face_trackers.values():
+                    face_tracker.reset()
+
+    def set_operating_point(self, model=None, detection_scale=None, upsample=None, detection_interval=None):
+        """
+        Change the face detection settings at runtime, the ones given as None are kept. The detection scale
+        applies to both the full detections in tracking mode and the detections without tracking.
+        """
+        if model is not None:
+            self.model = model
+        if detection_scale is not None:
+            self.detection_scale = detection_scale
+            self.frame_scale = detection_scale
+        if upsample is not None:
+            self.upsample = upsample
+        if detection_interval is not None:
+            with self.__tracking_lock:
+                self.detection_interval = detection_interval
+                for face_tracker in self.face_trackers.values():
+                    face_tracker.detection_interval = detection_interval
+
+    def detect_faces(self, image, return_distances=False, stream_id=0):
+        """
+        Compare the encodings of the faces found on the image with the known faces encodings and save their positions.
+        In tracking mode the faces are detected periodically and followed by the tracker of the stream in between.
+        With return_distances, the distance to the matched known face is appended to each result.
+        """
+        return self.detect_faces_batch([(stream_id, image)], return_distances)[stream_id]
+
+    def detect_faces_batch(self, frames, return_distances=False):
+        """
+        Detect and identify the faces on the frames of several cameras, given as (stream_id, image) tuples,
+        and return the {stream_id: detected faces}. The frames are located in batches, their faces encoded
+        in a single batch and identified in a single distance computation. In tracking mode, every stream
+        has its own tracker, and only the streams requesting the full detection are detected.
+        """
+        if self.face_tracker is not None:
+            # Tracks depend on the order of frames, so the tracking state is updated by one worker at a time
+            with self.__tracking_lock:
+                self.__detect_and_track_faces(frames)
+                return {stream_id: self.__get_face_tracker(stream_id).get_faces(return_distances)
+                        for stream_id, _ in frames}
+
+        images = [image for _, image in frames]
+        locations = self.__locate_faces(images, self.frame_scale)
+        detected_faces = {}
+        for (stream_id, _), image_locations, identities in zip(frames, locations,
+                                                                self.__identify_faces(images, locations)):
+            detected_faces[stream_id] = [(location, label, distance) if return_distances else (location, label)
+                                         for location, (label, distance) in zip(image_locations, identities)]
 
         return detected_faces
 
-    def detect_products(self, image):
+    def __get_face_tracker(self, stream_id):
+        """
+        Return the face tracker of the stream, created on its first frame.
+        """
+        if stream_id not in self.face_trackers:
+            self.face_trackers[stream_id] = TrackingModule(detection_interval=self.detection_interval)
+
+        return self.face_trackers[stream_id]
+
+    def __detect_and_track_faces(self, frames):
+        """
+        Run the full detection on the downscaled frames of the streams whose trackers request it and only identify
+        the new faces, otherwise follow the already identified faces with the trackers.
+        """
+        detection_frames = []
+        for stream_id, image in frames:
+            face_tracker = self.__get_face_tracker(stream_id)
+            if face_tracker.needs_detection():
+                detection_frames.append((stream_id, image))
+            else:
+                face_tracker.track(image)
+
+        if not detection_frames:
+            return
+
+        new_locations = []
+        images = [image for _, image in detection_frames]
+        for (stream_id, image), locations in zip(detection_frames, self.__locate_faces(images, self.detection_scale)):
+            new_locations.append(self.__get_face_tracker(stream_id).associate_detections(image, locations))
+
+        for (stream_id, image), locations, identities in zip(detection_frames, new_locations,
+                                                              self.__identify_faces(images, new_locations)):
+            for location, (label, distance) in zip(locations, identities):
+                self.__get_face_tracker(stream_id).add_track(image, location, label, distance)
+
+    def __locate_faces(self, images, scale=1.0):
+        """
+        Return the face locations of every image, detected on the images downscaled by the given scale
+        and returned in the coordinates of the full resolution images, with the backend of the current model.
+        """
+        # The settings are read once, as the quality governor can change them meanwhile
+        model, upsample = self.model, self.upsample
+        if scale != 1.0:
+            images = [cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) for image in images]
+            return [[tuple(int(coordinate / scale) for coordinate in location) for location in image_locations]
+                    for image_locations in self.__get_face_detector(model).detect(images, upsample)]
+
+        return self.__get_face_detector(model).detect(images, upsample)
+
+    def __get_face_detector(self, model):
+        """
+        Return the face detection backend of the model, created once on its first use, also when several
+        face workers ask for it at the same time.
+        """
+        if isinstance(model, FaceDetector):
+            return model
+
+        face_detector = self.__face_detectors.get(model)
+        if face_detector is None:
+            with self.__face_detectors_lock:
+                face_detector = self.__face_detectors.get(model)
+                if face_detector is None:
+                    face_detector = create_face_detector(model, self.yunet_model_path)
+                    self.__face_detectors[model] = face_detector
+
+        return face_detector
+
+    def __identify_faces(self, images, locations):
+        """
+        Compute the encodings of the faces at the given locations of every image, and return their
+        (label, distance) tuples per image, identified all at once.
+        """
+        counts = [len(image_locations) for image_locations in locations]
+        if sum(counts) == 0:
+            return [[] for _ in images]
+
+        identities = self.identify_encodings(self.__encode_faces(images, locations))
+        offsets = np.cumsum([0] + counts)
+        return [identities[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    @staticmethod
+    def __encode_faces(images, locations):
+        """
+        Compute the encodings of the faces at the given locations of every image, as a single list.
+        The faces of several images are encoded in a single batch by dlib's face encoder, falling back
+        to the image by image encoding where the batched call is not supported.
+        """
+        batch = [(image, image_locations) for image, image_locations in zip(images, locations) if image_locations]
+        if len(batch) > 1:
+            try:
+                import dlib
+                from face_recognition import api
+                landmarks = []
+                for image, image_locations in batch:
+                    # The same landmarks model as face_recognition.face_encodings uses by default
+                    image_landmarks = dlib.full_object_detections()
+                    for face_landmarks in api._raw_face_landmarks(image, image_locations, model="small"):
+                        image_landmarks.append(face_landmarks)
+                    landmarks.append(image_landmarks)
+
+                batch_encodings = api.face_encoder.compute_face_descriptor([image for image, _ in batch], landmarks, 1)
+                return [np.array(encoding) for image_encodings in batch_encodings for encoding in image_encodings]
+            except (AttributeError, ImportError, RuntimeError, TypeError):
+                pass
+
+        return [encoding for image, image_locations in batch
+                for encoding in face_recognition.face_encodings(image, image_locations)]
+
+    def detect_products(self, image, stream_id=0):
         """
         Compare the barcodes found on the image with the database and save their positions.
+        Every stream has its own barcode decoder, as it reuses the barcodes found on the stream's previous frames.
         """
-        results = decode(image)
+        if stream_id not in self.barcode_scanners:
+            self.barcode_scanners[stream_id] = BarcodeModule(full_scan_interval=self.barcode_scan_interval,
+                                                             scan_scale=self.barcode_scan_scale)
+        results = self.barcode_scanners[stream_id].decode(image)
         recognized_products = []
 
+        # Resolved products stay valid until the data source reloads its catalog
+        catalog_version = getattr(self.product_data_source, 'version', None)
+        if catalog_version != self.__products_cache_version or len(self.__products_cache) > 4096:
+            self.__products_cache = {}
+            self.__products_cache_version = catalog_version
+
         for decoded_barcode in results:
             if decoded_barcode.type == 'QRCODE':
                 continue
 
             decoded_data = decoded_barcode.data.decode()
-            product_id = None
-            product = None
-
-            if self.product_data_source is not None:
-                product_id = self.product_data_source.barcodes.get(decoded_data)
-
-            if product_id is not None:
-                product = self.product_data_source.products.get(product_id)
+            if decoded_data in self.__products_cache:
+                product = self.__products_cache[decoded_data]
+            else:
+                product = self.__resolve_product(decoded_data)
+                self.__products_cache[decoded_data] = product
 
             recognized_products.append((decoded_barcode, product))
 
         return recognized_products
+
+    def detect_products_batch(self, frames):
+        """
+        Detect the barcodes on the frames of several cameras, given as (stream_id, image) tuples,
+        and return the {stream_id: recognized products}.
+        """
+        return {stream_id: self.detect_products(image, stream_id) for stream_id, image in frames}
+
+    def __resolve_product(self, decoded_data):
+        """
+        Find the product associated with the decoded barcode data in the product data source.
+        """
+        if self.product_data_source is None:
+            return None
+
+        # A single catalog snapshot is used, so a refresh cannot swap the products between both lookups
+        catalog = getattr(self.product_data_source, 'catalog', self.product_data_source)
+        lookup_barcode = getattr(catalog, 'lookup_barcode', None)
+        if lookup_barcode is not None:
+            return lookup_barcode(decoded_data)
+
+        product_id = catalog.barcodes.get(decoded_data)
+        if product_id is None:
+            return None
+
+        return catalog.products.get(product_id)
@@ -11,20 +11,92 @@ class SettingsModule:
         The width of the camera used by the robotic assistant.
     camera_height : float
         The height of the camera used by the robotic assistant.
+    camera_sources : list
+        The sources of the frames, one per camera stream: a camera index or device path, a video file,
+        an image directory or an RTSP/HTTP stream URL. The first one is the main camera.
+    threaded_capture : bool
+        A flag to determine if the frames should be captured on a background thread keeping only the newest one.
     db_username : str
         The username for the database connection.
     db_password : str
         The password for the database connection.
+    db_backend : str
+        The database backend, "odbc" for the shop's SQL Server or "sqlite" for a local stand-in database.
+    db_sqlite_path : str
+        The path of the SQLite database used by the "sqlite" backend.
+    db_snapshot_file : str
+        The path of the local catalog snapshot loaded at startup, empty to not keep one.
+    db_change_column : str
+        The name of the rowversion / updated-at column used for the incremental refreshes, None if not available.
     use_local_llm : bool
-        A flag to determine if a local large language model should be used.
+        A flag to determine if a local large language model should be used for the commands the embeddings
+        are not confident about. Otherwise, the model is not loaded and only the embeddings are used.
+    intent_threshold : float
+        The similarity to the nearest example phrase below which a voice command is not recognized.
+    intent_fallback_threshold : float
+        The similarity to the nearest example phrase below which the local large language model is asked instead.
     llm_path : str
         The file path for the local large language model.
+    command_timeout : float
+        The time [s] after which a voice command which is still being mapped is dropped.
+    llm_constrained : bool
+        A flag to determine if the local large language model should score the command keys instead of generating
+        the answer, so it is always a valid key.
     layers_on_gpu : int
         The number of layers of the model to be loaded on GPU.
     tts_model_name : str
         The name of the Text-to-Speech model.
+    tts_cache_size : int
+        The number of the synthesized phrases kept in memory.
+    tts_cache_dir : str
+        The directory the fixed announcements are stored in between the runs, None to keep them only in memory.
     stt_model_name : str
         The name of the Speech-to-Text model.
+    stt_command_mode : bool
+        A flag to determine if the utterances should be transcribed as short commands, in a single greedy pass
+        prompted with the command phrases.
+    continuous_listening : bool
+        A flag to determine if every detected utterance should be transcribed, instead of only the one following
+        the voice interface command.
+    vad_silence_duration : float
+        The duration [s] of the silence ending an utterance.
+    pipeline_queue_depth : int
+        The maximum number of frames waiting in front of each vision pipeline stage.
+    pipeline_face_workers : int
+        The number of threads running the face detection.
+    pipeline_barcode_workers : int
+        The number of threads running the barcode detection.
+    face_detector : str
+        The face detection backend: "cnn" or "hog" for dlib, "yunet" for OpenCV's YuNet model running fast on the CPU.
+    face_detector_model_path : str
+        The path of the YuNet ONNX model file, downloaded from the OpenCV model zoo.
+    face_tracking : bool
+        A flag to determine if the faces should be tracked between the full detections.
+    face_detection_interval : int
+        The number of frames between the full face detections in tracking mode.
+    face_detection_scale : float
+        The scale of the frame used for the full face detection in tracking mode.
+    face_gallery_dir : str
+        The directory of the memory-mapped gallery of enrolled faces, empty if the gallery is not used.
+    face_gallery_n_probe : int
+        The number of the gallery index lists scanned per query, trading the search speed for accuracy.
+    quality_governor : bool
+        A flag to determine if the face detection model, scale, upsampling and interval should be adjusted
+        at runtime to the measured latency, overriding the face detection settings.
+    target_fps : float
+        The frame rate the quality governor keeps the face detection at.
+    barcode_scan_interval : int
+        The number of frames between the full frame barcode scans.
+    barcode_scan_scale : float
+        The scale of the frame used for the full frame barcode scans.
+    metrics_port : int
+        The port of the local Prometheus metrics endpoint, None to not serve the metrics.
+    metrics_log_file : str
+        The path of the JSON-lines metrics log, None to not log the metrics.
+    metrics_log_interval : float
+        The time [s] between the metrics log entries.
+    show_metrics : bool
+        A flag to determine if the measured stage rates and latencies should be shown on the GUI at startup.
     """
 
     def __init__(self, config_file):
@@ -33,10 +105,48 @@ class SettingsModule:
 
         self.camera_width = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "CAMERA_WIDTH")
         self.camera_height = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "CAMERA_HEIGHT")
+        self.camera_sources = [source.strip() for source in
+                               config.get("ROBOTIC_SHOP_ASSISTANT", "CAMERA_SOURCES", fallback="0").split(",")
+                               if source.strip()]
+        self.threaded_capture = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "THREADED_CAPTURE", fallback=True)
         self.db_username = config.get("ROBOTIC_SHOP_ASSISTANT", "DB_USERNAME")
         self.db_password = config.get("ROBOTIC_SHOP_ASSISTANT", "DB_PASSWORD")
+        self.db_backend = config.get("ROBOTIC_SHOP_ASSISTANT", "DB_BACKEND", fallback="odbc")
+        self.db_sqlite_path = config.get("ROBOTIC_SHOP_ASSISTANT", "DB_SQLITE_PATH",
+                                         fallback="robotic_shop_assistant.db")
+        self.db_snapshot_file = config.get("ROBOTIC_SHOP_ASSISTANT", "DB_SNAPSHOT_FILE", fallback="") or None
+        self.db_change_column = config.get("ROBOTIC_SHOP_ASSISTANT", "DB_CHANGE_COLUMN", fallback="") or None
         self.use_local_llm = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "USE_LOCAL_LLM")
+        self.intent_threshold = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "INTENT_THRESHOLD", fallback=0.4)
+        self.intent_fallback_threshold = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "INTENT_FALLBACK_THRESHOLD",
+                                                         fallback=0.6)
         self.llm_path = config.get("ROBOTIC_SHOP_ASSISTANT", "LOCAL_LLM_PATH")
+        self.command_timeout = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "COMMAND_TIMEOUT", fallback=10.0)
+        self.llm_constrained = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "LLM_CONSTRAINED", fallback=False)
         self.layers_on_gpu = config.getint("ROBOTIC_SHOP_ASSISTANT", "N_GPU_LAYERS")
         self.tts_model_name = config.get("ROBOTIC_SHOP_ASSISTANT", "TTS_MODEL_NAME")
+        self.tts_cache_size = config.getint("ROBOTIC_SHOP_ASSISTANT", "TTS_CACHE_SIZE", fallback=64)
+        self.tts_cache_dir = config.get("ROBOTIC_SHOP_ASSISTANT", "TTS_CACHE_DIR", fallback="") or None
         self.stt_model_name = config.get("ROBOTIC_SHOP_ASSISTANT", "STT_MODEL_NAME")
+        self.stt_command_mode = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "STT_COMMAND_MODE", fallback=False)
+        self.continuous_listening = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "CONTINUOUS_LISTENING", fallback=False)
+        self.vad_silence_duration = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "VAD_SILENCE_DURATION", fallback=0.5)
+        self.pipeline_queue_depth = config.getint("ROBOTIC_SHOP_ASSISTANT", "PIPELINE_QUEUE_DEPTH", fallback=1)
+        self.pipeline_face_workers = config.getint("ROBOTIC_SHOP_ASSISTANT", "PIPELINE_FACE_WORKERS", fallback=1)
+        self.pipeline_barcode_workers = config.getint("ROBOTIC_SHOP_ASSISTANT", "PIPELINE_BARCODE_WORKERS", fallback=1)
+        self.face_detector = config.get("ROBOTIC_SHOP_ASSISTANT", "FACE_DETECTOR", fallback="cnn")
+        self.face_detector_model_path = config.get("ROBOTIC_SHOP_ASSISTANT", "FACE_DETECTOR_MODEL_PATH",
+                                                   fallback="models/face_detection_yunet_2023mar.onnx")
+        self.face_tracking = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "FACE_TRACKING", fallback=False)
+        self.face_detection_interval = config.getint("ROBOTIC_SHOP_ASSISTANT", "FACE_DETECTION_INTERVAL", fallback=10)
+        self.face_detection_scale = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "FACE_DETECTION_SCALE", fallback=0.5)
+        self.face_gallery_dir = config.get("ROBOTIC_SHOP_ASSISTANT", "FACE_GALLERY_DIR", fallback="")
+        self.face_gallery_n_probe = config.getint("ROBOTIC_SHOP_ASSISTANT", "FACE_GALLERY_N_PROBE", fallback=8)
+        self.quality_governor = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "QUALITY_GOVERNOR", fallback=False)
+        self.target_fps = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "TARGET_FPS", fallback=15.0)
+        self.barcode_scan_interval = config.getint("ROBOTIC_SHOP_ASSISTANT", "BARCODE_SCAN_INTERVAL", fallback=1)
+        self.barcode_scan_scale = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "BARCODE_SCAN_SCALE", fallback=1.0)
+        self.metrics_port = config.getint("ROBOTIC_SHOP_ASSISTANT", "METRICS_PORT", fallback=0) or None
+        self.metrics_log_file = config.get("ROBOTIC_SHOP_ASSISTANT", "METRICS_LOG_FILE", fallback="") or None
+        self.metrics_log_interval = config.getfloat("ROBOTIC_SHOP_ASSISTANT", "METRICS_LOG_INTERVAL", fallback=10.0)
+        self.show_metrics = config.getboolean("ROBOTIC_SHOP_ASSISTANT", "SHOW_METRICS", fallback=False)
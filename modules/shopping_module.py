@@ -11,6 +11,8 @@ class ShoppingModule:
         A list to hold the products added to the shopping cart.
     products_total_cost : Decimal
         The total cost of the products in the cart.
+    version : int
+        The number of the changes of the cart, allowing the GUI to reuse its rendered shopping list.
 
     Methods:
     --------
@@ -26,6 +28,7 @@ class ShoppingModule:
     def __init__(self):
         self.cart = []
         self.products_total_cost = Decimal(0)
+        self.version = 0
 
     def add_products_to_cart(self, detected_products):
         """
@@ -34,6 +37,7 @@ class ShoppingModule:
         for decoded_barcode, product in detected_products:
             self.cart.append(product)
             self.products_total_cost += Decimal(product['price'])
+        self.version += 1
 
     def clear_cart(self):
         """
@@ -41,6 +45,7 @@ class ShoppingModule:
         """
         self.cart.clear()
         self.products_total_cost = Decimal(0)
+        self.version += 1
 
     def finalize_transaction(self):
         """
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class StartupModule:
+    """
+    A class to load the independent components of the application concurrently, each on its own thread,
+    and to record the startup metrics.
+
+    Every task can depend on other tasks, and it is started once they are finished. The components which are
+    not loaded yet can be checked for with is_ready, so the application can run without them in the meantime.
+
+    Attributes:
+    -----------
+    start_time : float
+        The time the startup began at, the metrics are relative to it.
+
+    Methods:
+    --------
+    submit(self, name, function, *args, depends_on=(), **kwargs)
+        Starts loading a component on a new thread.
+
+    is_ready(self, name)
+        Returns if a component has been loaded successfully.
+
+    get(self, name, timeout=None)
+        Waits for a component and returns it, None if its loading failed.
+
+    mark(self, event)
+        Records the time of the first occurrence of an event.
+
+    get_metrics(self)
+        Returns the recorded times [s] of the loaded components and events.
+    """
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.__tasks = {}
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def submit(self, name, function, *args, depends_on=(), **kwargs):
+        """
+        Starts loading a component on a new thread, after the components it depends on are loaded.
+        """
+        future = Future()
+        dependencies = [self.__tasks[dependency] for dependency in depends_on]
+        self.__tasks[name] = future
+
+        def load():
+            for dependency in dependencies:
+                dependency.exception()
+
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as e:
+                print(f"Error loading {name}: {e}")
+                future.set_exception(e)
+            finally:
+                self.mark(f"{name}_ready")
+
+        threading.Thread(target=load, daemon=True).start()
+        return future
+
+    def is_ready(self, name):
+        """
+        Returns if a component has been loaded successfully.
+        """
+        future = self.__tasks.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def get(self, name, timeout=None):
+        """
+        Waits for a component and returns it, None if its loading failed.
+        """
+        future = self.__tasks[name]
+        if future.exception(timeout) is not None:
+            return None
+
+        return future.result()
+
+    def mark(self, event):
+        """
+        Records the time of the first occurrence of an event, relative to the start of the startup.
+        """
+        with self.__lock:
+            self.__metrics.setdefault(event, time.perf_counter() - self.start_time)
+
+    def get_metrics(self):
+        """
+        Returns the recorded times [s] of the loaded components and events.
+        """
+        with self.__lock:
+            return dict(self.__metrics)
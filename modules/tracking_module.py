@@ -0,0 +1,206 @@
+import cv2
+
+
+class TrackingModule:
+    """
+    A class to follow the detected faces between the full detections using cheap template matching,
+    so every face keeps its identity without being encoded and compared on every frame.
+
+    Attributes:
+    -----------
+    detection_interval : int
+        The number of frames after which the full detection is requested again.
+    iou_threshold : float
+        The minimal overlap of a detection and a track to consider them the same face.
+    min_similarity : float
+        The minimal template matching score, below which the track is considered lost.
+    search_margin : float
+        The size of the search window around the last position, relative to the face size.
+    tracking_scale : float
+        The scale of the frame used for the template matching.
+    tracks : list
+        A list of tracked faces, each holding its location, label, match distance and template.
+
+    Methods:
+    --------
+    needs_detection(self)
+        Checks if the full detection should be run on the current frame.
+
+    associate_detections(self, image, locations)
+        Matches the detected locations with the existing tracks and returns the unmatched ones.
+
+    add_track(self, image, location, label, distance=None)
+        Starts tracking a new face.
+
+    track(self, image)
+        Follows all the tracked faces on a new frame.
+
+    get_faces(self, return_distances=False)
+        Returns the tracked faces as (face_location, label) tuples.
+
+    reset(self)
+        Drops all the tracks.
+    """
+    def __init__(self, detection_interval=10, iou_threshold=0.3, min_similarity=0.6, search_margin=0.5,
+                 tracking_scale=0.5):
+        self.detection_interval = detection_interval
+        self.iou_threshold = iou_threshold
+        self.min_similarity = min_similarity
+        self.search_margin = search_margin
+        self.tracking_scale = tracking_scale
+
+        self.tracks = []
+        self.__frames_since_detection = detection_interval
+        self.__track_lost = False
+
+    def needs_detection(self):
+        """
+        Checks if the full detection should be run, either periodically or because a track was lost.
+        """
+        return self.__track_lost or self.__frames_since_detection >= self.detection_interval
+
+    def associate_detections(self, image, locations):
+        """
+        Matches the detected locations with the existing tracks, refreshing the matched ones and dropping the rest.
+        Returns the locations that do not belong to any track, which have to be identified.
+        """
+        gray = self.__prepare_frame(image)
+        candidates = sorted(((self.__iou(track['location'], location), track_index, location_index)
+                             for track_index, track in enumerate(self.tracks)
+                             for location_index, location in enumerate(locations)), reverse=True)
+
+        matched_tracks = set()
+        matched_locations = set()
+        kept_tracks = []
+        for iou, track_index, location_index in candidates:
+            if iou < self.iou_threshold:
+                break
+            if track_index in matched_tracks or location_index in matched_locations:
+                continue
+
+            track = self.tracks[track_index]
+            track['location'] = locations[location_index]
+            track['template'] = self.__crop(gray, locations[location_index])
+            kept_tracks.append(track)
+            matched_tracks.add(track_index)
+            matched_locations.add(location_index)
+
+        self.tracks = kept_tracks
+        self.__frames_since_detection = 0
+        self.__track_lost = False
+
+        return [location for index, location in enumerate(locations) if index not in matched_locations]
+
+    def add_track(self, image, location, label, distance=None):
+        """
+        Starts tracking a newly identified face.
+        """
+        gray = self.__prepare_frame(image)
+        self.tracks.append({'location': location, 'label': label, 'distance': distance,
+                            'template': self.__crop(gray, location)})
+
+    def track(self, image):
+        """
+        Follows all the tracked faces on a new frame by matching their templates around the last known positions.
+        """
+        self.__frames_since_detection += 1
+        if not self.tracks:
+            return
+
+        gray = self.__prepare_frame(image)
+        frame_height, frame_width = gray.shape[:2]
+        kept_tracks = []
+
+        for track in self.tracks:
+            template = track['template']
+            template_height, template_width = template.shape[:2]
+            if template_height == 0 or template_width == 0:
+                self.__track_lost = True
+                continue
+
+            top, right, bottom, left = self.__scale_location(track['location'], self.tracking_scale)
+            margin_y = int(template_height * self.search_margin)
+            margin_x = int(template_width * self.search_margin)
+            window_top = max(0, top - margin_y)
+            window_left = max(0, left - margin_x)
+            window_bottom = min(frame_height, bottom + margin_y)
+            window_right = min(frame_width, right + margin_x)
+
+            window = gray[window_top:window_bottom, window_left:window_right]
+            if window.shape[0] < template_height or window.shape[1] < template_width:
+                self.__track_lost = True
+                continue
+
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, max_score, _, max_location = cv2.minMaxLoc(scores)
+            if max_score < self.min_similarity:
+                self.__track_lost = True
+                continue
+
+            new_top = window_top + max_location[1]
+            new_left = window_left + max_location[0]
+            track['location'] = self.__scale_location(
+                (new_top, new_left + template_width, new_top + template_height, new_left), 1 / self.tracking_scale)
+            kept_tracks.append(track)
+
+        self.tracks = kept_tracks
+
+    def get_faces(self, return_distances=False):
+        """
+        Returns the tracked faces in the format produced by the face detection.
+        """
+        if return_distances:
+            return [(track['location'], track['label'], track['distance']) for track in self.tracks]
+
+        return [(track['location'], track['label']) for track in self.tracks]
+
+    def reset(self):
+        """
+        Drops all the tracks, so the next frame runs the full detection.
+        """
+        self.tracks = []
+        self.__frames_since_detection = self.detection_interval
+        self.__track_lost = False
+
+    def __prepare_frame(self, image):
+        """
+        Internal method converting the frame to the downscaled grayscale image used for tracking.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        if self.tracking_scale != 1:
+            gray = cv2.resize(gray, None, fx=self.tracking_scale, fy=self.tracking_scale,
+                              interpolation=cv2.INTER_AREA)
+
+        return gray
+
+    def __crop(self, gray, location):
+        """
+        Internal method cutting the face template out of the prepared frame.
+        """
+        top, right, bottom, left = self.__scale_location(location, self.tracking_scale)
+        top, left = max(0, top), max(0, left)
+        return gray[top:bottom, left:right].copy()
+
+    @staticmethod
+    def __scale_location(location, factor):
+        """
+        Scales the (top, right, bottom, left) face location by a given factor.
+        """
+        return tuple(int(round(coordinate * factor)) for coordinate in location)
+
+    @staticmethod
+    def __iou(first, second):
+        """
+        Computes the intersection over union of two (top, right, bottom, left) face locations.
+        """
+        top = max(first[0], second[0])
+        right = min(first[1], second[1])
+        bottom = min(first[2], second[2])
+        left = max(first[3], second[3])
+        intersection = max(0, right - left) * max(0, bottom - top)
+        if intersection == 0:
+            return 0.0
+
+        first_area = (first[1] - first[3]) * (first[2] - first[0])
+        second_area = (second[1] - second[3]) * (second[2] - second[0])
+        return intersection / float(first_area + second_area - intersection)
@@ -0,0 +1,85 @@
+import torch
+import whisper
+
+
+class TranscriptionModule:
+    """
+    A class to transcribe the captured utterances with a Whisper model.
+
+    Besides the general transcription, there is a command mode for the short voice commands: the language is
+    fixed, the text is decoded greedily in a single pass without the temperature fallback, the initial prompt
+    lists the command phrases to bias the vocabulary, and the decoded text is limited to a few tokens.
+    The clip is still padded to the 30 s window, as the Whisper encoder only accepts the full window, but it is
+    encoded once, while the general transcription can run it several times for the language detection
+    and the fallback temperatures.
+
+    Attributes:
+    -----------
+    model : whisper.Whisper
+        The Whisper model.
+    language : str
+        The language of the commands.
+    command_mode : bool
+        A flag to determine if the command mode should be used by transcribe.
+    command_prompt : str
+        The initial prompt of the command mode, None to not use any.
+    max_command_tokens : int
+        The maximum number of the tokens decoded in the command mode.
+
+    Methods:
+    --------
+    transcribe(self, audio)
+        Transcribes the audio in the configured mode.
+
+    transcribe_command(self, audio)
+        Transcribes a short command with a single greedy decoding pass.
+
+    transcribe_general(self, audio)
+        Transcribes the audio with Whisper's general transcription.
+
+    build_command_prompt(command_phrases)
+        Builds the initial prompt from the example phrases of the commands.
+    """
+    def __init__(self, model, language="en", command_mode=False, command_prompt=None, max_command_tokens=32):
+        self.model = model
+        self.language = language
+        self.command_mode = command_mode
+        self.command_prompt = command_prompt
+        self.max_command_tokens = max_command_tokens
+        self.__fp16 = torch.cuda.is_available()
+
+    def transcribe(self, audio):
+        """
+        Transcribes the float32 16 kHz audio in the configured mode.
+        """
+        if self.command_mode:
+            return self.transcribe_command(audio)
+
+        return self.transcribe_general(audio)
+
+    def transcribe_command(self, audio):
+        """
+        Transcribes a short command, at most 30 s long, with a single greedy decoding pass.
+        """
+        audio = whisper.pad_or_trim(audio)
+        mel = whisper.log_mel_spectrogram(audio, n_mels=self.model.dims.n_mels).to(self.model.device)
+        options = whisper.DecodingOptions(language=self.language if self.model.is_multilingual else None,
+                                          temperature=0.0,
+                                          sample_len=self.max_command_tokens,
+                                          prompt=self.command_prompt,
+                                          without_timestamps=True,
+                                          fp16=self.__fp16)
+        return whisper.decode(self.model, mel, options).text
+
+    def transcribe_general(self, audio):
+        """
+        Transcribes the audio with Whisper's general transcription, as it was done before the command mode.
+        """
+        return self.model.transcribe(audio, fp16=self.__fp16)["text"]
+
+    @staticmethod
+    def build_command_prompt(command_phrases):
+        """
+        Builds the initial prompt from the {command: [phrases]} example phrases of the commands.
+        """
+        return " ".join(f"{phrase.rstrip('.?!')}." for phrases in command_phrases.values() for phrase in phrases)
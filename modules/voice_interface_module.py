@@ -1,22 +1,51 @@
+import numpy as np
 import pyaudio
 import queue
+import re
 import threading
+import time
 import torch
-import wave
 import whisper
 from TTS.api import TTS
+from modules.audio_output_module import AudioOutputModule
+from modules.listening_module import ListeningModule
+from modules.metrics_module import MetricsModule
+from modules.phrase_cache_module import PhraseCacheModule
+from modules.transcription_module import TranscriptionModule
 
 
 class VoiceInterfaceModule:
-    def __init__(self, tts_model_name, stt_model_name):
+    def __init__(self, tts_model_name, stt_model_name, phrase_cache_size=64, phrase_cache_dir=None,
+                 continuous_listening=False, silence_duration=0.5, stt_command_mode=False, stt_command_prompt=None,
+                 metrics=None):
         device = "cuda" if torch.cuda.is_available() else "cpu"
 
         self.stt_queue = queue.Queue()
-        self.tts_cache_file_name = "tts_cache.wav"
-        self.stt_cache_file_name = "stt_cache.wav"
+        self.last_stt_latency = None
+        # The synthesis and transcription latencies are measured, in the application's metrics if given
+        self.metrics = metrics if metrics is not None else MetricsModule()
+        self.tts_model_name = tts_model_name
         self.tts = TTS(tts_model_name).to(device)
+        self.phrase_cache = PhraseCacheModule(phrase_cache_size, phrase_cache_dir)
+        # The model is shared by the announcements and the background pre-synthesis
+        self.tts_lock = threading.Lock()
         self.stt = whisper.load_model(stt_model_name)
+        self.transcription = TranscriptionModule(self.stt, command_mode=stt_command_mode,
+                                                 command_prompt=stt_command_prompt)
         self.audio = pyaudio.PyAudio()
+        self.audio_output = AudioOutputModule(self.audio)
+        self.audio_output.start()
+        # The sentences are synthesized one by one on a worker, the first one plays while the next are synthesized
+        self.synthesis_queue = queue.Queue()
+        self.synthesis_thread = threading.Thread(target=self.__synthesize_queued_sentences, daemon=True)
+        self.synthesis_thread.start()
+        # The microphone stays open, the utterances are cut out by the voice activity detector and transcribed
+        # straight from memory. The robot's own speech is not listened to.
+        self.listening = ListeningModule(self.audio, silence_duration=silence_duration,
+                                         continuous=continuous_listening, is_muted=self.audio_output.is_busy)
+        self.transcription_thread = threading.Thread(target=self.__transcribe_utterances, daemon=True)
+        self.transcription_thread.start()
+        self.listening.start()
 
     def __del__(self):
         try:
@@ -25,64 +54,86 @@ class VoiceInterfaceModule:
             pass
 
     def say_and_execute(self, sentence, function, *args, **kwargs):
-        self.say(sentence)
+        # A new command cuts off the announcement of the previous one
+        self.say(sentence, interrupt=True)
         function(*args, **kwargs)
 
-    def say(self, sentence):
-        self.tts.tts_to_file(text=sentence, file_path=self.tts_cache_file_name)
-        say_thread = threading.Thread(target=self.__play_cached_audio)
-        say_thread.start()
+    def say(self, sentence, interrupt=False):
+        generation = self.interrupt() if interrupt else self.audio_output.generation
+        for sentence_part in re.split(r"(?<=[.!?])\s+", sentence.strip()):
+            if sentence_part:
+                self.synthesis_queue.put((generation, sentence_part))
+
+    def interrupt(self):
+        # Drops the queued sentences and stops the one being played, returns the new playback generation
+        return self.audio_output.flush()
+
+    def close(self):
+        # Waits until everything queued is said, then releases the output stream
+        self.listening.stop()
+        self.synthesis_queue.join()
+        self.audio_output.wait_until_idle()
+        self.audio_output.stop()
+
+    def synthesize(self, sentence, persist=False):
+        # Returns the 16-bit mono PCM of the sentence, synthesized only if it was not said recently
+        # Only the fixed announcements are persisted, the other sentences are cached in memory only
+        cached_audio = self.phrase_cache.get(self.tts_model_name, sentence)
+        if cached_audio is not None:
+            self.metrics.increment("tts_cache_hits")
+            return cached_audio
+
+        with self.tts_lock:
+            # The phrase could have been pre-synthesized while waiting for the model
+            cached_audio = self.phrase_cache.get(self.tts_model_name, sentence)
+            if cached_audio is not None:
+                return cached_audio
+
+            with self.metrics.timer("tts"):
+                wav = np.asarray(self.tts.tts(text=sentence), dtype=np.float32)
+            sample_rate = self.tts.synthesizer.output_sample_rate
+
+        pcm = (np.clip(wav, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        self.phrase_cache.put(self.tts_model_name, sentence, pcm, sample_rate, persist=persist)
+        return pcm, sample_rate
+
+    def presynthesize(self, sentences):
+        # Synthesizes the fixed announcements in the background, so they can be played without waiting
+        presynthesis_thread = threading.Thread(
+            target=lambda: [self.synthesize(sentence, persist=True) for sentence in sentences], daemon=True)
+        presynthesis_thread.start()
+        return presynthesis_thread
 
     def hear(self):
-        hear_thread = threading.Thread(target=self.__capture_voice_and_process, args=(self.stt_queue,))
-        hear_thread.start()
-
-    def __play_cached_audio(self):
-        wf = wave.open(self.tts_cache_file_name, 'rb')
-        stream = self.audio.open(format=self.audio.get_format_from_width(wf.getsampwidth()),
-                                 channels=wf.getnchannels(),
-                                 rate=wf.getframerate(),
-                                 output=True)
-        chunk_size = 1024
-        data = wf.readframes(chunk_size)
-        while data:
-            stream.write(data)
-            data = wf.readframes(chunk_size)
-        stream.stop_stream()
-        stream.close()
-        wf.close()
-
-    def __capture_voice_and_process(self, return_queue):
-        audio_format = pyaudio.paInt16
-        channels = 1
-        rate = 16000
-        chunk = 1024
-        record_seconds = 2
-
-        stream = self.audio.open(format=audio_format,
-                                 channels=channels,
-                                 rate=rate,
-                                 input=True,
-                                 frames_per_buffer=chunk)
-        print("Recording...")
-        frames = []
-
-        for _ in range(0, int(rate / chunk * record_seconds)):
-            data = stream.read(chunk)
-            frames.append(data)
-
-        print("Finished recording.")
-
-        # Stop recording
-        stream.stop_stream()
-        stream.close()
-
-        wave_file = wave.open(self.stt_cache_file_name, 'wb')
-        wave_file.setnchannels(channels)
-        wave_file.setsampwidth(self.audio.get_sample_size(audio_format))
-        wave_file.setframerate(rate)
-        wave_file.writeframes(b''.join(frames))
-        wave_file.close()
-
-        result = self.stt.transcribe(self.stt_cache_file_name)
-        return_queue.put(result["text"])
+        # When not listening continuously, only the utterance following the request is transcribed
+        print("Listening...")
+        self.listening.arm()
+
+    def __synthesize_queued_sentences(self):
+        while True:
+            generation, sentence = self.synthesis_queue.get()
+            try:
+                if generation == self.audio_output.generation:
+                    pcm, sample_rate = self.synthesize(sentence)
+                    self.audio_output.play(pcm, sample_rate, generation)
+            except Exception as e:
+                print(f"Speech synthesis error: {e}")
+            finally:
+                self.synthesis_queue.task_done()
+
+    def __transcribe_utterances(self):
+        while True:
+            utterance, speech_end_time = self.listening.utterance_queue.get()
+            try:
+                with self.metrics.timer("transcribe"):
+                    text = self.transcription.transcribe(utterance)
+            except Exception as e:
+                self.metrics.increment("stt_errors")
+                print(f"Speech recognition error: {e}")
+                continue
+
+            # Measured from the end of the speech, including the silence needed to detect it
+            self.last_stt_latency = time.monotonic() - speech_end_time
+            self.metrics.observe("speech_to_text", self.last_stt_latency)
+            print(f"Speech-to-text latency: {self.last_stt_latency:.3f} s")
+            self.stt_queue.put(text)
@@ -1,13 +1,39 @@
 import unittest
 import configparser
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from unittest import mock
+from decimal import Decimal
 import cv2
+import numpy as np
 import torch
 import face_recognition
+from pyzbar.pyzbar import Point, Rect
+from modules.audio_output_module import AudioOutputModule
+from modules.barcode_module import BarcodeModule
+from modules.catalog_module import CatalogModule
+from modules.command_worker_module import CommandWorkerModule
+from modules.database_backend_module import OdbcBackend, SqliteBackend
 from modules.database_module import DatabaseModule
+from modules.face_detector_module import YuNetFaceDetector, create_face_detector
+from modules.frame_source_module import FrameGrabber, FrameSource, open_frame_source
+from modules.gallery_module import GalleryModule
+from modules.governor_module import GovernorModule
+from modules.intent_module import IntentModule
+from modules.listening_module import ListeningModule
 from modules.llm_module import LlmModule
+from modules.metrics_module import MetricsModule
+from modules.phrase_cache_module import PhraseCacheModule
 from modules.recognition_module import RecognitionModule
 from modules.gui_module import GUIModule
+from modules.startup_module import StartupModule
 
 
 class TestProductRecognition(unittest.TestCase):
@@ -24,9 +50,9 @@ class TestProductRecognition(unittest.TestCase):
         cls.llm_path = config.get("ROBOTIC_SHOP_ASSISTANT", "LOCAL_LLM_PATH")
         cls.layers_on_gpu = int(config.get("ROBOTIC_SHOP_ASSISTANT", "N_GPU_LAYERS"))
 
-        cls.database_module = DatabaseModule("localhost", "robotic_shop_assistant",
-                                             config.get('ROBOTIC_SHOP_ASSISTANT', 'DB_USERNAME'),
-                                             config.get('ROBOTIC_SHOP_ASSISTANT', 'DB_PASSWORD'))
+        cls.database_module = DatabaseModule(OdbcBackend("localhost", "robotic_shop_assistant",
+                                                         config.get('ROBOTIC_SHOP_ASSISTANT', 'DB_USERNAME'),
+                                                         config.get('ROBOTIC_SHOP_ASSISTANT', 'DB_PASSWORD')))
 
         cls.recognition_module = RecognitionModule(tolerance=0.575)
         cls.recognition_module.set_product_data_source(cls.database_module)
@@ -57,7 +83,7 @@ class TestProductRecognition(unittest.TestCase):
         Test the barcode detection using the images in a given test directory.
         """
         test_dir = "barcode_images"
-        self.database_module.refresh_data()
+        self.database_module.refresh_data(wait=True)
 
         print(f"Evaluating against {test_dir}...")
         for filename in os.listdir(test_dir):
@@ -85,5 +111,668 @@ class TestProductRecognition(unittest.TestCase):
         self.assertLessEqual(int(usage['total_tokens']), 60)
 
 
+Decoded = namedtuple("Decoded", ["data", "type", "rect", "polygon"])
+
+
+class TestBarcodeScanning(unittest.TestCase):
+    @staticmethod
+    def fake_decode(scanned_shapes):
+        """
+        Returns a stand-in of pyzbar's decode finding a single barcode, at (100, 40) of the full frame
+        and (50, 20) of the frame downscaled by half, recording the shapes of the scanned images.
+        """
+        def decode(gray):
+            scanned_shapes.append(gray.shape)
+            if gray.shape == (100, 200):
+                rect = Rect(50, 20, 25, 10)
+            else:
+                # The region around the barcode starts at (67, 22), with the margin of half its size and 8 pixels
+                rect = Rect(33, 18, 50, 20)
+            return [Decoded(b"5901234123457", "EAN13", rect, [Point(rect.left, rect.top)])]
+
+        return decode
+
+    def test_region_rescans(self):
+        """
+        Test the previous regions are scanned between the periodic full scans of the downscaled frame,
+        and the locations are mapped back to the full resolution frame.
+        """
+        scanned_shapes = []
+        image = np.zeros((200, 400), dtype=np.uint8)
+        with mock.patch("modules.barcode_module.decode", self.fake_decode(scanned_shapes)):
+            barcode_module = BarcodeModule(full_scan_interval=3, scan_scale=0.5)
+            results = [barcode_module.decode(image) for _ in range(4)]
+
+        self.assertEqual(scanned_shapes, [(100, 200), (56, 116), (56, 116), (100, 200)])
+        for frame_results in results:
+            self.assertEqual(frame_results[0].rect, Rect(100, 40, 50, 20))
+            self.assertEqual(frame_results[0].polygon, [Point(100, 40)])
+
+    def test_product_cache_invalidation(self):
+        """
+        Test the resolved products are reused until the catalog version changes.
+        """
+        class ProductDataSource:
+            def __init__(self):
+                self.version = 1
+                self.lookups = []
+
+            def lookup_barcode(self, barcode_data):
+                self.lookups.append(barcode_data)
+                return {'name': 'Milk', 'price': Decimal('3.50'), 'version': self.version}
+
+        product_data_source = ProductDataSource()
+        recognition_module = RecognitionModule(model="hog", barcode_scan_interval=1)
+        recognition_module.set_product_data_source(product_data_source)
+        image = np.zeros((200, 400, 3), dtype=np.uint8)
+        with mock.patch("modules.barcode_module.decode", self.fake_decode([])):
+            recognition_module.detect_products(image)
+            recognition_module.detect_products(image)
+            self.assertEqual(len(product_data_source.lookups), 1)
+
+            product_data_source.version = 2
+            _, product = recognition_module.detect_products(image)[0]
+
+        self.assertEqual(len(product_data_source.lookups), 2)
+        self.assertEqual(product['version'], 2)
+
+
+class TestFaceIdentification(unittest.TestCase):
+    def test_closest_known_face(self):
+        """
+        Test the closest known face is chosen when several are within the tolerance, not the first one.
+        """
+        recognition_module = RecognitionModule(model="hog", tolerance=0.5)
+        direction = np.zeros(128, dtype=np.float32)
+        direction[0] = 1.0
+        recognition_module.set_known_faces([np.zeros(128), 0.3 * direction], ["Alice", "Bob"])
+
+        (name, distance), (far_name, far_distance) = recognition_module.identify_encodings(
+            [0.2 * direction, 2.0 * direction])
+        self.assertEqual(name, "Bob")
+        self.assertAlmostEqual(distance, 0.1, places=5)
+        self.assertEqual(far_name, "Customer")
+        self.assertAlmostEqual(far_distance, 1.7, places=5)
+
+    def test_incremental_face_cache(self):
+        """
+        Test only the new or changed images are encoded again, and the removed ones are dropped from the cache.
+        """
+        encoded_paths = []
+
+        def load_image_file(image_path):
+            encoded_paths.append(os.path.relpath(image_path, faces_dir))
+            with open(image_path, "rb") as f:
+                return f.read()
+
+        def face_encodings(image):
+            return [] if image == b"no face" else [np.full(128, len(image), dtype=np.float32)]
+
+        def write_image(relative_path, content):
+            os.makedirs(os.path.dirname(os.path.join(faces_dir, relative_path)), exist_ok=True)
+            with open(os.path.join(faces_dir, relative_path), "wb") as f:
+                f.write(content)
+
+        with tempfile.TemporaryDirectory() as faces_dir, \
+                mock.patch("modules.recognition_module.ProcessPoolExecutor", ThreadPoolExecutor), \
+                mock.patch("modules.recognition_module.face_recognition.load_image_file", load_image_file), \
+                mock.patch("modules.recognition_module.face_recognition.face_encodings", face_encodings):
+            write_image(os.path.join("Alice", "1.jpg"), b"alice")
+            write_image(os.path.join("Bob", "1.jpg"), b"bob")
+            write_image(os.path.join("Bob", "2.jpg"), b"no face")
+            RecognitionModule(model="hog").load_known_faces(faces_dir)
+            self.assertEqual(len(encoded_paths), 3)
+
+            encoded_paths.clear()
+            write_image(os.path.join("Alice", "1.jpg"), b"alice, changed")
+            bob_image_stat = os.stat(os.path.join(faces_dir, "Bob", "1.jpg"))
+            os.utime(os.path.join(faces_dir, "Bob", "1.jpg"),
+                     ns=(bob_image_stat.st_atime_ns, bob_image_stat.st_mtime_ns + 10 ** 9))
+            os.remove(os.path.join(faces_dir, "Bob", "2.jpg"))
+            write_image(os.path.join("Carol", "1.jpg"), b"carol")
+            recognition_module = RecognitionModule(model="hog")
+            recognition_module.load_known_faces(faces_dir)
+
+            self.assertEqual(sorted(encoded_paths), [os.path.join("Alice", "1.jpg"), os.path.join("Bob", "1.jpg"),
+                                                     os.path.join("Carol", "1.jpg")])
+            self.assertEqual(recognition_module.known_names, ["Alice", "Bob", "Carol"])
+            self.assertEqual(recognition_module.known_faces_encodings[0, 0], len(b"alice, changed"))
+
+            encoded_paths.clear()
+            RecognitionModule(model="hog").load_known_faces(faces_dir)
+            self.assertEqual(encoded_paths, [])
+            with np.load(os.path.join(faces_dir, "face_encodings_cache.npz"), allow_pickle=False) as cache_data:
+                self.assertNotIn(os.path.join("Bob", "2.jpg"), list(cache_data["paths"]))
+                self.assertEqual(len(cache_data["paths"]), 3)
+
+
+class TestIntentMapping(unittest.TestCase):
+    def test_nearest_phrase(self):
+        """
+        Test mapping the utterances to the commands by the similarity to their example phrases.
+        """
+        command_phrases = {
+            "clear_cart": ["Clear the cart", "Empty my cart"],
+            "toggle_shopping_list": ["Show the shopping list", "Hide the shopping list"],
+        }
+        fallback_inputs = []
+        intent = IntentModule(command_phrases, threshold=0.4, fallback_threshold=0.6,
+                              fallback=lambda stt_output: fallback_inputs.append(stt_output) or "clear_cart")
+
+        self.assertEqual(intent.obtain_command_from_stt(" Empty the cart."), "clear_cart")
+        self.assertEqual(intent.obtain_command_from_stt(" Hide the shopping list, please."), "toggle_shopping_list")
+        self.assertEqual(intent.obtain_command_from_stt(" What's the weather like?"), "NO_MATCH")
+        self.assertEqual(fallback_inputs, [])
+
+        intent.fallback_threshold = 1.01
+        self.assertEqual(intent.obtain_command_from_stt(" Hide the shopping list"), "clear_cart")
+        self.assertEqual(fallback_inputs, [" Hide the shopping list"])
+
+
+class FakeLlama:
+    """
+    A stand-in of llama_cpp.Llama 0.2.28 with byte tokens, recording the evaluated tokens.
+    Like in the library, the input ids and the scores are buffers of the whole context size.
+    """
+    def __init__(self, n_ctx=1024, **kwargs):
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.scores = np.zeros((n_ctx, 256), dtype=np.single)
+        self.n_tokens = 0
+        self.evaluated = []
+
+    def tokenize(self, text, add_bos=True):
+        return ([1] if add_bos else []) + list(text)
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.evaluated.append(list(tokens))
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+
+    def save_state(self):
+        return mock.Mock(input_ids=self.input_ids.copy(), n_tokens=self.n_tokens)
+
+    def load_state(self, state):
+        self.input_ids = state.input_ids.copy()
+        self.n_tokens = state.n_tokens
+
+
+class TestCommandScoring(unittest.TestCase):
+    def test_prefix_reuse(self):
+        """
+        Test that only the input part of the prompt is evaluated, the restored prompt prefix is not evaluated again.
+        """
+        with mock.patch("modules.llm_module.Llama", FakeLlama):
+            llm_module = LlmModule("model.gguf", {"clear_cart": None, "quit_application": None}, constrained=True)
+
+        prefix_tokens = llm_module.llm.evaluated[-1]
+        for stt_output in (" Clear the cart.", " Turn it off."):
+            llm_module.llm.evaluated.clear()
+            command, confidence = llm_module.score_commands(stt_output)
+
+            self.assertIn(command, ("clear_cart", "quit_application", "NO_MATCH"))
+            self.assertEqual(llm_module.llm.evaluated[0], list(f"Input: {stt_output}\nOutput:".encode('utf-8')))
+            self.assertEqual(llm_module.last_timings['cached_tokens'], len(prefix_tokens))
+
+
+class TestCommandWorker(unittest.TestCase):
+    def test_cancellation_and_cache(self):
+        """
+        Test that the superseded transcriptions are not executed and the repeated ones are not mapped again.
+        """
+        mapped_inputs = []
+        mapping_started = threading.Event()
+        release_mapping = threading.Event()
+
+        def mapper(stt_output):
+            mapped_inputs.append(stt_output)
+            if stt_output == "slow":
+                mapping_started.set()
+                release_mapping.wait(5)
+            return stt_output.upper()
+
+        command_worker = CommandWorkerModule(mapper, timeout=5)
+        command_worker.start()
+        command_worker.submit("slow")
+        mapping_started.wait(5)
+        command_worker.submit(" Clear the cart.")
+        self.assertTrue(command_worker.should_cancel())
+        release_mapping.set()
+        self.assertEqual(command_worker.result_queue.get(timeout=5), (" Clear the cart.", " CLEAR THE CART."))
+
+        command_worker.submit("clear the cart")
+        self.assertEqual(command_worker.result_queue.get(timeout=5), ("clear the cart", " CLEAR THE CART."))
+
+        # Unmatched phrases are mapped again, e.g. by the LLM attached in the meantime
+        command_worker.mapper = lambda stt_output: mapped_inputs.append(stt_output) or "NO_MATCH"
+        for _ in range(2):
+            command_worker.submit("Checkout please")
+            self.assertEqual(command_worker.result_queue.get(timeout=5), ("Checkout please", "NO_MATCH"))
+        command_worker.stop()
+
+        self.assertEqual(mapped_inputs, ["slow", " Clear the cart.", "Checkout please", "Checkout please"])
+        self.assertTrue(command_worker.result_queue.empty())
+
+
+class TestPhraseCache(unittest.TestCase):
+    def test_eviction_and_persistence(self):
+        """
+        Test the least recently used phrases are evicted from memory, but are still loaded from the disk.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            phrase_cache = PhraseCacheModule(capacity=2, cache_dir=cache_dir)
+            phrase_cache.put("model", "Turning on...", b"\x01\x00" * 100, 22050)
+            phrase_cache.put("model", "Clearing the cart...", b"\x02\x00" * 100, 22050)
+            phrase_cache.put("model", "12.50 [PLN]", b"\x03\x00" * 100, 22050, persist=False)
+            self.assertIsNone(phrase_cache.get("other_model", "Turning on..."))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            memory_only_cache = PhraseCacheModule(capacity=2)
+            memory_only_cache.put("model", "Turning on...", b"\x01\x00", 22050)
+            memory_only_cache.put("model", "Clearing the cart...", b"\x02\x00", 22050)
+            memory_only_cache.put("model", "Refreshing data...", b"\x03\x00", 22050)
+            self.assertIsNone(memory_only_cache.get("model", "Turning on..."))
+
+            restarted_cache = PhraseCacheModule(capacity=2, cache_dir=cache_dir)
+            self.assertEqual(restarted_cache.get("model", "Turning on..."), (b"\x01\x00" * 100, 22050))
+
+
+class TestAudioOutput(unittest.TestCase):
+    def test_queued_playback_and_flush(self):
+        """
+        Test the queued audio is played on a single stream and a flush drops the stale audio.
+        """
+        class RecordingStream:
+            def __init__(self):
+                self.written = []
+                self.writing = threading.Event()
+                self.release_write = threading.Event()
+
+            def write(self, data):
+                self.writing.set()
+                self.release_write.wait(5)
+                self.written.append(data)
+
+            def stop_stream(self):
+                pass
+
+            def close(self):
+                pass
+
+        class RecordingAudio:
+            def __init__(self):
+                self.streams = []
+
+            def open(self, **kwargs):
+                self.streams.append(RecordingStream())
+                return self.streams[-1]
+
+        audio = RecordingAudio()
+        audio_output = AudioOutputModule(audio, chunk_size=4)
+        audio_output.start()
+        audio_output.play(b"\x01" * 80, 22050)
+        while not audio.streams:
+            time.sleep(0.01)
+        audio.streams[0].writing.wait(5)
+
+        # The first buffer is being played, the next one becomes stale by the flush
+        audio_output.play(b"\x02" * 8, 22050)
+        stale_generation = audio_output.generation
+        audio_output.flush()
+        audio_output.play(b"\x03" * 8, 22050, stale_generation)
+        audio_output.play(b"\x04" * 8, 22050)
+        audio.streams[0].release_write.set()
+        audio_output.wait_until_idle()
+        audio_output.stop()
+
+        self.assertEqual(len(audio.streams), 1)
+        self.assertEqual(audio.streams[0].written, [b"\x01" * 8, b"\x04" * 8])
+
+
+class TestVoiceActivity(unittest.TestCase):
+    def test_utterance_segmentation(self):
+        """
+        Test cutting an utterance, with its pre-roll, out of a noisy recording.
+        """
+        rate, chunk_size = 16000, 512
+        rng = np.random.default_rng(0)
+        recording = rng.normal(0.0, 0.002, size=rate * 3).astype(np.float32)
+        speech_start, speech_end = rate, rate * 2
+        recording[speech_start:speech_end] += 0.2 * np.sin(np.arange(rate) * 2 * np.pi * 220 / rate)
+
+        listening = ListeningModule(audio=None, rate=rate, chunk_size=chunk_size, pre_roll=0.3, silence_duration=0.5)
+        utterances = []
+        for start in range(0, len(recording), chunk_size):
+            result = listening.process_chunk(recording[start:start + chunk_size], (start + chunk_size) / rate)
+            if result is not None:
+                utterances.append(result)
+
+        self.assertEqual(len(utterances), 1)
+        utterance, speech_end_time = utterances[0]
+        self.assertAlmostEqual(speech_end_time, speech_end / rate, delta=chunk_size / rate)
+        # The utterance starts with the pre-roll and ends with the silence which ended it
+        self.assertGreater(len(utterance), speech_end - speech_start + 0.7 * rate)
+        self.assertLess(np.abs(utterance[:chunk_size]).max(), 0.05)
+
+
+class TestStartup(unittest.TestCase):
+    def test_concurrent_loading(self):
+        """
+        Test the components are loaded concurrently and a failed one does not block its dependents.
+        """
+        startup = StartupModule()
+        startup.submit("slow_model", time.sleep, 0.2)
+        startup.submit("other_slow_model", time.sleep, 0.2)
+        startup.submit("broken_model", lambda: 1 / 0)
+        startup.submit("voice", lambda: "ready", depends_on=["slow_model", "other_slow_model", "broken_model"])
+
+        self.assertFalse(startup.is_ready("voice"))
+        self.assertEqual(startup.get("voice", timeout=5), "ready")
+        self.assertIsNone(startup.get("broken_model"))
+        self.assertLess(startup.get_metrics()["voice_ready"], 0.4)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_rolling_statistics_and_export(self):
+        """
+        Test the rolling percentiles keep only the latest observations, and the metrics are served and logged.
+        """
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_file = os.path.join(log_dir, "metrics.jsonl")
+            metrics = MetricsModule(window=10, port=0, log_file=log_file, log_interval=60)
+            for _ in range(10):
+                metrics.observe("detect_faces", 1.0)
+            for _ in range(10):
+                metrics.observe("detect_faces", 0.002)
+            metrics.timed("render_gui", lambda: None)()
+            metrics.increment("voice_commands")
+
+            stages, counters = metrics.get_summary()
+            self.assertEqual(stages["detect_faces"]["count"], 20)
+            self.assertAlmostEqual(stages["detect_faces"]["p99_ms"], 2.0)
+            self.assertEqual(counters, {"voice_commands": 1})
+
+            metrics.start()
+            with urllib.request.urlopen(f"http://127.0.0.1:{metrics.port}/metrics", timeout=5) as response:
+                exposition = response.read().decode()
+
+            # A taken port disables only the endpoint, the metrics are still logged
+            busy_port_log_file = os.path.join(log_dir, "busy_port_metrics.jsonl")
+            busy_port_metrics = MetricsModule(port=metrics.port, log_file=busy_port_log_file, log_interval=60)
+            busy_port_metrics.start()
+            busy_port_metrics.observe("detect_faces", 0.002)
+            busy_port_metrics.stop()
+            self.assertTrue(os.path.exists(busy_port_log_file))
+            metrics.stop()
+
+            self.assertIn('shop_assistant_stage_latency_seconds_bucket{stage="detect_faces",le="0.0025"} 10',
+                          exposition)
+            self.assertIn('shop_assistant_stage_latency_seconds_count{stage="detect_faces"} 20', exposition)
+            self.assertIn('shop_assistant_events_total{event="voice_commands"} 1', exposition)
+            with open(log_file, encoding="utf-8") as f:
+                self.assertEqual(json.loads(f.readline())["stages"]["render_gui"]["count"], 1)
+
+
+class TestFrameGrabber(unittest.TestCase):
+    def test_latest_frame_and_replay(self):
+        """
+        Test a live source is read as its newest frame, while a recording is replayed frame by frame.
+        """
+        class CountingCamera(FrameSource):
+            def __init__(self):
+                self.frame_id = 0
+
+            def read(self, out=None):
+                time.sleep(0.001)
+                self.frame_id += 1
+                if out is None:
+                    out = np.empty((4, 4), np.int64)
+                out[:] = self.frame_id
+                return out
+
+        camera = CountingCamera()
+        grabber = FrameGrabber(camera)
+        grabber.start()
+        self.assertIsNotNone(grabber.read(timeout=1.0))
+        time.sleep(0.1)
+        frame = grabber.read(timeout=1.0)
+        grabber.stop()
+        self.assertGreaterEqual(frame[0, 0], camera.frame_id - 2)
+        self.assertGreater(grabber.frames_dropped, 0)
+
+        with tempfile.TemporaryDirectory() as image_dir:
+            for index in range(5):
+                cv2.imwrite(os.path.join(image_dir, f"{index:03d}.png"), np.full((8, 8, 3), index, np.uint8))
+
+            grabber = FrameGrabber(open_frame_source(image_dir))
+            grabber.start()
+            time.sleep(0.1)
+            frames = []
+            while (frame := grabber.read(timeout=1.0)) is not None:
+                frames.append(int(frame[0, 0, 0]))
+            grabber.stop()
+            self.assertEqual(frames, [0, 1, 2, 3, 4])
+            self.assertEqual(grabber.frames_dropped, 0)
+
+
+class TestMultiCamera(unittest.TestCase):
+    def test_batched_streams(self):
+        """
+        Test the frames of several cameras are detected together and the results are routed back per stream,
+        each stream keeping its own tracker and barcode decoder.
+        """
+        recognition_module = RecognitionModule(model="hog", tracking=True)
+        frames = [(0, np.zeros((120, 160, 3), np.uint8)), (2, np.zeros((90, 160, 3), np.uint8))]
+
+        self.assertEqual(recognition_module.detect_faces_batch(frames), {0: [], 2: []})
+        self.assertEqual(recognition_module.detect_products_batch(frames), {0: [], 2: []})
+        self.assertEqual(sorted(recognition_module.face_trackers), [0, 2])
+        self.assertEqual(sorted(recognition_module.barcode_scanners), [0, 2])
+        self.assertEqual(recognition_module.detect_faces(frames[0][1]), [])
+
+
+class TestFaceDetectors(unittest.TestCase):
+    def test_yunet_locations(self):
+        """
+        Test the YuNet boxes are converted into the clipped (top, right, bottom, left) locations, and a missing model
+        file is reported.
+        """
+        faces = np.array([[-5, 10, 50, 40] + [0] * 10 + [0.9],
+                          [30, 20, 10, 10] + [0] * 10 + [0.8]], dtype=np.float32)
+        self.assertEqual(YuNetFaceDetector.to_locations(faces, (48, 64, 3)), [(10, 45, 47, 0), (20, 40, 30, 30)])
+        self.assertEqual(YuNetFaceDetector.to_locations(None, (48, 64, 3)), [])
+        with self.assertRaises(FileNotFoundError):
+            create_face_detector("yunet", "missing_model.onnx")
+
+        # Without its model, the backend is replaced at the start, so the governor is set up for the HOG model
+        recognition_module = RecognitionModule(model="yunet", yunet_model_path="missing_model.onnx")
+        self.assertEqual(recognition_module.model, "hog")
+
+
+class TestQualityGovernor(unittest.TestCase):
+    def test_hysteresis(self):
+        """
+        Test the quality is lowered quickly over the budget, and raised only after a full window well under it
+        and the cooldown.
+        """
+        applied = []
+        governor = GovernorModule(lambda **operating_point: applied.append(operating_point), frame_budget=0.1,
+                                  start_level=2, window=10, min_samples=3, upgrade_ratio=0.5, cooldown=5.0)
+        self.assertEqual(applied[-1]["model"], "hog")
+
+        # Under the budget, but not enough to raise the quality, the operating point is kept
+        for now in range(20):
+            governor.observe(0.07, now=now)
+        self.assertEqual(governor.level, 2)
+
+        for now in range(20, 22):
+            governor.observe(0.3, now=now)
+        self.assertEqual(governor.level, 3)
+        self.assertIn("over", governor.reason)
+
+        # The quality is raised after a full window, but not before the cooldown
+        for call in range(20):
+            governor.observe(0.01, now=21 + call / 10)
+        self.assertEqual(governor.level, 3)
+        governor.observe(0.01, now=30)
+        self.assertEqual(governor.level, 2)
+        self.assertEqual(governor.get_state()["operating_point"], applied[-1])
+        self.assertEqual(len(governor.changes), 3)
+
+        # The configured operating point is kept at the start, and the HOG model never moves to the CNN one
+        ladder, start_level = GovernorModule.ladder_for({'model': 'hog', 'detection_scale': 0.75, 'upsample': 1,
+                                                         'detection_interval': 10})
+        self.assertEqual((start_level, ladder[0]['detection_scale']), (0, 0.75))
+        self.assertEqual({point['model'] for point in ladder}, {'hog'})
+        ladder, start_level = GovernorModule.ladder_for({'model': 'cnn', 'detection_scale': 0.5, 'upsample': 1,
+                                                         'detection_interval': 10})
+        self.assertEqual((start_level, len(ladder)), (1, len(GovernorModule.DEFAULT_LADDER)))
+
+
+class TestFaceGallery(unittest.TestCase):
+    def test_enrollment_and_search(self):
+        """
+        Test adding and removing identities at runtime, with both the exact and the index search.
+        """
+        rng = np.random.default_rng(0)
+        encodings = rng.normal(0.0, 0.1, size=(600, 128)).astype(np.float32)
+
+        with tempfile.TemporaryDirectory() as gallery_dir:
+            gallery = GalleryModule(gallery_dir, shard_size=256, exact_search_limit=100)
+            gallery.add_batch([f"person_{index}" for index in range(len(encodings))], encodings)
+            self.assertEqual(len(gallery), 600)
+
+            for exact in (True, False):
+                name, distance = gallery.search(encodings[42:43], exact=exact)[0]
+                self.assertEqual(name, "person_42")
+                self.assertLess(distance, 1e-2)
+
+            gallery.remove("person_42")
+            self.assertNotEqual(gallery.search(encodings[42:43])[0][0], "person_42")
+
+            # The freed slot is reused, and found through the index only under its new identity
+            gallery.add("person_600", encodings[42])
+            self.assertEqual(gallery.search(encodings[42:43], exact=False)[0][0], "person_600")
+            gallery.remove("person_600")
+            # Only the names of the changed shard are stored again, not the whole gallery
+            with open(os.path.join(gallery_dir, "manifest.json")) as f:
+                self.assertNotIn("names", json.load(f))
+
+            reopened_gallery = GalleryModule(gallery_dir, shard_size=256, exact_search_limit=100)
+            self.assertEqual(len(reopened_gallery), 599)
+            self.assertEqual(reopened_gallery.search(encodings[7:8])[0][0], "person_7")
+
+
+class TestDatabaseRefresh(unittest.TestCase):
+    def test_incremental_refresh(self):
+        """
+        Test the background refresh against a SQLite stand-in of the shop database.
+        """
+        with tempfile.TemporaryDirectory() as database_dir:
+            database_path = os.path.join(database_dir, "robotic_shop_assistant.db")
+            with sqlite3.connect(database_path) as conn:
+                conn.executescript(
+                    "CREATE TABLE products ([ID] INTEGER PRIMARY KEY, [Name] TEXT, [Price] TEXT, [UpdatedAt] INTEGER);"
+                    "CREATE TABLE barcodes ([Barcode] TEXT PRIMARY KEY, [ProductID] INTEGER, [UpdatedAt] INTEGER);"
+                    "INSERT INTO products VALUES (1, 'Milk', '3.50', 1), (2, 'Bread', '4.20', 1);"
+                    "INSERT INTO barcodes VALUES ('5901234123457', 1, 1), ('5901234123458', 2, 1);")
+
+            snapshot_file = os.path.join(database_dir, "catalog_snapshot.npz")
+            database_module = DatabaseModule(SqliteBackend(database_path), change_column="UpdatedAt",
+                                             snapshot_file=snapshot_file)
+            database_module.refresh_data(wait=True)
+            first_catalog = database_module.catalog
+            self.assertEqual(database_module.products[database_module.barcodes['5901234123458']]['name'], 'Bread')
+
+            with sqlite3.connect(database_path) as conn:
+                conn.executescript(
+                    "UPDATE products SET [Price] = '3.99', [UpdatedAt] = 2 WHERE [ID] = 1;"
+                    "DELETE FROM products WHERE [ID] = 2;"
+                    "DELETE FROM barcodes WHERE [ProductID] = 2;")
+
+            database_module.refresh_data(wait=True)
+
+            # A row which cannot be converted keeps the current catalog, and is loaded again once it is fixed
+            version = database_module.version
+            with sqlite3.connect(database_path) as conn:
+                conn.execute("INSERT INTO products VALUES (3, 'Butter', NULL, 3)")
+            database_module.refresh_data(wait=True)
+            self.assertEqual(database_module.version, version)
+            with sqlite3.connect(database_path) as conn:
+                conn.execute("UPDATE products SET [Price] = '7.49' WHERE [ID] = 3")
+            database_module.refresh_data(wait=True)
+            database_module.close()
+
+            self.assertEqual(database_module.products[3]['price'], Decimal('7.49'))
+            self.assertEqual(database_module.products[1]['price'], Decimal('3.99'))
+            self.assertNotIn(2, database_module.products)
+            self.assertNotIn('5901234123458', database_module.barcodes)
+            self.assertEqual(database_module.version, first_catalog.version + 2)
+            # The previously published catalog is never modified by a refresh
+            self.assertIn(2, first_catalog.products)
+
+            # The next start is served from the snapshot, before the database is reached
+            unreachable_backend = SqliteBackend(os.path.join(database_dir, "missing", "db.sqlite"))
+            warm_database_module = DatabaseModule(unreachable_backend, change_column="UpdatedAt",
+                                                  snapshot_file=snapshot_file)
+            self.assertEqual(str(warm_database_module.products[1]['price']), '3.99')
+            self.assertEqual(warm_database_module.barcodes['5901234123457'], 1)
+
+
+class TestProductCatalog(unittest.TestCase):
+    def test_compact_catalog(self):
+        """
+        Test the array-backed catalog against the dictionaries it replaces.
+        """
+        products = {1: {'name': 'Milk', 'price': '3.50'}, 2: {'name': 'Bread', 'price': Decimal('4.20')}}
+        barcodes = {'5901234123457': 1, '00012345': 2, 'SHELF-A1': 1}
+        catalog = CatalogModule.from_dicts(products, barcodes, version=1)
+
+        self.assertEqual(catalog.lookup_barcode('00012345'), {'name': 'Bread', 'price': Decimal('4.20')})
+        self.assertIsNone(catalog.lookup_barcode('12345'))
+        self.assertEqual(catalog.lookup_barcode('SHELF-A1')['name'], 'Milk')
+        self.assertEqual(dict(catalog.barcodes), barcodes)
+
+        updated_catalog = catalog.updated({3: {'name': 'Milk', 'price': '2.99'}}, [1], {}, ['5901234123457'], 2)
+        self.assertIsNone(updated_catalog.lookup_barcode('SHELF-A1'))
+        self.assertNotIn('5901234123457', updated_catalog.barcodes)
+        self.assertEqual(sorted(updated_catalog.products), [2, 3])
+        self.assertIn(1, catalog.products)
+
+        with tempfile.TemporaryDirectory() as catalog_dir:
+            catalog_file = os.path.join(catalog_dir, "catalog.npz")
+            updated_catalog.save(catalog_file)
+            loaded_catalog, archive = CatalogModule.load(catalog_file, version=2)
+            archive.close()
+
+        self.assertEqual(dict(loaded_catalog.products), dict(updated_catalog.products))
+        self.assertEqual(dict(loaded_catalog.barcodes), dict(updated_catalog.barcodes))
+
+        # The renames leave unused names, which are dropped once there are too many of them
+        with mock.patch.object(CatalogModule, "UNUSED_NAMES_LIMIT", 4):
+            renamed_catalog = updated_catalog
+            for index in range(20):
+                renamed_catalog = renamed_catalog.updated({2: {'name': f"Bread {index}", 'price': '4.20'}}, [], {}, [],
+                                                          renamed_catalog.version + 1)
+            self.assertEqual(renamed_catalog.products[2]['name'], "Bread 19")
+            self.assertEqual(renamed_catalog.products[3]['name'], "Milk")
+            self.assertEqual(updated_catalog.products[2]['name'], "Bread")
+            self.assertLessEqual(renamed_catalog.name_count(), 2 * 2 + 4 + 1)
+
+        # Only the names of the remaining products are stored
+        renamed_catalog = updated_catalog.updated({2: {'name': "Rye bread", 'price': '4.20'}}, [], {}, [], 3)
+        self.assertGreater(renamed_catalog.name_count(), 2)
+        with tempfile.TemporaryDirectory() as catalog_dir:
+            catalog_file = os.path.join(catalog_dir, "catalog.npz")
+            renamed_catalog.save(catalog_file)
+            loaded_catalog, archive = CatalogModule.load(catalog_file, version=3)
+            archive.close()
+
+        self.assertEqual(loaded_catalog.name_count(), 2)
+        self.assertEqual(dict(loaded_catalog.products), dict(renamed_catalog.products))
+
+
 if __name__ == '__main__':
     unittest.main()